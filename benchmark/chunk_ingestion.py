@@ -0,0 +1,97 @@
+import asyncio
+import time
+from uuid import UUID
+
+import numpy as np
+import typer
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from server.config import secrets
+from server.database import (
+    add_file_meta,
+    get_user_by_email,
+    save_file_chunks,
+    session_manager,
+)
+from server.database.models import DBChunk
+from server.models import FileMeta
+
+app = typer.Typer()
+
+
+async def legacy_save(
+    session: AsyncSession,
+    user_id: UUID,
+    meta: FileMeta,
+    chunks: list[str],
+    vectors: list[list[float]],
+) -> None:
+    """Chunk saving as it was done before COPY ingestion."""
+    session.add_all(
+        [
+            DBChunk(
+                user_id=user_id,
+                filename=meta.filename,
+                file_id=meta.file_id,
+                chunk_text=chunk,
+                embedding=vector,
+            )
+            for chunk, vector in zip(chunks, vectors, strict=True)
+        ]
+    )
+    await session.flush()
+
+
+async def measure(save, chunks: list[str], vectors: list[list[float]]) -> float:
+    async with session_manager.session() as session:
+        user = await get_user_by_email(
+            session, email=secrets.default_admin_email.get_secret_value()
+        )
+        db_meta = await add_file_meta(session, user.id, "benchmark.pdf")
+        meta = FileMeta(
+            file_id=db_meta.file_id,
+            filename=db_meta.filename,
+            is_indexed=db_meta.is_indexed,
+        )
+        await session.flush()
+
+        start = time.perf_counter()
+        await save(session, user.id, meta, chunks, vectors)
+        elapsed = time.perf_counter() - start
+
+        # Nothing is left in the database after the benchmark
+        await session.rollback()
+    return elapsed
+
+
+async def run(url: str, chunks_count: int, dim: int, seed: int) -> None:
+    rng = np.random.default_rng(seed)
+    chunks = [f"Chunk number {i}. " * 20 for i in range(chunks_count)]
+    vectors = rng.normal(size=(chunks_count, dim)).tolist()
+
+    await session_manager.init_db(url)
+    try:
+        legacy_time = await measure(legacy_save, chunks, vectors)
+        copy_time = await measure(save_file_chunks, chunks, vectors)
+    finally:
+        await session_manager.close()
+
+    print(f"Chunks: {chunks_count} x {dim}")
+    print(f"ORM add_all: {chunks_count / legacy_time:10.0f} rows/s")
+    print(f"Binary COPY: {chunks_count / copy_time:10.0f} rows/s")
+    print(f"Speedup:     {legacy_time / copy_time:10.1f}x")
+
+
+@app.command()
+def ingestion(
+    url: str = typer.Argument(..., help="postgresql+asyncpg:// database URL"),
+    chunks: int = typer.Option(10_000, help="Number of chunks"),
+    dim: int = typer.Option(1024, help="Embedding dimension"),
+    seed: int = typer.Option(0),
+):
+    """Compares ORM and binary COPY chunk ingestion speed."""
+    asyncio.run(run(url, chunks, dim, seed))
+
+
+if __name__ == "__main__":
+    app()
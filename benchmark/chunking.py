@@ -0,0 +1,68 @@
+import time
+
+import numpy as np
+import typer
+from sklearn.metrics.pairwise import cosine_similarity
+
+from server.rag.core.indexing import find_boundaries
+
+app = typer.Typer()
+
+
+def legacy_boundaries(embeddings: np.ndarray, similarity_threshold: float) -> list[int]:
+    """Boundary detection as it was done before vectorization."""
+    boundaries = [0]
+    current_embedding = embeddings[0].reshape(1, -1)
+
+    for i in range(1, len(embeddings)):
+        similarity = cosine_similarity(current_embedding, embeddings[i].reshape(1, -1))[
+            0
+        ][0]
+
+        if similarity >= similarity_threshold:
+            current_embedding = np.mean(
+                [embeddings[i].reshape(1, -1), current_embedding], axis=0
+            )
+        else:
+            boundaries.append(i)
+            current_embedding = embeddings[i].reshape(1, -1)
+
+    return boundaries
+
+
+def make_embeddings(sentences: int, dim: int, seed: int) -> np.ndarray:
+    """Synthetic sentence embeddings drifting around a few topic vectors."""
+    rng = np.random.default_rng(seed)
+    topics = rng.normal(size=(max(sentences // 20, 1), dim))
+    topic_ids = np.sort(rng.integers(0, len(topics), size=sentences))
+    return topics[topic_ids] + 0.4 * rng.normal(size=(sentences, dim))
+
+
+@app.command()
+def chunking(
+    sentences: int = typer.Option(20_000, help="Number of sentences"),
+    dim: int = typer.Option(1024, help="Embedding dimension"),
+    threshold: float = typer.Option(0.8, help="Similarity threshold"),
+    seed: int = typer.Option(0),
+):
+    """Compares legacy and vectorized boundary detection speed."""
+    embeddings = make_embeddings(sentences, dim, seed)
+
+    start = time.perf_counter()
+    expected = legacy_boundaries(embeddings, threshold)
+    legacy_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    actual = find_boundaries(embeddings, threshold)
+    vectorized_time = time.perf_counter() - start
+
+    assert actual == expected, "Chunk boundaries differ"
+
+    print(f"Chunks: {len(actual)}")
+    print(f"Legacy:     {sentences / legacy_time:12.0f} sentences/s")
+    print(f"Vectorized: {sentences / vectorized_time:12.0f} sentences/s")
+    print(f"Speedup:    {legacy_time / vectorized_time:12.1f}x")
+
+
+if __name__ == "__main__":
+    app()
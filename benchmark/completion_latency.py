@@ -0,0 +1,93 @@
+import asyncio
+import time
+
+import httpx
+import numpy as np
+import typer
+
+from server.config import secrets
+
+app = typer.Typer()
+
+
+async def login(client: httpx.AsyncClient) -> None:
+    response = await client.post(
+        "/api/login_user",
+        json={
+            "email": secrets.default_admin_email.get_secret_value(),
+            "password": secrets.default_admin_password.get_secret_value(),
+        },
+    )
+    response.raise_for_status()
+
+
+async def first_token(
+    client: httpx.AsyncClient, file_id: str, query: str, prepared: bool
+) -> float:
+    """Time from requesting a completion to its first token."""
+    request = {
+        "file_id": file_id,
+        "messages": [{"role": "user", "content": query}],
+        "action": "default",
+    }
+    start = time.perf_counter()
+    if prepared:
+        # Two requests: /prepare_stream, then the stream itself
+        response = await client.post("/api/prepare_stream", json=request)
+        response.raise_for_status()
+        stream = client.stream(
+            "GET", "/api/v1/chat/completions", params={"stream_id": response.json()}
+        )
+    else:
+        stream = client.stream("POST", "/api/v1/chat/completions", json=request)
+
+    async with stream as response:
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            if line == "event: chunk":
+                return time.perf_counter() - start
+    raise RuntimeError("Stream ended without tokens")
+
+
+async def run(
+    url: str, file_id: str, streams: int, rounds: int, prepared: bool
+) -> None:
+    async with httpx.AsyncClient(base_url=url, timeout=None) as client:
+        await login(client)
+        # Warm up the embedding model and the chunk cache
+        await first_token(client, file_id, "warm up", prepared)
+
+        timings = []
+        for i in range(rounds):
+            timings.extend(
+                await asyncio.gather(
+                    *(
+                        first_token(client, file_id, f"Question {i}-{j}", prepared)
+                        for j in range(streams)
+                    )
+                )
+            )
+
+    timings = np.array(timings) * 1000
+    print(f"Concurrent streams: {streams}, rounds: {rounds}, prepared: {prepared}")
+    print(f"TTFT p50: {np.percentile(timings, 50):10.1f} ms")
+    print(f"TTFT p95: {np.percentile(timings, 95):10.1f} ms")
+    print(f"TTFT max: {timings.max():10.1f} ms")
+
+
+@app.command()
+def ttfb(
+    file_id: str = typer.Argument(..., help="Indexed file of the default admin"),
+    url: str = typer.Option("http://localhost:8000", help="Running server"),
+    streams: int = typer.Option(50, help="Number of concurrent streams"),
+    rounds: int = typer.Option(3),
+    prepared: bool = typer.Option(
+        False, help="Use /prepare_stream and GET instead of a single POST"
+    ),
+):
+    """Measures time-to-first-token of chat completions under concurrent streams."""
+    asyncio.run(run(url, file_id, streams, rounds, prepared))
+
+
+if __name__ == "__main__":
+    app()
@@ -0,0 +1,46 @@
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import typer
+
+from server.rag.pdf import count_pages, iter_pdf_pages
+
+app = typer.Typer()
+
+
+@app.command()
+def extraction(
+    file_path: Path = typer.Argument(..., help="PDF file to extract"),
+    workers: int = typer.Option(multiprocessing.cpu_count(), help="Worker processes"),
+    pages_per_range: int = typer.Option(16, help="Pages extracted by one task"),
+):
+    """Compares sequential and page-parallel PDF text extraction."""
+    print(f"Pages: {count_pages(file_path)}")
+
+    start = time.perf_counter()
+    sequential = list(iter_pdf_pages(file_path, pages_per_range=pages_per_range))
+    sequential_time = time.perf_counter() - start
+
+    with ProcessPoolExecutor(
+        max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+    ) as executor:
+        # Warm up worker processes, they are long-lived in the server
+        list(executor.map(count_pages, [file_path] * workers))
+
+        start = time.perf_counter()
+        parallel = list(
+            iter_pdf_pages(file_path, executor, pages_per_range=pages_per_range)
+        )
+        parallel_time = time.perf_counter() - start
+
+    assert parallel == sequential, "Extracted texts differ"
+
+    print(f"Sequential:           {sequential_time:8.2f}s")
+    print(f"Parallel ({workers:2d} workers): {parallel_time:8.2f}s")
+    print(f"Speedup:              {sequential_time / parallel_time:8.1f}x")
+
+
+if __name__ == "__main__":
+    app()
@@ -0,0 +1,129 @@
+import asyncio
+import time
+from datetime import UTC, datetime
+from uuid import uuid4
+
+import numpy as np
+import sqlalchemy as db
+import typer
+
+from server.config import DistanceMetric, VectorIndexType, config, secrets
+from server.database import add_file_meta, get_user_by_email, session_manager
+from server.database.bulk import copy_chunks
+from server.database.models import DBChunk, embedding_distance
+from server.database.vector_index import (
+    expected_index,
+    rebuild_index,
+    set_search_params,
+)
+
+app = typer.Typer()
+
+
+async def populate(chunks: int, dim: int, rng: np.random.Generator):
+    """Adds a file with random chunks and rebuilds the vector index over them."""
+    async with session_manager.session() as session:
+        user = await get_user_by_email(
+            session, email=secrets.default_admin_email.get_secret_value()
+        )
+        db_meta = await add_file_meta(session, user.id, "benchmark.pdf")
+        await session.flush()
+
+        created_at = datetime.now(UTC).replace(tzinfo=None)
+        for start in range(0, chunks, 10_000):
+            count = min(10_000, chunks - start)
+            vectors = rng.normal(size=(count, dim)).astype(np.float32)
+            await copy_chunks(
+                session,
+                (
+                    (
+                        uuid4(),
+                        user.id,
+                        "benchmark.pdf",
+                        db_meta.file_id,
+                        "",
+                        created_at,
+                        v,
+                    )
+                    for v in vectors
+                ),
+            )
+        await session.commit()
+        return user.id, db_meta.file_id
+
+
+async def measure(
+    user_id, file_id, queries: np.ndarray, use_index: bool
+) -> tuple[float, list[set]]:
+    """Returns mean latency and found chunks of every query."""
+    found = []
+    async with session_manager.session() as session:
+        await set_search_params(session)
+        if not use_index:
+            await session.execute(db.text("SET LOCAL enable_indexscan = off"))
+
+        start = time.perf_counter()
+        for query in queries:
+            result = await session.execute(
+                db.select(DBChunk.id)
+                .filter(DBChunk.user_id == user_id, DBChunk.file_id == file_id)
+                .order_by(embedding_distance(query.tolist()))
+                .limit(5)
+            )
+            found.append(set(result.scalars().all()))
+        return (time.perf_counter() - start) / len(queries), found
+
+
+async def run(url: str, chunks: int, dim: int, queries: int, seed: int) -> None:
+    rng = np.random.default_rng(seed)
+
+    await session_manager.init_db(url)
+    try:
+        user_id, file_id = await populate(chunks, dim, rng)
+        start = time.perf_counter()
+        # Index of the config, ivfflat lists are trained on the data present
+        await rebuild_index(session_manager.engine, concurrently=False)
+        build_time = time.perf_counter() - start
+
+        query_vectors = rng.normal(size=(queries, dim))
+        seq_time, exact = await measure(
+            user_id, file_id, query_vectors, use_index=False
+        )
+        index_time, found = await measure(
+            user_id, file_id, query_vectors, use_index=True
+        )
+    finally:
+        await session_manager.close()
+
+    recall = np.mean([len(a & b) / len(a) for a, b in zip(exact, found, strict=True)])
+
+    print(f"Chunks: {chunks} x {dim}, metric: {config.embeddings_distance.value}")
+    print(f"Index: {expected_index()}, built in {build_time:.1f}s")
+    print(f"Sequential scan: {seq_time * 1000:10.2f} ms/query")
+    print(f"Vector index:    {index_time * 1000:10.2f} ms/query")
+    print(f"Speedup:         {seq_time / index_time:10.1f}x")
+    print(f"Recall@5:        {recall:10.2f}")
+
+
+@app.command()
+def search(
+    url: str = typer.Argument(..., help="postgresql+asyncpg:// database URL"),
+    chunks: int = typer.Option(100_000, help="Number of chunks"),
+    dim: int = typer.Option(1024, help="Embedding dimension"),
+    queries: int = typer.Option(20, help="Number of timed queries"),
+    metric: DistanceMetric = typer.Option(DistanceMetric.cosine),
+    index_type: VectorIndexType = typer.Option(VectorIndexType.hnsw),
+    ef_search: int = typer.Option(40, help="hnsw.ef_search"),
+    probes: int = typer.Option(10, help="ivfflat.probes"),
+    seed: int = typer.Option(0),
+):
+    """Compares retrieval latency and recall with and without the vector index."""
+    config.embeddings_distance = metric
+    config.vector_index_type = index_type
+    config.hnsw_ef_search = ef_search
+    config.ivfflat_probes = probes
+    asyncio.run(run(url, chunks, dim, queries, seed))
+
+
+if __name__ == "__main__":
+    app()
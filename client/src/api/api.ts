@@ -1,4 +1,4 @@
-import type { FileMeta, Message } from '../types'
+import type { FileMeta, IndexingProgress, Message } from '../types'
 import apiClient from '../utils/axios'
 
 const buildApiUrl = (path: string): string => {
@@ -55,7 +55,9 @@ export const uploadFile = async (files: File[]) => {
 	return response.data
 }
 
-export const getFileStatus = async (fileId: string) => {
+export const getFileStatus = async (
+	fileId: string
+): Promise<IndexingProgress> => {
 	const response = await apiClient.get(`/api/files/${fileId}/status`)
 	return response.data
 }
@@ -85,19 +87,62 @@ export const getURL = async (fileId: string): Promise<string> => {
 	return buildApiUrl(`/api${relativeURL}`)
 }
 
-export const getStreamID = async (query: Message): Promise<string> => {
-	const response = await apiClient.post('/api/prepare_stream', {
-		messages: [
-			{
-				role: 'user',
-				content: query.content,
-			},
-		],
-		file_id: query.file_meta.file_id,
-		action: query.action,
-		snippet: query.snippet,
-	})
-	return response.data
+const completionRequest = (query: Message) => ({
+	messages: [
+		{
+			role: 'user',
+			content: query.content,
+		},
+	],
+	file_id: query.file_meta.file_id,
+	action: query.action,
+	snippet: query.snippet,
+})
+
+type ServerSentEvent = { event: string; data: string }
+
+// Reads a text/event-stream body until the end or until onEvent returns true
+const readServerSentEvents = async (
+	body: ReadableStream<Uint8Array>,
+	onEvent: (event: ServerSentEvent) => boolean | void
+) => {
+	const reader = body.getReader()
+	const decoder = new TextDecoder()
+	let buffer = ''
+
+	try {
+		while (true) {
+			const { value, done } = await reader.read()
+			if (done) {
+				return
+			}
+			buffer += decoder
+				.decode(value, { stream: true })
+				.replace(/\r\n?/g, '\n')
+
+			let end
+			while ((end = buffer.indexOf('\n\n')) !== -1) {
+				const block = buffer.slice(0, end)
+				buffer = buffer.slice(end + 2)
+
+				let event = 'message'
+				const data: string[] = []
+				block.split('\n').forEach(line => {
+					if (line.startsWith('event:')) {
+						event = line.slice(6).trim()
+					} else if (line.startsWith('data:')) {
+						data.push(line.slice(5).replace(/^ /, ''))
+					}
+				})
+				if (data.length && onEvent({ event, data: data.join('\n') })) {
+					return
+				}
+			}
+		}
+	} finally {
+		// Also closes the response when onEvent throws
+		reader.cancel().catch(() => {})
+	}
 }
 
 export const createStreamChatCompletions = async (
@@ -107,38 +152,44 @@ export const createStreamChatCompletions = async (
 	onDone?: () => void,
 	onError?: (e: any) => void
 ) => {
-	const stream_id = await getStreamID(query)
-	const url = buildApiUrl(`/api/v1/chat/completions?stream_id=${stream_id}`)
-
-	const eventSource = new EventSource(url, {
-		withCredentials: true,
-	})
-
-	eventSource.addEventListener('chunk', event => {
-		try {
-			const parsedData = JSON.parse(event.data)
-			const content = parsedData?.choices?.[0]?.delta?.content
-			if (content) {
-				onData(content)
-			}
-		} catch (error) {
-			console.error('Error parsing event data:', error)
+	try {
+		// One request, the completion is streamed in the response
+		const response = await fetch(buildApiUrl('/api/v1/chat/completions'), {
+			method: 'POST',
+			credentials: 'include',
+			headers: {
+				'Content-Type': 'application/json',
+				Accept: 'text/event-stream',
+			},
+			body: JSON.stringify(completionRequest(query)),
+		})
+		if (!response.ok || !response.body) {
+			const detail = await response.json().catch(() => null)
+			throw new Error(detail?.detail ?? response.statusText)
 		}
-	})
-
-	eventSource.addEventListener('done', event => {
-		eventSource.close()
-		onDone?.()
-	})
 
-	eventSource.addEventListener('context', event => {
-		const contextData = event.data ? JSON.parse(event.data) : []
-		onContext(contextData)
-	})
-
-	eventSource.onerror = error => {
+		await readServerSentEvents(response.body, ({ event, data }) => {
+			if (event === 'chunk') {
+				try {
+					const parsedData = JSON.parse(data)
+					const content = parsedData?.choices?.[0]?.delta?.content
+					if (content) {
+						onData(content)
+					}
+				} catch (error) {
+					console.error('Error parsing event data:', error)
+				}
+			} else if (event === 'context') {
+				onContext(data ? JSON.parse(data) : [])
+			} else if (event === 'error') {
+				throw new Error(data)
+			} else if (event === 'done') {
+				onDone?.()
+				return true
+			}
+		})
+	} catch (error) {
 		console.error('SSE Error', error)
-		eventSource.close()
 		onError?.(error)
 	}
 }
@@ -149,6 +200,6 @@ export const getHistory = async (fileId: string) => {
 }
 
 export const isIndexed = async (fileId: string): Promise<boolean> => {
-	const response = await apiClient.get(`/api/files/${fileId}/status`)
-	return response.data
+	const progress = await getFileStatus(fileId)
+	return progress.is_indexed
 }
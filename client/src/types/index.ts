@@ -6,6 +6,22 @@ export type FileMeta = {
     is_indexed: boolean
 }
 
+export type IndexingProgress = {
+	file_id: string
+	is_indexed: boolean
+	status: 'queued' | 'running' | 'failed' | 'done' | null
+	stage: string | null
+	attempts: number
+	pages_total: number | null
+	pages_processed: number
+	chunks_written: number
+	stage_timings: Record<string, number>
+	error: string | null
+	created_at: string | null
+	started_at: string | null
+	finished_at: string | null
+}
+
 export enum Action {
 	Default = 'default',
 	Translate = 'translate',
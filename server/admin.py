@@ -0,0 +1,68 @@
+# Maintenance commands: python -m server.admin --help
+import asyncio
+
+import sqlalchemy as db
+import typer
+from loguru import logger
+
+from server.config import secrets
+from server.database import session_manager
+from server.database.vector_index import (
+    EMBEDDING_INDEX,
+    describe_index,
+    expected_index,
+    rebuild_index,
+    reindex,
+)
+
+app = typer.Typer()
+
+
+async def show_index() -> None:
+    async with session_manager.engine.connect() as conn:
+        current = await describe_index(conn)
+        size = await conn.scalar(
+            db.text("SELECT pg_size_pretty(pg_relation_size(CAST(:name AS regclass)))"),
+            {"name": EMBEDDING_INDEX},
+        )
+    print(f"Current:  {current} ({size})")
+    print(f"Expected: {expected_index()}")
+
+
+def run(command) -> None:
+    async def main():
+        await session_manager.init_db(str(secrets.sqlalchemy_url))
+        try:
+            await command
+        finally:
+            await session_manager.close()
+
+    asyncio.run(main())
+
+
+@app.command()
+def status():
+    """Shows the vector index and the one required by the config."""
+    run(show_index())
+
+
+@app.command("reindex")
+def reindex_command(
+    concurrently: bool = typer.Option(True, help="Do not block writes"),
+):
+    """Rebuilds the vector index with its current parameters."""
+    logger.info(f"Reindexing {EMBEDDING_INDEX}")
+    run(reindex(session_manager.engine, concurrently))
+
+
+@app.command()
+def rebuild(
+    concurrently: bool = typer.Option(True, help="Do not block writes"),
+):
+    """Rebuilds the vector index with parameters from the config."""
+    logger.info(f"Rebuilding {EMBEDDING_INDEX} as {expected_index()}")
+    run(rebuild_index(session_manager.engine, concurrently))
+
+
+if __name__ == "__main__":
+    app()
@@ -1,27 +1,39 @@
+import asyncio
 import json
+from collections.abc import Awaitable
 from contextlib import aclosing
 from datetime import UTC, datetime, timedelta
+from typing import NamedTuple
 from uuid import UUID, uuid4
 
 from fastapi import APIRouter, Depends
 from fastapi.responses import StreamingResponse
-
-from server.database import add_message, find_file_chunks, is_indexed, session_manager
+from loguru import logger
+
+from server.config import config
+from server.database import (
+    add_message,
+    is_indexed,
+    retrieve_file_chunks,
+    session_manager,
+)
+from server.database.answer_cache import CachedAnswer, answer_cache
+from server.database.chunk_cache import RetrievedChunk
 from server.exceptions import NotIndexedError, StreamExpiredError, StreamNotFoundError
 from server.models import (
     Action,
     ChatCompletionRequest,
-    ChatCompletionResponseStreamChoice,
-    ChatCompletionStreamResponse,
+    StreamSession,
 )
 from server.rag import generate
 from server.security import get_user_id
+from server.utils.embeddings import embed_query
+from server.utils.sse import chunk_frame, coalesce, replay
+from server.utils.stream_sessions import get_stream_session_store
+from server.utils.timings import StageTimer, completion_stats
 
 router = APIRouter()
 
-# TODO Migrate to Redis
-stream_sessions: dict[str, dict] = {}
-
 
 def format_sse(data: str, event: str | None = None) -> str:
     msg = ""
@@ -33,41 +45,125 @@ def format_sse(data: str, event: str | None = None) -> str:
     return msg
 
 
+async def check_indexed(user_id: UUID, file_id: UUID) -> bool:
+    async with session_manager.session() as session:
+        return bool(await is_indexed(session=session, user_id=user_id, file_id=file_id))
+
+
+async def save_user_message(
+    request: ChatCompletionRequest, user_id: UUID, indexed: Awaitable[bool]
+) -> None:
+    """Saves the message, it is committed only if the file is indexed."""
+    async with session_manager.session() as session:
+        await add_message(
+            session=session,
+            user_id=user_id,
+            file_id=request.file_id,
+            content=request.messages[-1]["content"],
+            is_user=True,
+            action=request.action,
+            snippet=request.snippet,
+        )
+        if await indexed:
+            await session.commit()
+
+
+class Context(NamedTuple):
+    chunks: list[RetrievedChunk]
+    query_vector: list[float] | None = None
+    # Answer to a similar question about the file, if it is cached
+    answer: str | None = None
+
+
+async def retrieve_context(
+    query: str,
+    user_id: UUID,
+    file_id: UUID,
+    action: Action,
+    snippet: str | None,
+    timer: StageTimer,
+    indexed: Awaitable[bool],
+) -> Context:
+    """
+    Embeds the query right away, chunks are only read once the file is indexed.
+
+    Chunks of a file which is still being indexed are incomplete, they must not
+    get into the chunk cache or answers built on them into the answer cache.
+    """
+    if action is Action.translate:
+        return Context([])
+
+    query_vector = await timer.measure("embedding", embed_query(query))
+    if not await indexed:
+        return Context([], query_vector)
+
+    if config.enable_answer_cache:
+        cached = answer_cache.get((user_id, file_id), action, snippet, query_vector)
+        if cached is not None:
+            return Context(cached.chunks, query_vector, cached.answer)
+
+    async with session_manager.session() as session:
+        chunks = await timer.measure(
+            "retrieval",
+            retrieve_file_chunks(
+                session=session,
+                query=query,
+                user_id=user_id,
+                file_id=file_id,
+                query_vector=query_vector,
+            ),
+        )
+    return Context(chunks, query_vector)
+
+
 async def create_chat_completion(
-    query: str, user_id: UUID, file_id: UUID, action: Action, snippet: str | None
+    query: str,
+    user_id: UUID,
+    file_id: UUID,
+    action: Action,
+    snippet: str | None,
+    retrieval: Awaitable[Context],
+    user_message: Awaitable[None],
+    timer: StageTimer,
 ):
     full_message = ""
-
-    if action is not Action.translate:
-        async with session_manager.session() as session:
-            db_chunks = await find_file_chunks(
-                session=session, query=query, user_id=user_id, file_id=file_id
-            )
-            context = [chunk.chunk_text for chunk in db_chunks]
-    else:
-        context, db_chunks = [], []
+    context, chunks = [], []
 
     try:
         yield ": ping\n\n"  # Keep-alive comment line for SSE
 
-        async for _g in generate(
-            query=query, context=context, action=action, snippet=snippet
-        ):
+        retrieved, _ = await asyncio.gather(retrieval, user_message)
+        chunks = retrieved.chunks
+        context = [chunk.chunk_text for chunk in chunks]
+
+        if retrieved.answer is not None:
+            tokens = replay(retrieved.answer, config.sse_flush_size)
+        else:
+            tokens = coalesce(
+                generate(query=query, context=context, action=action, snippet=snippet),
+                max_wait=config.sse_flush_interval_ms / 1000,
+                max_size=config.sse_flush_size,
+                max_pending=config.sse_max_pending_tokens,
+            )
+        async for _g in tokens:
+            timer.mark("first_token")
             full_message += _g
 
-            chunk = ChatCompletionStreamResponse(
-                model="null",
-                choices=[
-                    ChatCompletionResponseStreamChoice(
-                        delta={"content": _g},
-                        finish_reason=None,
-                        index=0,
-                    )
-                ],
-            )
-            json_chunk = chunk.model_dump_json(exclude_unset=True, exclude_none=True)
+            yield chunk_frame(_g)
 
-            yield format_sse(json_chunk, event="chunk")
+        if (
+            config.enable_answer_cache
+            and retrieved.answer is None
+            and retrieved.query_vector is not None
+            and full_message
+        ):
+            answer_cache.put(
+                (user_id, file_id),
+                action,
+                snippet,
+                retrieved.query_vector,
+                CachedAnswer(full_message, chunks),
+            )
     except Exception as e:
         # Send an error to the client via SSE if something went wrong
         yield format_sse(str(e), event="error")
@@ -79,12 +175,16 @@ async def create_chat_completion(
                 user_id=user_id,
                 file_id=file_id,
                 content=full_message,
-                context=db_chunks,
+                context_ids=[chunk.id for chunk in chunks],
                 action=Action.default,
                 is_user=False,
             )
             await session.commit()
 
+        timer.mark("total")
+        completion_stats.record(timer)
+        logger.debug(f"Completion stages: {timer.stages}")
+
         yield format_sse(json.dumps(context, ensure_ascii=False), event="context")
 
         yield format_sse("[DONE]", event="done")
@@ -96,70 +196,96 @@ async def prepare_stream(
 ) -> UUID:
     stream_id = uuid4()
 
-    stream_sessions[str(stream_id)] = {
-        "user_id": str(user_id),
-        "request": request,
-        "created_at": datetime.now(UTC),
-    }
+    stream_session = StreamSession(
+        user_id=user_id, request=request, created_at=datetime.now(UTC)
+    )
+    # Kept for longer than it is valid, so a late stream is told it expired
+    await get_stream_session_store().put(
+        str(stream_id),
+        stream_session.model_dump_json().encode(),
+        ttl=2 * config.stream_session_ttl,
+    )
 
     return stream_id
 
 
-def validate_stream_id(user_id: UUID, stream_id: UUID) -> ChatCompletionRequest:
-    session_data = stream_sessions.get(str(stream_id))
+async def validate_stream_id(user_id: UUID, stream_id: UUID) -> ChatCompletionRequest:
+    data = await get_stream_session_store().pop(str(stream_id))
 
-    if not session_data:
+    if not data:
         raise StreamNotFoundError
 
-    if session_data["user_id"] != str(user_id):
+    stream_session = StreamSession.model_validate_json(data)
+    if stream_session.user_id != user_id:
         raise StreamNotFoundError
 
-    created_at: datetime = session_data["created_at"]
-    if datetime.now(UTC) - created_at > timedelta(minutes=10):
-        del stream_sessions[str(stream_id)]
+    if datetime.now(UTC) - stream_session.created_at > timedelta(
+        seconds=config.stream_session_ttl
+    ):
         raise StreamExpiredError
 
-    del stream_sessions[str(stream_id)]
-
-    return session_data["request"]
+    return stream_session.request
 
 
-@router.get("/v1/chat/completions", tags=["Completions"])
-async def chat_completions(
-    stream_id: UUID,
-    user_id: UUID = Depends(get_user_id),
-):
-    request = validate_stream_id(user_id=user_id, stream_id=stream_id)
+async def stream_chat_completion(
+    request: ChatCompletionRequest, user_id: UUID
+) -> StreamingResponse:
+    timer = StageTimer()
     file_id = request.file_id
     query = request.messages[-1]["content"]
 
-    async with session_manager.session() as session:
-        if not await is_indexed(session=session, user_id=user_id, file_id=file_id):
-            raise NotIndexedError(file_id=file_id)
-
-        await add_message(
-            session=session,
+    # Independent stages run concurrently, the query is embedded while the
+    # file is checked. Only the indexed check is awaited before the stream
+    # starts.
+    indexed = asyncio.create_task(
+        timer.measure("indexed", check_indexed(user_id, file_id))
+    )
+    user_message = asyncio.create_task(
+        timer.measure("user_message", save_user_message(request, user_id, indexed))
+    )
+    retrieval = asyncio.create_task(
+        retrieve_context(
+            query=query,
             user_id=user_id,
             file_id=file_id,
-            content=query,
-            is_user=True,
             action=request.action,
             snippet=request.snippet,
+            timer=timer,
+            indexed=indexed,
         )
-        await session.commit()
+    )
+    tasks = (indexed, user_message, retrieval)
+
+    try:
+        if not await indexed:
+            raise NotIndexedError(file_id=file_id)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        # Wait for the sessions to be closed
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
 
     async def streaming_wrapper():
-        async with aclosing(
-            create_chat_completion(
-                user_id=user_id,
-                file_id=file_id,
-                query=query,
-                action=request.action,
-                snippet=request.snippet,
-            )
-        ) as generator:
-            async for chunk in generator:
-                yield chunk
+        try:
+            async with aclosing(
+                create_chat_completion(
+                    user_id=user_id,
+                    file_id=file_id,
+                    query=query,
+                    action=request.action,
+                    snippet=request.snippet,
+                    retrieval=retrieval,
+                    user_message=user_message,
+                    timer=timer,
+                )
+            ) as generator:
+                async for chunk in generator:
+                    yield chunk
+        finally:
+            # The client went away before the stages were needed
+            for task in tasks:
+                task.cancel()
 
     return StreamingResponse(
         content=streaming_wrapper(),
@@ -170,3 +296,23 @@ async def chat_completions(
             "X-Accel-Buffering": "no",
         },
     )
+
+
+@router.post("/v1/chat/completions", tags=["Completions"])
+async def create_chat_completions(
+    request: ChatCompletionRequest,
+    user_id: UUID = Depends(get_user_id),
+):
+    """Streams the completion of the request in the response (SSE)."""
+    return await stream_chat_completion(request, user_id)
+
+
+@router.get("/v1/chat/completions", tags=["Completions"])
+async def chat_completions(
+    stream_id: UUID,
+    user_id: UUID = Depends(get_user_id),
+):
+    """Streams the completion of a request sent to /prepare_stream (EventSource)."""
+    request = await validate_stream_id(user_id=user_id, stream_id=stream_id)
+
+    return await stream_chat_completion(request, user_id)
@@ -1,11 +1,22 @@
 import hmac
 import time
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import datetime
+from pathlib import Path
 from urllib.parse import quote
 from uuid import UUID
 
-from fastapi import APIRouter, BackgroundTasks, Depends, UploadFile
+from fastapi import (
+    APIRouter,
+    BackgroundTasks,
+    Depends,
+    Header,
+    Query,
+    Response,
+    UploadFile,
+)
 from fastapi.exceptions import HTTPException
-from fastapi.responses import StreamingResponse
+from fastapi.responses import FileResponse
 from loguru import logger
 from sqlalchemy.exc import SQLAlchemyError
 
@@ -13,22 +24,28 @@ from server.config import config
 from server.database import (
     AsyncSession,
     add_file_meta,
+    add_indexing_job,
     delete_file_meta,
     find_file_meta,
+    find_indexing_job,
     find_user,
     get_db,
-    is_indexed,
+    get_file_usage,
+    list_file_meta,
 )
 from server.exceptions import (
     FileDeletionError,
     FileLimitExceededException,
     FileNotFoundException,
+    FileUploadException,
+    InvalidCursorException,
     SQLAlchemyDeletionException,
     SQLAlchemyUploadException,
+    StorageLimitExceededException,
 )
 from server.file_storage import FileReader, LocalFileStorage
-from server.models import FileMeta, FileModel
-from server.rag import index_document
+from server.models import FileInfo, FileMeta, IndexingProgress, IndexingStatus
+from server.rag import run_indexing_job
 from server.security import generate_signature, get_user_id
 
 
@@ -44,6 +61,47 @@ def safe_content_disposition(filename: str, fallback_name: str = "download.bin")
     return f"attachment; filename=\"{fallback_name}\"; filename*=UTF-8''{quoted}"
 
 
+def check_quota(files_count: int, files_bytes: int):
+    """Raises if the user would have too many files or bytes."""
+    if files_count > config.max_files_per_user:
+        raise FileLimitExceededException(config.max_files_per_user)
+    if config.max_storage_per_user is not None:
+        max_size = config.max_storage_per_user * 1024 * 1024
+        if files_bytes > max_size:
+            raise StorageLimitExceededException(max_size)
+
+
+def encode_cursor(created_at: datetime, file_id: UUID) -> str:
+    """Opaque cursor of the file after which the next page starts."""
+    return urlsafe_b64encode(f"{created_at.isoformat()}|{file_id}".encode()).decode()
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, UUID]:
+    try:
+        created_at, file_id = urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(created_at), UUID(file_id)
+    except ValueError as err:
+        raise InvalidCursorException() from err
+
+
+def make_etag(file_path: Path, content_hash: str | None) -> str:
+    """Strong ETag, the content hash if it is known."""
+    if content_hash is not None:
+        return f'"{content_hash}"'
+    stat = file_path.stat()
+    return f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """Weak comparison of If-None-Match with the ETag (RFC 9110, 13.1.2)."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    tags = (tag.strip().removeprefix("W/") for tag in if_none_match.split(","))
+    return etag.removeprefix("W/") in tags
+
+
 router = APIRouter()
 reader = FileReader()
 storage = LocalFileStorage()
@@ -63,44 +121,70 @@ async def add_file(
 ) -> list[FileMeta]:
     """Upload a file and store it."""
 
-    files_in_storage = await storage.list(user_id)
-    if len(files_in_storage) + len(files) > config.max_files_per_user:
-        raise FileLimitExceededException(config.max_files_per_user)
+    files_count, files_bytes = await get_file_usage(session, user_id)
+    check_quota(files_count + len(files), files_bytes)
 
-    # Validate and read files
-    contents = await reader(files)
+    # Receive files to the storage and validate them
+    uploads = await reader(files)
 
     # Upload files
+    db_files = []
     files_meta = []
     try:
-        for content, upload_file in zip(contents, files, strict=False):
-            db_meta = await add_file_meta(session, user_id, upload_file.filename)
+        for upload, upload_file in zip(uploads, files, strict=True):
+            db_meta = await add_file_meta(
+                session,
+                user_id,
+                upload_file.filename,
+                upload.content_hash,
+                upload.size,
+            )
+            job = await add_indexing_job(session, user_id, db_meta.file_id)
+            db_files.append((db_meta, job.id, upload))
+
+        # Counters of the user are locked until commit, so concurrent uploads
+        # are checked one after another
+        check_quota(*await get_file_usage(session, user_id))
+
+        for db_meta, _, upload in db_files:
             meta = FileMeta(
                 file_id=db_meta.file_id,
-                filename=upload_file.filename,
+                filename=db_meta.filename,
                 is_indexed=db_meta.is_indexed,
             )
-            await storage.write(
-                user_id=user_id, model=FileModel(meta=meta, file=bytes(content))
+            await storage.write_file(
+                user_id=user_id,
+                meta=meta,
+                tmp_path=upload.path,
+                content_hash=upload.content_hash,
             )
-            files_meta.append(meta)
+            files_meta.append((meta, upload.content_hash))
     except SQLAlchemyError as err:
         await session.rollback()
-        for meta in files_meta:
-            await storage.delete(user_id=user_id, meta=meta)
+        for meta, content_hash in files_meta:
+            await storage.delete(user_id=user_id, meta=meta, content_hash=content_hash)
         raise SQLAlchemyUploadException from err
+    except FileUploadException:
+        # Quota exceeded, nothing is in the storage yet
+        await session.rollback()
+        raise
+    finally:
+        # Files which were not moved to the storage
+        for upload in uploads:
+            upload.path.unlink(missing_ok=True)
 
     await session.commit()
     await session.close()
 
-    # Start indexing
-    for content, meta in zip(contents, files_meta, strict=False):
-        logger.debug(f"Adding indexation task for {meta.filename}")
-        background_tasks.add_task(
-            index_document, user_id=user_id, file=bytes(content), meta=meta
-        )
+    # Without the in-process worker jobs wait in the queue for
+    # python -m server.worker, the API process never indexes them itself
+    if config.run_indexing_worker:
+        # Start indexing right away, jobs left in the queue are picked up later
+        for (_, job_id, _), (meta, _) in zip(db_files, files_meta, strict=True):
+            logger.debug(f"Adding indexation task for {meta.filename}")
+            background_tasks.add_task(run_indexing_job, job_id=job_id)
 
-    return files_meta
+    return [meta for meta, _ in files_meta]
 
 
 @router.get("/files/{file_id}/status", tags=["Files"])
@@ -108,11 +192,35 @@ async def get_indexing_status(
     file_id: UUID,
     user_id: UUID = Depends(get_user_id),
     session: AsyncSession = Depends(get_db),
-) -> bool:
-    status = await is_indexed(session=session, user_id=user_id, file_id=file_id)
-    if status is None:
+) -> IndexingProgress:
+    db_meta = await find_file_meta(session=session, user_id=user_id, file_id=file_id)
+    if db_meta is None:
         raise FileNotFoundException
-    return status
+
+    job = await find_indexing_job(session=session, user_id=user_id, file_id=file_id)
+    if job is None:
+        # Files indexed before the job queue existed
+        return IndexingProgress(
+            file_id=file_id,
+            is_indexed=db_meta.is_indexed,
+            status=IndexingStatus.done if db_meta.is_indexed else None,
+        )
+
+    return IndexingProgress(
+        file_id=file_id,
+        is_indexed=db_meta.is_indexed,
+        status=job.status,
+        stage=job.stage,
+        attempts=job.attempts,
+        pages_total=job.pages_total,
+        pages_processed=job.pages_processed,
+        chunks_written=job.chunks_written,
+        stage_timings=job.stage_timings,
+        error=job.error,
+        created_at=job.created_at,
+        started_at=job.started_at,
+        finished_at=job.finished_at,
+    )
 
 
 @router.delete(
@@ -138,6 +246,7 @@ async def delete_file(
             filename=db_file.filename,
             is_indexed=True,  # Fake
         ),
+        content_hash=db_file.content_hash,
     ):
         await session.rollback()
         raise FileDeletionError(str(file_id)) from None
@@ -175,7 +284,11 @@ async def get_signed_url(
     summary="Download file using temporary link",
 )
 async def download_file_using_link(
-    file_id: UUID, expires: int, signature: str, session: AsyncSession = Depends(get_db)
+    file_id: UUID,
+    expires: int,
+    signature: str,
+    if_none_match: str | None = Header(default=None),
+    session: AsyncSession = Depends(get_db),
 ):
     if time.time() > expires:
         raise HTTPException(status_code=403, detail="Link expired")
@@ -194,7 +307,7 @@ async def download_file_using_link(
     if db_file is None:
         raise FileNotFoundException()
 
-    file_model = await storage.read(
+    file_path = await storage.exists(
         db_user.id,
         FileMeta(
             file_id=file_id,
@@ -203,15 +316,22 @@ async def download_file_using_link(
         ),
     )
 
-    if file_model is None:
+    if file_path is None:
         raise FileNotFoundException() from None
 
-    return StreamingResponse(
-        iter([file_model.file]),
+    etag = make_etag(file_path, db_file.content_hash)
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+
+    # Streamed from disk in chunks (or sent by the server itself if it supports
+    # pathsend), Range requests get 206 Partial Content
+    return FileResponse(
+        file_path,
         media_type="application/pdf",
         headers={
             "Content-Disposition": safe_content_disposition(db_file.filename),
-            "Content-Length": str(len(file_model.file)),
+            "ETag": etag,
+            "Cache-Control": "private, no-cache",
         },
     )
 
@@ -222,17 +342,43 @@ async def download_file_using_link(
     summary="List all files",
 )
 async def list_files(
-    user_id: UUID = Depends(get_user_id), session: AsyncSession = Depends(get_db)
-) -> list[FileMeta]:
-    files_meta = []
-    for file_id in await storage.list(user_id):
-        db_meta = await find_file_meta(session, user_id, UUID(file_id))
-        if db_meta:
-            files_meta.append(
-                FileMeta(
-                    file_id=db_meta.file_id,
-                    filename=db_meta.filename,
-                    is_indexed=db_meta.is_indexed,
-                )
-            )
-    return files_meta
+    response: Response,
+    limit: int | None = Query(default=None, ge=1, le=1000),
+    cursor: str | None = None,
+    check_storage: bool = False,
+    user_id: UUID = Depends(get_user_id),
+    session: AsyncSession = Depends(get_db),
+) -> list[FileInfo]:
+    """
+    List files of the user in upload order.
+
+    With `limit` the list is paged, the cursor of the next page is sent in the
+    X-Next-Cursor header. With `check_storage` files missing in the storage
+    are left out.
+    """
+    rows = await list_file_meta(
+        session,
+        user_id,
+        limit=limit,
+        after=decode_cursor(cursor) if cursor else None,
+    )
+
+    if limit is not None and len(rows) == limit:
+        last, _ = rows[-1]
+        response.headers["X-Next-Cursor"] = encode_cursor(last.created_at, last.file_id)
+
+    if check_storage:
+        stored = set(await storage.list(user_id))
+        rows = [row for row in rows if str(row[0].file_id) in stored]
+
+    return [
+        FileInfo(
+            file_id=db_meta.file_id,
+            filename=db_meta.filename,
+            is_indexed=db_meta.is_indexed,
+            size=db_meta.size,
+            status=status,
+            created_at=db_meta.created_at,
+        )
+        for db_meta, status in rows
+    ]
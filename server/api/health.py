@@ -3,6 +3,10 @@ from fastapi.responses import JSONResponse
 from sqlalchemy import text
 
 from server.database import AsyncSession, get_db
+from server.database.answer_cache import answer_cache
+from server.models import AnswerCacheMetrics, CompletionMetrics, EmbeddingMetrics
+from server.utils.embeddings import get_embedding_service
+from server.utils.timings import completion_stats
 
 router = APIRouter()
 
@@ -16,3 +20,21 @@ async def healthcheck(session: AsyncSession = Depends(get_db)):
         return JSONResponse(
             status_code=500, content={"status": "error", "detail": str(e)}
         )
+
+
+@router.get("/health/embeddings", tags=["Health"])
+async def embedding_metrics() -> EmbeddingMetrics:
+    """Queue depth and batch sizes of the embedding service."""
+    return await get_embedding_service().metrics()
+
+
+@router.get("/health/completions", tags=["Health"])
+async def completion_metrics() -> CompletionMetrics:
+    """Percentiles of completion stage durations, time-to-first-token included."""
+    return completion_stats.metrics()
+
+
+@router.get("/health/answers", tags=["Health"])
+async def answer_cache_metrics() -> AnswerCacheMetrics:
+    """Size and hit rate of the cache of answers to similar questions."""
+    return answer_cache.metrics()
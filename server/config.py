@@ -1,5 +1,6 @@
 from enum import Enum
 from pathlib import Path
+from typing import Literal
 
 import yaml
 from pydantic import BaseModel, PostgresDsn, computed_field
@@ -14,6 +15,17 @@ class EnvMode(str, Enum):
     prod = "PROD"
 
 
+class DistanceMetric(str, Enum):
+    cosine = "cosine"
+    l2 = "l2"
+    inner_product = "inner_product"
+
+
+class VectorIndexType(str, Enum):
+    hnsw = "hnsw"
+    ivfflat = "ivfflat"
+
+
 class Secrets(BaseSettings):
     model_config = SettingsConfigDict(env_file="docker/.env", env_file_encoding="utf-8")
 
@@ -51,6 +63,36 @@ class Config(BaseModel):
     # Cache store for embeddings
     embeddings_model_name: str
     embeddings_cache_path: str
+    embeddings_cache_shards: int
+    embeddings_cache_size_mb: int
+    embeddings_cache_dtype: Literal["float16", "float32"]
+    embeddings_batch_size: int
+    # Embedding requests wait that long for a batch to fill up
+    embedding_max_wait_ms: float
+    # Unix socket of the embedding sidecar shared by all processes,
+    # the model is loaded in every process if not set
+    embedding_server_socket: str | None
+
+    # Metric of chunk retrieval, the vector index is built for the same one
+    embeddings_distance: DistanceMetric
+
+    # Vector index of chunk embeddings, build parameters require a rebuild
+    vector_index_type: VectorIndexType
+    hnsw_m: int
+    hnsw_ef_construction: int
+    ivfflat_lists: int
+    # Search parameters, applied to every retrieval query
+    hnsw_ef_search: int
+    ivfflat_probes: int
+    vector_iterative_scan: Literal["off", "strict_order", "relaxed_order"]
+    # Files with no more chunks are searched exactly, without the vector index
+    exact_search_max_chunks: int
+    # Memory budget of the in-process cache of small files' embeddings
+    chunk_cache_size_mb: int
+
+    # Use mean of sentence embeddings as chunk embedding instead of
+    # embedding chunk text once more
+    pool_chunk_embeddings: bool
 
     # LLM API configuration
     llm_model_name: str
@@ -58,6 +100,12 @@ class Config(BaseModel):
 
     # LLM cache settings
     enable_llm_cache: bool
+    # Answers are reused for questions about the same file with at least
+    # answer_cache_similarity cosine similarity, for answer_cache_ttl seconds
+    enable_answer_cache: bool
+    answer_cache_similarity: float
+    answer_cache_ttl: int
+    answer_cache_size: int
 
     # Rate limiter for LLM API
     llm_requests_per_second: int
@@ -68,10 +116,37 @@ class Config(BaseModel):
     jwt_algorithm: str
     jwt_token_expires_minutes: int
 
+    # Prepared completion requests, valid for stream_session_ttl seconds.
+    # Shared by all workers in Redis (redis://host:port/db) if set
+    stream_session_ttl: int
+    stream_session_store: str | None
+
+    # Tokens of a completion are sent together if they arrive within
+    # sse_flush_interval_ms, up to sse_flush_size characters per event.
+    # At most sse_max_pending_tokens are read ahead of a slow client
+    sse_flush_interval_ms: float
+    sse_flush_size: int
+    sse_max_pending_tokens: int
+
     # Local file storage settings
     file_storage_path: Path
     max_files_per_user: int
     max_file_size: int
+    # Total size of a user's files in MB, no limit if not set
+    max_storage_per_user: int | None
+
+    # Number of processes running CPU-bound indexing (parsing, embeddings)
+    indexing_workers: int
+
+    # PDF text extraction, page ranges are extracted in parallel
+    pdf_extraction_workers: int
+    pdf_pages_per_task: int
+
+    # Indexing job queue
+    run_indexing_worker: bool
+    indexing_poll_interval: float
+    indexing_job_lease_seconds: int
+    indexing_max_attempts: int
 
     # Grobid connection
     grobid_base: str
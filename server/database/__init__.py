@@ -1,20 +1,29 @@
 from .core import AsyncSession, get_db, session_manager
 from .crud import (
     add_file_meta,
+    add_indexing_job,
     add_message,
+    claim_indexing_job,
+    clone_file_chunks,
     create_token,
     create_user,
+    delete_file_chunks,
     delete_file_meta,
     find_file_chunks,
     find_file_meta,
+    find_indexed_copy,
+    find_indexing_job,
     find_user,
+    get_file_usage,
     get_messages,
     get_user_by_email,
     get_user_by_id,
     is_indexed,
     list_file_meta,
+    retrieve_file_chunks,
     save_file_chunks,
     set_indexed,
+    update_indexing_job,
 )
 from .models import Base
 
@@ -23,19 +32,28 @@ __all__ = [
     "get_db",
     "session_manager",
     "add_file_meta",
+    "add_indexing_job",
     "add_message",
+    "claim_indexing_job",
+    "clone_file_chunks",
     "create_token",
     "create_user",
+    "delete_file_chunks",
     "delete_file_meta",
     "find_file_chunks",
     "find_file_meta",
+    "find_indexed_copy",
+    "find_indexing_job",
     "find_user",
+    "get_file_usage",
     "get_messages",
     "get_user_by_email",
     "get_user_by_id",
     "is_indexed",
     "list_file_meta",
+    "retrieve_file_chunks",
     "save_file_chunks",
     "set_indexed",
+    "update_indexing_job",
     "Base",
 ]
@@ -0,0 +1,145 @@
+"""In-process cache of answers to questions similar to earlier ones."""
+
+import time
+from collections import OrderedDict
+from collections.abc import Sequence
+from itertools import count
+from typing import NamedTuple
+
+import numpy as np
+
+from server.config import config
+from server.models import Action, AnswerCacheMetrics
+
+from .chunk_cache import CacheKey, RetrievedChunk
+
+# Answers are only reused for the same file, action and snippet
+GroupKey = tuple[CacheKey, Action, str]
+
+
+class CachedAnswer(NamedTuple):
+    answer: str
+    chunks: list[RetrievedChunk]
+
+
+class _Entry(NamedTuple):
+    group: GroupKey
+    vector: np.ndarray
+    answer: CachedAnswer
+    expires: float
+
+
+def _normalize(vector: Sequence[float]) -> np.ndarray:
+    vector = np.asarray(vector, dtype=np.float32)
+    return vector / max(np.linalg.norm(vector), np.finfo(np.float32).tiny)
+
+
+class AnswerCache:
+    """
+    LRU cache of answers looked up by cosine similarity of query embeddings.
+
+    An answer is reused if a question to the same file with the same action and
+    snippet is at least `threshold` similar. Entries expire after `ttl` seconds
+    and are invalidated with the chunks of their file, so the chunks of their
+    context still exist.
+    """
+
+    def __init__(self, max_entries: int, ttl: float, threshold: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.threshold = threshold
+
+        self.hits = 0
+        self.misses = 0
+
+        self._entries: OrderedDict[int, _Entry] = OrderedDict()
+        self._groups: dict[GroupKey, set[int]] = {}
+        self._ids = count()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def metrics(self) -> AnswerCacheMetrics:
+        return AnswerCacheMetrics(
+            entries=len(self),
+            hits=self.hits,
+            misses=self.misses,
+            hit_rate=self.hit_rate,
+        )
+
+    def get(
+        self,
+        key: CacheKey,
+        action: Action,
+        snippet: str | None,
+        query_vector: Sequence[float],
+    ) -> CachedAnswer | None:
+        """Answer of the most similar question, if it is similar enough."""
+        group = (key, action, snippet or "")
+        now = time.monotonic()
+        for entry_id in [
+            entry_id
+            for entry_id in self._groups.get(group, ())
+            if self._entries[entry_id].expires <= now
+        ]:
+            self._remove(entry_id)
+
+        entry_ids = list(self._groups.get(group, ()))
+        if entry_ids:
+            matrix = np.stack([self._entries[i].vector for i in entry_ids])
+            similarities = matrix @ _normalize(query_vector)
+            best = int(np.argmax(similarities))
+            if similarities[best] >= self.threshold:
+                self.hits += 1
+                self._entries.move_to_end(entry_ids[best])
+                return self._entries[entry_ids[best]].answer
+
+        self.misses += 1
+        return None
+
+    def put(
+        self,
+        key: CacheKey,
+        action: Action,
+        snippet: str | None,
+        query_vector: Sequence[float],
+        answer: CachedAnswer,
+    ) -> None:
+        group = (key, action, snippet or "")
+        entry_id = next(self._ids)
+        self._entries[entry_id] = _Entry(
+            group, _normalize(query_vector), answer, time.monotonic() + self.ttl
+        )
+        self._groups.setdefault(group, set()).add(entry_id)
+
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+
+    def _remove(self, entry_id: int) -> None:
+        entry = self._entries.pop(entry_id)
+        group = self._groups[entry.group]
+        group.discard(entry_id)
+        if not group:
+            del self._groups[entry.group]
+
+    def invalidate(self, key: CacheKey) -> None:
+        """Removes answers about the file."""
+        for group in [group for group in self._groups if group[0] == key]:
+            for entry_id in list(self._groups[group]):
+                self._remove(entry_id)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._groups.clear()
+
+
+answer_cache = AnswerCache(
+    max_entries=config.answer_cache_size,
+    ttl=config.answer_cache_ttl,
+    threshold=config.answer_cache_similarity,
+)
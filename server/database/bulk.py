@@ -0,0 +1,117 @@
+"""Bulk ingestion of chunks through binary COPY."""
+
+import struct
+from collections.abc import AsyncIterator, Iterable, Sequence
+from datetime import datetime, timedelta
+from uuid import UUID
+
+import numpy as np
+import sqlalchemy as db
+from sqlalchemy.ext.asyncio import AsyncSession
+
+# Binary COPY format: https://www.postgresql.org/docs/current/sql-copy.html
+_COPY_HEADER = b"PGCOPY\n\xff\r\n\x00" + struct.pack("!ii", 0, 0)
+_COPY_TRAILER = struct.pack("!h", -1)
+_PG_EPOCH = datetime(2000, 1, 1)
+
+CHUNK_COLUMNS = (
+    "id",
+    "user_id",
+    "filename",
+    "file_id",
+    "chunk_text",
+    "page_start",
+    "page_end",
+    "created_at",
+    "embedding",
+)
+
+ChunkRecord = tuple[
+    UUID, UUID, str, UUID, str, int | None, int | None, datetime, Sequence[float]
+]
+
+_NULL = struct.pack("!i", -1)
+
+
+def _field(value: bytes) -> bytes:
+    return struct.pack("!i", len(value)) + value
+
+
+def _int_field(value: int | None) -> bytes:
+    return _NULL if value is None else _field(struct.pack("!i", value))
+
+
+def _encode_vector(vector: Sequence[float]) -> bytes:
+    # pgvector binary format: dimensions, unused, big-endian float32 values
+    values = np.asarray(vector, dtype=">f4")
+    return struct.pack("!hh", len(values), 0) + values.tobytes()
+
+
+def _encode_timestamp(value: datetime) -> bytes:
+    return struct.pack("!q", (value - _PG_EPOCH) // timedelta(microseconds=1))
+
+
+def encode_chunk_record(record: ChunkRecord) -> bytes:
+    (
+        chunk_id,
+        user_id,
+        filename,
+        file_id,
+        chunk_text,
+        page_start,
+        page_end,
+        created_at,
+        embedding,
+    ) = record
+    return b"".join(
+        (
+            struct.pack("!h", len(CHUNK_COLUMNS)),
+            _field(chunk_id.bytes),
+            _field(user_id.bytes),
+            _field(filename.encode()),
+            _field(file_id.bytes),
+            _field(chunk_text.encode()),
+            _int_field(page_start),
+            _int_field(page_end),
+            _field(_encode_timestamp(created_at)),
+            _field(_encode_vector(embedding)),
+        )
+    )
+
+
+async def _copy_stream(
+    records: Iterable[ChunkRecord], rows_per_block: int
+) -> AsyncIterator[bytes]:
+    yield _COPY_HEADER
+    block = []
+    for record in records:
+        block.append(encode_chunk_record(record))
+        if len(block) >= rows_per_block:
+            yield b"".join(block)
+            block = []
+    yield b"".join(block) + _COPY_TRAILER
+
+
+async def copy_chunks(
+    session: AsyncSession, records: Iterable[ChunkRecord], rows_per_block: int = 1000
+) -> None:
+    """
+    Writes chunks with a single binary COPY inside the session transaction.
+
+    Vectors are encoded here, so no asyncpg codec has to be registered for the
+    vector type (it would change how the ORM binds vectors).
+    """
+    connection = await session.connection()
+    raw_connection = await connection.get_raw_connection()
+    driver_connection = raw_connection.driver_connection
+
+    # asyncpg dialect begins transactions lazily, COPY must not run outside of it
+    if not driver_connection.is_in_transaction():
+        await session.execute(db.text("SELECT 1"))
+
+    await driver_connection.copy_to_table(
+        "chunks",
+        source=_copy_stream(records, rows_per_block),
+        columns=CHUNK_COLUMNS,
+        format="binary",
+    )
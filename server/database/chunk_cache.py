@@ -0,0 +1,138 @@
+"""In-process cache of chunk embeddings for exact retrieval without the database."""
+
+from collections import OrderedDict
+from collections.abc import Sequence
+from typing import NamedTuple
+from uuid import UUID
+
+import numpy as np
+
+from server.config import DistanceMetric, config
+
+CacheKey = tuple[UUID, UUID]
+
+
+class RetrievedChunk(NamedTuple):
+    id: UUID
+    chunk_text: str
+
+
+class FileChunks:
+    """
+    Chunks of a file with their embeddings as one float32 matrix.
+
+    Embeddings are normalized for cosine metric, so every metric is scored
+    with a single matrix-vector product.
+    """
+
+    def __init__(
+        self,
+        ids: Sequence[UUID],
+        texts: Sequence[str],
+        vectors: Sequence[Sequence[float]],
+        metric: DistanceMetric | None = None,
+    ):
+        self.ids = list(ids)
+        self.texts = list(texts)
+        self.metric = metric or config.embeddings_distance
+
+        matrix = np.asarray(vectors, dtype=np.float32)
+        # A file without chunks has no dimension to infer
+        matrix = matrix.reshape(len(self.ids), -1 if self.ids else 0)
+        if self.metric == DistanceMetric.cosine:
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            matrix = matrix / np.maximum(norms, np.finfo(np.float32).tiny)
+        self.matrix = matrix
+        self.sq_norms = np.einsum("ij,ij->i", matrix, matrix)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def nbytes(self) -> int:
+        # Texts are approximated by their length, ids by their 16 bytes
+        return (
+            self.matrix.nbytes
+            + self.sq_norms.nbytes
+            + sum(len(text) for text in self.texts)
+            + 16 * len(self.ids)
+        )
+
+    def distances(self, query_vector: Sequence[float]) -> np.ndarray:
+        """Distances to all chunks, up to a constant shift for l2."""
+        query = np.asarray(query_vector, dtype=np.float32)
+        products = self.matrix @ query
+        if self.metric == DistanceMetric.cosine:
+            return 1 - products / max(np.linalg.norm(query), np.finfo(np.float32).tiny)
+        if self.metric == DistanceMetric.l2:
+            # |x - q|^2 without |q|^2, which is the same for every chunk
+            return self.sq_norms - 2 * products
+        return -products
+
+    def search(self, query_vector: Sequence[float], limit: int) -> list[RetrievedChunk]:
+        """Exact top-k chunks closest to the query."""
+        k = min(limit, len(self))
+        if k == 0:
+            return []
+
+        distances = self.distances(query_vector)
+        top = np.argpartition(distances, k - 1)[:k]
+        top = top[np.argsort(distances[top], kind="stable")]
+        return [RetrievedChunk(self.ids[i], self.texts[i]) for i in top]
+
+
+class ChunkCache:
+    """
+    LRU cache of file chunks within a memory budget.
+
+    Files are cached only after they are indexed and their chunks never change
+    afterwards, the cache is invalidated when chunks are deleted or the file is
+    marked as indexed again. Indexing in another process (python -m
+    server.worker) does not reach this cache, which is safe as long as indexed
+    files are not re-indexed.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._files: OrderedDict[CacheKey, FileChunks] = OrderedDict()
+        self._nbytes = 0
+
+    @property
+    def nbytes(self) -> int:
+        return self._nbytes
+
+    def __len__(self) -> int:
+        return len(self._files)
+
+    def __contains__(self, key: CacheKey) -> bool:
+        return key in self._files
+
+    def get(self, key: CacheKey) -> FileChunks | None:
+        chunks = self._files.get(key)
+        if chunks is not None:
+            self._files.move_to_end(key)
+        return chunks
+
+    def put(self, key: CacheKey, chunks: FileChunks) -> None:
+        """Caches the file chunks, evicting least recently used files."""
+        self.invalidate(key)
+        if chunks.nbytes > self.max_bytes:
+            return
+
+        self._files[key] = chunks
+        self._nbytes += chunks.nbytes
+        while self._nbytes > self.max_bytes:
+            _, evicted = self._files.popitem(last=False)
+            self._nbytes -= evicted.nbytes
+
+    def invalidate(self, key: CacheKey) -> None:
+        chunks = self._files.pop(key, None)
+        if chunks is not None:
+            self._nbytes -= chunks.nbytes
+
+    def clear(self) -> None:
+        self._files.clear()
+        self._nbytes = 0
+
+
+chunk_cache = ChunkCache(max_bytes=config.chunk_cache_size_mb * 1024 * 1024)
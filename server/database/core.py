@@ -2,7 +2,9 @@ import contextlib
 from collections.abc import AsyncIterator
 
 import sqlalchemy as db
+from loguru import logger
 from sqlalchemy.ext.asyncio import (
+    AsyncConnection,
     AsyncEngine,
     AsyncSession,
     async_sessionmaker,
@@ -14,6 +16,7 @@ from server.security import UserModel, generate_access_token, hash_password
 
 from .crud import create_token, create_user, get_user_by_email
 from .models import Base
+from .vector_index import EMBEDDING_INDEX, create_index, describe_index, expected_index
 
 
 class NotInitializedError(Exception):
@@ -73,27 +76,84 @@ class DatabaseSessionManager:
                 END$$;
             """)
             )
-
-            # Create index if it doesn't exist
+            await conn.execute(
+                db.text(
+                    "ALTER TABLE file_meta "
+                    "ADD COLUMN IF NOT EXISTS content_hash VARCHAR(64), "
+                    "ADD COLUMN IF NOT EXISTS size BIGINT, "
+                    "ADD COLUMN IF NOT EXISTS created_at TIMESTAMP "
+                    "NOT NULL DEFAULT now()"
+                )
+            )
+            await conn.execute(
+                db.text(
+                    "ALTER TABLE chunks "
+                    "ADD COLUMN IF NOT EXISTS page_start INTEGER, "
+                    "ADD COLUMN IF NOT EXISTS page_end INTEGER"
+                )
+            )
             await conn.execute(
                 db.text("""
                 DO $$
                 BEGIN
                     IF NOT EXISTS (
-                        SELECT 1 FROM pg_indexes
-                        WHERE tablename = 'chunks' AND indexname = 'chunks_embedding_idx'
+                        SELECT 1 FROM information_schema.columns
+                        WHERE table_name='users' AND column_name='files_count'
                     ) THEN
-                        CREATE INDEX chunks_embedding_idx
-                        ON chunks USING ivfflat (embedding vector_cosine_ops)
-                        WITH (lists = 100);
+                        ALTER TABLE users
+                            ADD COLUMN files_count INTEGER NOT NULL DEFAULT 0,
+                            ADD COLUMN files_bytes BIGINT NOT NULL DEFAULT 0;
+                        UPDATE users SET
+                            files_count = usage.files_count,
+                            files_bytes = usage.files_bytes
+                        FROM (
+                            SELECT user_id,
+                                   count(*) AS files_count,
+                                   coalesce(sum(size), 0) AS files_bytes
+                            FROM file_meta GROUP BY user_id
+                        ) AS usage
+                        WHERE users.id = usage.user_id;
                     END IF;
                 END$$;
             """)
             )
+            # create_all skips indexes added to existing tables
+            await conn.run_sync(self.__create_missing_indexes)
+
+            await self.__create_embedding_index(conn)
 
             # Analyze table
             await conn.execute(db.text("ANALYZE chunks"))
 
+    @staticmethod
+    def __create_missing_indexes(conn: db.Connection):
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)
+
+    async def __create_embedding_index(self, conn: AsyncConnection):
+        """
+        Creates the vector index.
+
+        Index with another operator class can't serve retrieval queries and is
+        rebuilt right away. Changed index type or build parameters are only
+        reported: rebuilding a big index blocks startup, use
+        `python -m server.admin rebuild` to rebuild it online.
+        """
+        expected = expected_index()
+        current = await describe_index(conn)
+        if current is None:
+            await create_index(conn)
+        elif current.opclass != expected.opclass:
+            logger.warning(f"Rebuilding {EMBEDDING_INDEX}: {current} -> {expected}")
+            await conn.execute(db.text(f"DROP INDEX {EMBEDDING_INDEX}"))
+            await create_index(conn)
+        elif current != expected:
+            logger.warning(
+                f"{EMBEDDING_INDEX} differs from the config: {current} -> {expected}, "
+                "run `python -m server.admin rebuild`"
+            )
+
     async def __create_default_user(self):
         user_model = UserModel(
             email=secrets.default_admin_email.get_secret_value(),
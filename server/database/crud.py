@@ -1,42 +1,118 @@
-from uuid import UUID
+import asyncio
+from collections.abc import Sequence
+from datetime import datetime, timedelta
+from typing import Any
+from uuid import UUID, uuid4
 
 import sqlalchemy as db
+from asyncpg import PostgresError
 from loguru import logger
 from sqlalchemy.exc import IntegrityError, SQLAlchemyError
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from sqlalchemy.orm import joinedload, selectinload
 
-from server.models import Action, FileMeta
+from server.config import config
+from server.models import Action, FileMeta, IndexingStatus
+from server.utils.dates import utcnow
+from server.utils.embeddings import embed_query
 from server.utils.llm import get_langchain_embeddings
 
-from .models import DBChunk, DBFileMeta, DBMessage, DBToken, DBUser
-
-
-async def list_file_meta(session: AsyncSession, user_id: UUID) -> list[DBFileMeta]:
-    stmt = select(DBFileMeta).filter(
-        DBFileMeta.user_id == user_id,
+from .answer_cache import answer_cache
+from .bulk import copy_chunks
+from .chunk_cache import FileChunks, RetrievedChunk, chunk_cache
+from .models import (
+    DBChunk,
+    DBFileMeta,
+    DBIndexingJob,
+    DBMessage,
+    DBToken,
+    DBUser,
+    message_chunk_association,
+)
+from .vector_index import chunk_search, set_search_params, uses_exact_search
+
+
+async def list_file_meta(
+    session: AsyncSession,
+    user_id: UUID,
+    limit: int | None = None,
+    after: tuple[datetime, UUID] | None = None,
+) -> list[tuple[DBFileMeta, IndexingStatus | None]]:
+    """
+    Файлы пользователя в порядке загрузки вместе со статусом индексации.
+
+    Страницы выбираются по ключу (created_at, file_id) последнего файла
+    предыдущей страницы, одним запросом по индексу.
+    """
+    stmt = (
+        select(DBFileMeta, DBIndexingJob.status)
+        .outerjoin(DBIndexingJob, DBIndexingJob.file_id == DBFileMeta.file_id)
+        .filter(DBFileMeta.user_id == user_id)
+        .order_by(DBFileMeta.created_at, DBFileMeta.file_id)
     )
+    if after is not None:
+        stmt = stmt.filter(
+            db.tuple_(DBFileMeta.created_at, DBFileMeta.file_id) > db.tuple_(*after)
+        )
+    if limit is not None:
+        stmt = stmt.limit(limit)
 
     result = await session.execute(stmt)
 
-    return result.scalars().all()
+    return [tuple(row) for row in result.all()]
 
 
 async def add_file_meta(
-    session: AsyncSession, user_id: UUID, filename: str
+    session: AsyncSession,
+    user_id: UUID,
+    filename: str,
+    content_hash: str | None = None,
+    size: int | None = None,
 ) -> DBFileMeta:
     file_meta = DBFileMeta(
         user_id=user_id,
         filename=filename,
+        content_hash=content_hash,
+        size=size,
     )
     session.add(file_meta)
 
     await session.flush()
+    await _update_file_usage(session, user_id, 1, size or 0)
 
     return file_meta
 
 
+async def _update_file_usage(
+    session: AsyncSession, user_id: UUID, count: int, size: int
+) -> None:
+    """
+    Изменяет счетчики файлов пользователя.
+
+    Строка пользователя блокируется до конца транзакции, поэтому параллельные
+    загрузки одного пользователя проверяют квоту по очереди.
+    """
+    await session.execute(
+        db.update(DBUser)
+        .where(DBUser.id == user_id)
+        .values(
+            files_count=DBUser.files_count + count,
+            files_bytes=DBUser.files_bytes + size,
+        )
+    )
+
+
+async def get_file_usage(session: AsyncSession, user_id: UUID) -> tuple[int, int]:
+    """Возвращает число файлов пользователя и их размер в байтах."""
+    stmt = select(DBUser.files_count, DBUser.files_bytes).filter(DBUser.id == user_id)
+
+    result = await session.execute(stmt)
+    row = result.first()
+
+    return (0, 0) if row is None else tuple(row)
+
+
 async def find_file_meta(
     session: AsyncSession, user_id: UUID, file_id: UUID
 ) -> None | DBFileMeta:
@@ -49,6 +125,24 @@ async def find_file_meta(
     return result.scalars().first()
 
 
+async def find_indexed_copy(
+    session: AsyncSession, file_id: UUID, content_hash: str | None
+) -> None | DBFileMeta:
+    """Ищет другой проиндексированный файл с тем же содержимым."""
+    if content_hash is None:
+        return None
+
+    stmt = select(DBFileMeta).filter(
+        DBFileMeta.content_hash == content_hash,
+        DBFileMeta.file_id != file_id,
+        DBFileMeta.is_indexed.is_(True),
+    )
+
+    result = await session.execute(stmt)
+
+    return result.scalars().first()
+
+
 async def find_user(session: AsyncSession, file_id: UUID) -> None | DBUser:
     stmt = (
         select(DBFileMeta)
@@ -70,6 +164,9 @@ async def delete_file_meta(
 
     if db_file_meta:
         await session.delete(db_file_meta)
+        await _update_file_usage(session, user_id, -1, -(db_file_meta.size or 0))
+        chunk_cache.invalidate((user_id, file_id))
+        answer_cache.invalidate((user_id, file_id))
 
     return db_file_meta
 
@@ -124,24 +221,61 @@ async def create_token(session: AsyncSession, user_id: UUID, token: str) -> DBTo
         raise
 
 
+async def embed_chunks(
+    chunks: list[str], batch_size: int | None = None
+) -> list[list[float]]:
+    """Считает эмбеддинги чанков батчами вне event loop."""
+    embeddings = get_langchain_embeddings()
+    batch_size = batch_size or config.embeddings_batch_size
+
+    vectors = []
+    for start in range(0, len(chunks), batch_size):
+        vectors.extend(
+            await asyncio.to_thread(
+                embeddings.embed_documents, chunks[start : start + batch_size]
+            )
+        )
+    return vectors
+
+
 async def save_file_chunks(
-    session: AsyncSession, user_id: UUID, meta: FileMeta, chunks: list[str]
+    session: AsyncSession,
+    user_id: UUID,
+    meta: FileMeta,
+    chunks: list[str],
+    vectors: Sequence[Sequence[float]] | None = None,
+    pages: Sequence[tuple[int, int]] | None = None,
 ) -> None:
-    """Сохраняет чанки в БД."""
+    """Сохраняет чанки в БД одним бинарным COPY.
+
+    Если эмбеддинги чанков не переданы, они считаются батчами через embed_documents.
+    Если переданы страницы, для каждого чанка сохраняются его первая и последняя.
+    """
+    if vectors is None:
+        vectors = await embed_chunks(chunks)
+    if pages is None:
+        pages = [(None, None)] * len(chunks)
+
+    created_at = utcnow()
+    records = (
+        (
+            uuid4(),
+            user_id,
+            meta.filename,
+            meta.file_id,
+            chunk,
+            page_start,
+            page_end,
+            created_at,
+            vector,
+        )
+        for chunk, vector, (page_start, page_end) in zip(
+            chunks, vectors, pages, strict=True
+        )
+    )
     try:
-        embeddings = get_langchain_embeddings()
-        chunk_objects = [
-            DBChunk(
-                user_id=user_id,
-                filename=meta.filename,
-                file_id=meta.file_id,
-                chunk_text=chunk,
-                embedding=embeddings.embed_query(chunk),
-            )
-            for chunk in chunks
-        ]
-        session.add_all(chunk_objects)
-    except SQLAlchemyError as e:
+        await copy_chunks(session, records)
+    except (SQLAlchemyError, PostgresError) as e:
         await session.rollback()
         logger.error(f"Ошибка при сохранении чанков: {e}")
         raise
@@ -150,28 +284,132 @@ async def save_file_chunks(
 async def find_file_chunks(
     session: AsyncSession, query: str, user_id: UUID, file_id: UUID, limit: int = 5
 ) -> list[DBChunk]:
-    """Ищет чанки с помощью pgvector."""
+    """Ищет чанки с помощью pgvector.
+
+    Чанки небольших файлов перебираются точно, у больших используется векторный
+    индекс с итеративным сканированием.
+    """
     try:
-        embeddings = get_langchain_embeddings()
-        query_vector = embeddings.embed_query(query)
+        query_vector = await embed_query(query)
 
-        result = await session.execute(
-            db.select(DBChunk)
-            .filter(DBChunk.user_id == user_id, DBChunk.file_id == file_id)
-            .order_by(DBChunk.embedding.l2_distance(query_vector))
-            .limit(limit)
+        exact = await uses_exact_search(session, user_id, file_id)
+        return await _search_chunks(
+            session, query_vector, user_id, file_id, limit, exact
+        )
+
+    except SQLAlchemyError as e:
+        logger.error(f"Ошибка при поиске чанков: {e}")
+        return []
+
+
+async def _search_chunks(
+    session: AsyncSession,
+    query_vector: Sequence[float],
+    user_id: UUID,
+    file_id: UUID,
+    limit: int,
+    exact: bool,
+) -> list[DBChunk]:
+    if not exact:
+        await set_search_params(session)
+    result = await session.execute(
+        chunk_search(query_vector, user_id, file_id, limit, exact)
+    )
+    rows = sorted(result.all(), key=lambda row: row.distance)
+    return [chunk for chunk, _ in rows]
+
+
+async def load_file_chunks(
+    session: AsyncSession, user_id: UUID, file_id: UUID
+) -> FileChunks:
+    """Загружает все чанки файла с эмбеддингами."""
+    result = await session.execute(
+        db.select(DBChunk.id, DBChunk.chunk_text, DBChunk.embedding).filter(
+            DBChunk.user_id == user_id, DBChunk.file_id == file_id
         )
-        return result.scalars().all()
+    )
+    rows = result.all()
+    return FileChunks(
+        ids=[row.id for row in rows],
+        texts=[row.chunk_text for row in rows],
+        vectors=[row.embedding for row in rows],
+    )
+
+
+async def retrieve_file_chunks(
+    session: AsyncSession,
+    query: str,
+    user_id: UUID,
+    file_id: UUID,
+    limit: int = 5,
+    query_vector: Sequence[float] | None = None,
+) -> list[RetrievedChunk]:
+    """Ищет чанки проиндексированного файла.
+
+    Небольшие файлы загружаются в кеш эмбеддингов целиком, повторные запросы к
+    ним считаются точно в памяти без обращения к БД. Эмбеддинг запроса можно
+    передать уже посчитанным.
+    """
+    try:
+        if query_vector is None:
+            query_vector = await embed_query(query)
+
+        key = (user_id, file_id)
+        file_chunks = chunk_cache.get(key)
+        if file_chunks is None:
+            if not await uses_exact_search(session, user_id, file_id):
+                chunks = await _search_chunks(
+                    session, query_vector, user_id, file_id, limit, exact=False
+                )
+                return [RetrievedChunk(chunk.id, chunk.chunk_text) for chunk in chunks]
+
+            file_chunks = await load_file_chunks(session, user_id, file_id)
+            chunk_cache.put(key, file_chunks)
+
+        return file_chunks.search(query_vector, limit)
 
     except SQLAlchemyError as e:
         logger.error(f"Ошибка при поиске чанков: {e}")
         return []
 
 
+async def clone_file_chunks(
+    session: AsyncSession, source_file_id: UUID, user_id: UUID, meta: FileMeta
+) -> int:
+    """Копирует чанки и эмбеддинги другого файла одним запросом внутри БД."""
+    columns = [
+        DBChunk.id,
+        DBChunk.user_id,
+        DBChunk.filename,
+        DBChunk.file_id,
+        DBChunk.chunk_text,
+        DBChunk.page_start,
+        DBChunk.page_end,
+        DBChunk.created_at,
+        DBChunk.embedding,
+    ]
+    source = db.select(
+        db.func.gen_random_uuid(),
+        db.literal(user_id, DBChunk.user_id.type),
+        db.literal(meta.filename, DBChunk.filename.type),
+        db.literal(meta.file_id, DBChunk.file_id.type),
+        DBChunk.chunk_text,
+        DBChunk.page_start,
+        DBChunk.page_end,
+        db.literal(utcnow(), DBChunk.created_at.type),
+        DBChunk.embedding,
+    ).filter(DBChunk.file_id == source_file_id)
+
+    result = await session.execute(db.insert(DBChunk).from_select(columns, source))
+    return result.rowcount
+
+
 async def delete_file_chunks(
     session: AsyncSession, user_id: UUID, filename: str, file_id: UUID
 ) -> None:
     """Удаляет чанки, связанные с файлом пользователя."""
+    chunk_cache.invalidate((user_id, file_id))
+    answer_cache.invalidate((user_id, file_id))
     try:
         await session.execute(
             db.delete(DBChunk).filter_by(
@@ -198,6 +436,8 @@ async def set_indexed(
     db_file_meta = result.scalars().first()
     if db_file_meta:
         db_file_meta.is_indexed = True
+        chunk_cache.invalidate((user_id, file_id))
+        answer_cache.invalidate((user_id, file_id))
         return True
     return False
 
@@ -215,6 +455,104 @@ async def is_indexed(
     return db_file_meta.is_indexed
 
 
+async def add_indexing_job(
+    session: AsyncSession, user_id: UUID, file_id: UUID
+) -> DBIndexingJob:
+    job = DBIndexingJob(user_id=user_id, file_id=file_id)
+    session.add(job)
+
+    await session.flush()
+
+    return job
+
+
+async def find_indexing_job(
+    session: AsyncSession, user_id: UUID, file_id: UUID
+) -> DBIndexingJob | None:
+    stmt = select(DBIndexingJob).filter(
+        DBIndexingJob.user_id == user_id, DBIndexingJob.file_id == file_id
+    )
+
+    result = await session.execute(stmt)
+
+    return result.scalars().first()
+
+
+async def claim_indexing_job(
+    session: AsyncSession, job_id: UUID | None = None
+) -> DBIndexingJob | None:
+    """Захватывает задачу индексации.
+
+    Берется задача в очереди или выполняющаяся задача, воркер которой давно не
+    обновлял heartbeat (например, сервер был перезапущен). Строки, захваченные
+    другими воркерами, пропускаются через FOR UPDATE SKIP LOCKED.
+
+    Прерванная задача, исчерпавшая indexing_max_attempts, помечается как
+    failed: документ, который роняет процесс воркера, не перезапускается вечно.
+    """
+    now = utcnow()
+    expired = now - timedelta(seconds=config.indexing_job_lease_seconds)
+    interrupted = db.and_(
+        DBIndexingJob.status == IndexingStatus.running,
+        DBIndexingJob.heartbeat_at < expired,
+    )
+
+    await session.execute(
+        db.update(DBIndexingJob)
+        .where(interrupted, DBIndexingJob.attempts >= config.indexing_max_attempts)
+        .values(
+            status=IndexingStatus.failed,
+            stage=None,
+            finished_at=now,
+            error="Indexing was interrupted too many times",
+        )
+    )
+
+    stmt = (
+        select(DBIndexingJob)
+        .filter(
+            db.or_(
+                DBIndexingJob.status == IndexingStatus.queued,
+                db.and_(
+                    interrupted,
+                    DBIndexingJob.attempts < config.indexing_max_attempts,
+                ),
+            )
+        )
+        .order_by(DBIndexingJob.created_at)
+        .limit(1)
+        .with_for_update(skip_locked=True)
+    )
+    if job_id is not None:
+        stmt = stmt.filter(DBIndexingJob.id == job_id)
+
+    result = await session.execute(stmt)
+    job = result.scalars().first()
+
+    if job:
+        job.status = IndexingStatus.running
+        job.attempts += 1
+        job.started_at = now
+        job.heartbeat_at = now
+        job.finished_at = None
+        job.error = None
+        await session.flush()
+
+    return job
+
+
+async def update_indexing_job(
+    session: AsyncSession, job_id: UUID, **values: Any
+) -> bool:
+    """Обновляет задачу индексации и её heartbeat."""
+    result = await session.execute(
+        db.update(DBIndexingJob)
+        .where(DBIndexingJob.id == job_id)
+        .values(heartbeat_at=utcnow(), **values)
+    )
+    return result.rowcount > 0
+
+
 async def add_message(
     session: AsyncSession,
     user_id: UUID,
@@ -224,7 +562,13 @@ async def add_message(
     action: Action,
     context: list[DBChunk] | None = None,
     snippet: str | None = None,
+    context_ids: Sequence[UUID] | None = None,
 ) -> DBMessage:
+    """Сохраняет сообщение.
+
+    Контекст передается объектами чанков или только их id, например,
+    найденными в кеше эмбеддингов.
+    """
     context = context or []
     new_message = DBMessage(
         user_id=user_id,
@@ -239,6 +583,15 @@ async def add_message(
     session.add(new_message)
     await session.flush()
 
+    if context_ids:
+        await session.execute(
+            db.insert(message_chunk_association),
+            [
+                {"message_id": new_message.id, "chunk_id": chunk_id}
+                for chunk_id in context_ids
+            ],
+        )
+
     return new_message
 
 
@@ -1,4 +1,5 @@
 import uuid
+from collections.abc import Sequence
 from datetime import UTC, datetime
 
 import sqlalchemy as db
@@ -6,7 +7,9 @@ from pgvector.sqlalchemy import Vector
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import DeclarativeBase, relationship
 
-from server.models import Action
+from server.config import DistanceMetric, config
+from server.models import Action, IndexingStatus
+from server.utils.dates import utcnow
 
 
 class Base(DeclarativeBase):
@@ -19,6 +22,9 @@ class DBUser(Base):
     id: uuid.UUID = db.Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     email: str = db.Column(db.String, unique=True, nullable=False)
     password: str = db.Column(db.String, nullable=False)
+    # Usage of the file storage, updated with file_meta in the same transaction
+    files_count: int = db.Column(db.Integer, nullable=False, default=0)
+    files_bytes: int = db.Column(db.BigInteger, nullable=False, default=0)
 
     token = relationship("DBToken", back_populates="user", uselist=False)
     chunks = relationship(
@@ -51,6 +57,10 @@ class DBToken(Base):
 
 class DBFileMeta(Base):
     __tablename__ = "file_meta"
+    # Pages of a user's files in upload order
+    __table_args__ = (
+        db.Index("file_meta_user_created_idx", "user_id", "created_at", "file_id"),
+    )
 
     id: uuid.UUID = db.Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     file_id: uuid.UUID = db.Column(
@@ -61,6 +71,15 @@ class DBFileMeta(Base):
     )
     filename: str = db.Column(db.String, nullable=False)
     is_indexed: bool = db.Column(db.Boolean, nullable=False, default=False)
+    # SHA-256 of the file content, files with the same content share the index
+    content_hash: str = db.Column(db.String(64), nullable=True, index=True)
+    size: int = db.Column(db.BigInteger, nullable=True)
+    created_at: datetime = db.Column(
+        db.DateTime,
+        nullable=False,
+        default=utcnow,
+        server_default=db.func.now(),
+    )
 
     user = relationship("DBUser", back_populates="files_meta")
     chunks = relationship(
@@ -69,6 +88,50 @@ class DBFileMeta(Base):
     messages = relationship(
         "DBMessage", back_populates="file_meta", cascade="all, delete-orphan"
     )
+    indexing_job = relationship(
+        "DBIndexingJob",
+        back_populates="file_meta",
+        cascade="all, delete-orphan",
+        uselist=False,
+    )
+
+
+class DBIndexingJob(Base):
+    __tablename__ = "indexing_jobs"
+
+    id: uuid.UUID = db.Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    file_id: uuid.UUID = db.Column(
+        UUID(as_uuid=True),
+        db.ForeignKey("file_meta.file_id"),
+        unique=True,
+        nullable=False,
+    )
+    user_id: uuid.UUID = db.Column(
+        UUID(as_uuid=True), db.ForeignKey("users.id"), nullable=False
+    )
+    status: IndexingStatus = db.Column(
+        db.Enum(IndexingStatus, name="indexing_status"),
+        nullable=False,
+        default=IndexingStatus.queued,
+        index=True,
+    )
+    stage: str = db.Column(db.String, nullable=True)
+    attempts: int = db.Column(db.Integer, nullable=False, default=0)
+    pages_total: int = db.Column(db.Integer, nullable=True)
+    pages_processed: int = db.Column(db.Integer, nullable=False, default=0)
+    chunks_written: int = db.Column(db.Integer, nullable=False, default=0)
+    stage_timings: dict = db.Column(db.JSON, nullable=False, default=dict)
+    error: str = db.Column(db.Text, nullable=True)
+    created_at: datetime = db.Column(
+        db.DateTime,
+        nullable=False,
+        default=utcnow,
+    )
+    started_at: datetime = db.Column(db.DateTime, nullable=True)
+    finished_at: datetime = db.Column(db.DateTime, nullable=True)
+    heartbeat_at: datetime = db.Column(db.DateTime, nullable=True)
+
+    file_meta = relationship("DBFileMeta", back_populates="indexing_job")
 
 
 # Association table for many-to-many between messages and chunks
@@ -119,6 +182,8 @@ class DBMessage(Base):
 
 class DBChunk(Base):
     __tablename__ = "chunks"
+    # Chunks are always read per file
+    __table_args__ = (db.Index("chunks_user_file_idx", "user_id", "file_id"),)
 
     id: uuid.UUID = db.Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     user_id: uuid.UUID = db.Column(
@@ -129,6 +194,9 @@ class DBChunk(Base):
         UUID(as_uuid=True), db.ForeignKey("file_meta.file_id"), nullable=False
     )
     chunk_text: str = db.Column(db.Text, nullable=False)
+    # Pages of the document the chunk starts and ends on
+    page_start: int | None = db.Column(db.Integer)
+    page_end: int | None = db.Column(db.Integer)
     created_at: datetime = db.Column(
         db.DateTime,
         nullable=False,
@@ -144,3 +212,24 @@ class DBChunk(Base):
     )
     file_meta = relationship("DBFileMeta", back_populates="chunks")
     user = relationship("DBUser", back_populates="chunks")
+
+
+# pgvector operator class for every metric, the index must use the one of queries
+EMBEDDING_OPCLASSES = {
+    DistanceMetric.cosine: "vector_cosine_ops",
+    DistanceMetric.l2: "vector_l2_ops",
+    DistanceMetric.inner_product: "vector_ip_ops",
+}
+
+
+def embedding_distance(
+    vector: Sequence[float], metric: DistanceMetric | None = None
+) -> db.ColumnElement[float]:
+    """Distance to the chunk embedding which can be served by the vector index."""
+    metric = metric or config.embeddings_distance
+    if metric == DistanceMetric.cosine:
+        return DBChunk.embedding.cosine_distance(vector)
+    if metric == DistanceMetric.l2:
+        return DBChunk.embedding.l2_distance(vector)
+    # Negative inner product, smaller is closer like for other metrics
+    return DBChunk.embedding.max_inner_product(vector)
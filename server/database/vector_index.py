@@ -0,0 +1,189 @@
+"""Vector index of chunk embeddings."""
+
+from collections.abc import Sequence
+from typing import NamedTuple
+from uuid import UUID
+
+import sqlalchemy as db
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine, AsyncSession
+
+from server.config import VectorIndexType, config
+
+from .models import EMBEDDING_OPCLASSES, DBChunk, embedding_distance
+
+EMBEDDING_INDEX = "chunks_embedding_idx"
+
+
+class IndexDefinition(NamedTuple):
+    method: str
+    opclass: str
+    options: dict[str, str]
+
+    def __str__(self) -> str:
+        options = ", ".join(f"{key} = {value}" for key, value in self.options.items())
+        return f"{self.method} (embedding {self.opclass}) WITH ({options})"
+
+
+def expected_index() -> IndexDefinition:
+    """Index definition required by the current config."""
+    if config.vector_index_type == VectorIndexType.hnsw:
+        options = {
+            "m": config.hnsw_m,
+            "ef_construction": config.hnsw_ef_construction,
+        }
+    else:
+        options = {"lists": config.ivfflat_lists}
+
+    return IndexDefinition(
+        method=config.vector_index_type.value,
+        opclass=EMBEDDING_OPCLASSES[config.embeddings_distance],
+        options={key: str(value) for key, value in options.items()},
+    )
+
+
+async def describe_index(
+    conn: AsyncConnection, name: str = EMBEDDING_INDEX
+) -> IndexDefinition | None:
+    """Reads definition of an existing index, None if there is no such index."""
+    row = (
+        await conn.execute(
+            db.text("""
+            SELECT am.amname, opc.opcname, c.reloptions
+            FROM pg_index i
+            JOIN pg_class c ON c.oid = i.indexrelid
+            JOIN pg_am am ON am.oid = c.relam
+            JOIN pg_opclass opc ON opc.oid = i.indclass[0]
+            WHERE c.relname = :name
+        """),
+            {"name": name},
+        )
+    ).first()
+    if row is None:
+        return None
+
+    method, opclass, reloptions = row
+    options = dict(option.split("=", 1) for option in reloptions or [])
+    return IndexDefinition(method=method, opclass=opclass, options=options)
+
+
+async def create_index(
+    conn: AsyncConnection, name: str = EMBEDDING_INDEX, concurrently: bool = False
+) -> None:
+    """
+    Creates the index from the current config.
+
+    Concurrent creation does not block writes, but must run outside of a
+    transaction (AUTOCOMMIT connection).
+    """
+    definition = expected_index()
+    await conn.execute(
+        db.text(
+            f"CREATE INDEX {'CONCURRENTLY ' if concurrently else ''}{name} "
+            f"ON chunks USING {definition}"
+        )
+    )
+
+
+async def reindex(engine: AsyncEngine, concurrently: bool = True) -> None:
+    """Rebuilds the index with its current parameters."""
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        await conn.execute(
+            db.text(
+                f"REINDEX INDEX {'CONCURRENTLY ' if concurrently else ''}"
+                f"{EMBEDDING_INDEX}"
+            )
+        )
+        await conn.execute(db.text("ANALYZE chunks"))
+
+
+async def rebuild_index(engine: AsyncEngine, concurrently: bool = True) -> None:
+    """
+    Builds the index from the current config next to the old one and swaps them.
+
+    Retrieval keeps using the old index until the new one is ready.
+    """
+    new_name = f"{EMBEDDING_INDEX}_new"
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        # Leftover of an interrupted rebuild, concurrent build leaves it invalid
+        await conn.execute(db.text(f"DROP INDEX IF EXISTS {new_name}"))
+        await create_index(conn, new_name, concurrently=concurrently)
+
+    async with engine.begin() as conn:
+        await conn.execute(db.text(f"DROP INDEX IF EXISTS {EMBEDDING_INDEX}"))
+        await conn.execute(
+            db.text(f"ALTER INDEX {new_name} RENAME TO {EMBEDDING_INDEX}")
+        )
+
+
+async def set_search_params(session: AsyncSession) -> None:
+    """
+    Sets index search parameters for the rest of the transaction.
+
+    Both are set, so they apply whichever index type is currently built.
+    With iterative scan the index is scanned further until enough rows pass
+    the file filter (pgvector >= 0.8), ivfflat supports only relaxed order.
+    """
+    params = {
+        "hnsw.ef_search": config.hnsw_ef_search,
+        "ivfflat.probes": config.ivfflat_probes,
+    }
+    if config.vector_iterative_scan != "off":
+        params["hnsw.iterative_scan"] = config.vector_iterative_scan
+        params["ivfflat.iterative_scan"] = "relaxed_order"
+
+    await session.execute(
+        db.select(
+            *(
+                db.func.set_config(name, str(value), True)
+                for name, value in params.items()
+            )
+        )
+    )
+
+
+async def uses_exact_search(
+    session: AsyncSession, user_id: UUID, file_id: UUID
+) -> bool:
+    """
+    Whether the file is small enough to score all of its chunks.
+
+    Counting stops after exact_search_max_chunks rows of the (user_id, file_id)
+    index, so it is cheap for big files too.
+    """
+    limit = config.exact_search_max_chunks
+    count = await session.scalar(
+        db.select(db.func.count()).select_from(
+            db.select(DBChunk.id)
+            .filter(DBChunk.user_id == user_id, DBChunk.file_id == file_id)
+            .limit(limit + 1)
+            .subquery()
+        )
+    )
+    return count <= limit
+
+
+def chunk_search(
+    query_vector: Sequence[float],
+    user_id: UUID,
+    file_id: UUID,
+    limit: int,
+    exact: bool,
+) -> db.Select:
+    """
+    Selects the closest chunks of the file with their distances.
+
+    Exact search reads the file through the (user_id, file_id) index and sorts
+    all of its chunks. The vector index only serves `ORDER BY embedding <op>
+    vector`, adding zero hides the distance from it. Approximate search walks
+    the vector index and filters other files out, rows may come slightly out
+    of order with relaxed iterative scan.
+    """
+    distance = embedding_distance(query_vector)
+    return (
+        db.select(DBChunk, distance.label("distance"))
+        .filter(DBChunk.user_id == user_id, DBChunk.file_id == file_id)
+        .order_by(distance + 0 if exact else distance)
+        .limit(limit)
+    )
@@ -0,0 +1,68 @@
+# Embedding sidecar shared by the API and indexing processes, so the model is
+# loaded once and all requests are batched together (embedding_server_socket)
+import asyncio
+import json
+import os
+
+from loguru import logger
+
+from server.config import config
+from server.utils.embeddings import (
+    EmbeddingService,
+    Priority,
+    encode_vectors,
+    get_embedding_model,
+    pack_frame,
+    read_frame,
+)
+
+
+async def handle(
+    service: EmbeddingService,
+    reader: asyncio.StreamReader,
+    writer: asyncio.StreamWriter,
+) -> None:
+    try:
+        while True:
+            try:
+                request = json.loads(await read_frame(reader))
+            except asyncio.IncompleteReadError:
+                return
+
+            if request["op"] == "metrics":
+                metrics = await service.metrics()
+                writer.write(pack_frame(metrics.model_dump_json().encode()))
+            else:
+                try:
+                    vectors = await service.embed(
+                        request["texts"], Priority[request["priority"]]
+                    )
+                except Exception as err:
+                    logger.exception("Embedding failed")
+                    writer.write(pack_frame(json.dumps({"error": str(err)}).encode()))
+                else:
+                    header, payload = encode_vectors(vectors)
+                    writer.write(pack_frame(json.dumps(header).encode()))
+                    writer.write(pack_frame(payload))
+            await writer.drain()
+    finally:
+        writer.close()
+
+
+async def serve(path: str) -> None:
+    service = EmbeddingService()
+    # Load the model before accepting requests
+    await asyncio.to_thread(get_embedding_model)
+
+    if os.path.exists(path):
+        os.unlink(path)
+    server = await asyncio.start_unix_server(
+        lambda reader, writer: handle(service, reader, writer), path=path
+    )
+    logger.info(f"Embedding server is listening on {path}")
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+    asyncio.run(serve(config.embedding_server_socket))
@@ -15,9 +15,11 @@ class FileErrorMessages(Enum):
     INVALID_PDF = "Invalid PDF file: {filename}"
     TOO_BIG = "File size exceeds the maximum allowed size of {max_size} bytes"
     FILE_LIMIT_EXCEEDED = "File limit exceeded: maximum {max_files} files allowed"
+    STORAGE_LIMIT_EXCEEDED = "Storage limit exceeded: maximum {max_size} bytes allowed"
     FILE_NOT_FOUND = "File not found"
     STREAM_NOT_FOUND = "Stream not found"
     STREAM_EXPIRED = "Stream session expired"
+    INVALID_CURSOR = "Invalid cursor"
 
 
 class FileUploadException(HTTPException):
@@ -100,8 +102,24 @@ class FileLimitExceededException(FileUploadException):
         )
 
 
+class StorageLimitExceededException(FileUploadException):
+    """Exception for when the total size of user's files is exceeded."""
+
+    def __init__(self, max_size: int):
+        super().__init__(
+            FileErrorMessages.STORAGE_LIMIT_EXCEEDED, 413, max_size=max_size
+        )
+
+
 class FileNotFoundException(FileUploadException):
     """Exception for when the requested file is not found."""
 
     def __init__(self):
         super().__init__(FileErrorMessages.FILE_NOT_FOUND, 404)
+
+
+class InvalidCursorException(FileUploadException):
+    """Exception for a malformed pagination cursor."""
+
+    def __init__(self):
+        super().__init__(FileErrorMessages.INVALID_CURSOR, 400)
@@ -1,3 +1,3 @@
-from .utils import FileReader, LocalFileStorage
+from .utils import FileReader, LocalFileStorage, UploadedFile
 
-__all__ = ["FileReader", "LocalFileStorage"]
+__all__ = ["FileReader", "LocalFileStorage", "UploadedFile"]
@@ -1,6 +1,9 @@
+import asyncio
+import hashlib
+import os
 from collections.abc import AsyncIterator
-from io import BytesIO
 from pathlib import Path
+from typing import NamedTuple
 from uuid import UUID, uuid4
 
 import aiofiles
@@ -10,10 +13,11 @@ from fastapi import UploadFile
 from server.config import config
 from server.exceptions import (
     EncryptedPdfException,
+    FileTooLargeException,
     InvalidFileTypeException,
     InvalidPdfException,
 )
-from server.models import FileMeta, FileModel
+from server.models import FileMeta
 
 
 class LocalFileStorage:
@@ -22,39 +26,69 @@ class LocalFileStorage:
     def _make_path(self, file_id: UUID, user_id: UUID) -> Path:
         return config.file_storage_path / "files" / str(user_id) / f"{file_id}.pdf"
 
-    async def read(self, user_id: UUID, meta: FileMeta) -> FileModel | None:
-        """Read the file content if it exists."""
-        file_path = await self.exists(user_id, meta)
-
-        if file_path:
-            async with aiofiles.open(file_path, "rb") as f:
-                file_data = await f.read()
-
-            return FileModel(meta=meta, file=file_data)
-
-        return None
+    def _make_blob_path(self, content_hash: str) -> Path:
+        return (
+            config.file_storage_path
+            / "blobs"
+            / content_hash[:2]
+            / f"{content_hash}.pdf"
+        )
+
+    def make_temp_path(self) -> Path:
+        """Path for a file being received, on the same filesystem as blobs."""
+        tmp_dir = config.file_storage_path / "tmp"
+        tmp_dir.mkdir(parents=True, exist_ok=True)
+        return tmp_dir / f"{uuid4()}.tmp"
+
+    def _link_blob(self, content_hash: str, tmp_path: Path, file_path: Path) -> None:
+        """
+        Link the file to the blob of its content, the content is moved into
+        blobs once and concurrent writers of it are safe.
+        """
+        blob_path = self._make_blob_path(content_hash)
+        try:
+            os.link(blob_path, file_path)
+        except FileNotFoundError:
+            # No blob yet, or its last file was deleted since. The file is
+            # linked first, so the new blob is never left with a single link
+            # for delete to remove.
+            blob_path.parent.mkdir(parents=True, exist_ok=True)
+            os.link(tmp_path, file_path)
+            os.replace(tmp_path, blob_path)
+        else:
+            tmp_path.unlink()
 
-    async def write(self, user_id: UUID, model: FileModel) -> Path:
-        """Write a file to the storage."""
-        file_path = self._make_path(file_id=model.meta.file_id, user_id=user_id)
+    async def write_file(
+        self, user_id: UUID, meta: FileMeta, tmp_path: Path, content_hash: str
+    ) -> Path:
+        """Move a received file (see make_temp_path) to the storage."""
+        file_path = self._make_path(file_id=meta.file_id, user_id=user_id)
 
         file_path.parent.mkdir(parents=True, exist_ok=True)
 
-        async with aiofiles.open(file_path, "wb") as f:
-            await f.write(model.file)
+        self._link_blob(content_hash, tmp_path, file_path)
 
         return file_path
 
-    async def delete(self, user_id: UUID, meta: FileMeta) -> bool:
-        """Delete a file if it exists."""
+    async def delete(
+        self, user_id: UUID, meta: FileMeta, content_hash: str | None = None
+    ) -> bool:
+        """Delete a file if it exists, and its blob if nobody else uses it."""
         file_path = self._make_path(file_id=meta.file_id, user_id=user_id)
 
         if file_path.exists() and file_path.is_file():
             file_path.unlink()
-            return True
         else:
             return False
 
+        if content_hash is not None:
+            blob_path = self._make_blob_path(content_hash)
+            # Files linked later keep the content even if the blob is removed
+            if blob_path.exists() and blob_path.stat().st_nlink == 1:
+                blob_path.unlink(missing_ok=True)
+
+        return True
+
     async def exists(self, user_id: UUID, meta: FileMeta) -> Path | None:
         """Check if a file exists."""
         file_path = self._make_path(file_id=meta.file_id, user_id=user_id)
@@ -74,28 +108,71 @@ class LocalFileStorage:
         return [file.stem for file in user_dir.iterdir() if file.is_file()]
 
 
+class UploadedFile(NamedTuple):
+    path: Path
+    content_hash: str
+    size: int
+
+
 class FileReader:
+    """Receives uploads to temporary files of the storage and validates them."""
+
     allowed_mime_types = {"application/pdf"}
+    read_size = 1024 * 1024
+
+    def __init__(self, storage: LocalFileStorage | None = None):
+        self.storage = storage or LocalFileStorage()
 
     def _validate_before(self, file: UploadFile):
         if file.content_type not in self.allowed_mime_types:
             raise InvalidFileTypeException(file.filename) from None
 
-    async def read(self, files: list[UploadFile]) -> AsyncIterator[bytes]:
-        for file in files:
-            self._validate_before(file)
-
-            content = file.file.read()
-
-            try:
-                doc = fitz.open(stream=BytesIO(content), filetype="pdf")
-            except Exception as err:
-                raise InvalidPdfException(file.filename) from err
+    def _validate_after(self, file: UploadFile, path: Path):
+        try:
+            doc = fitz.open(path, filetype="pdf")
+        except Exception as err:
+            raise InvalidPdfException(file.filename) from err
 
+        with doc:
             if doc.is_encrypted:
                 raise EncryptedPdfException(file.filename) from None
 
-            yield content
+    async def _receive(self, file: UploadFile) -> UploadedFile:
+        """Copies the upload chunk by chunk, hashing it on the way."""
+        max_size = config.max_file_size * 1024 * 1024
+        path = self.storage.make_temp_path()
+        content_hash = hashlib.sha256()
+        size = 0
+        try:
+            async with aiofiles.open(path, "wb") as f:
+                while chunk := await file.read(self.read_size):
+                    size += len(chunk)
+                    if size > max_size:
+                        raise FileTooLargeException(max_size)
+                    content_hash.update(chunk)
+                    await f.write(chunk)
+
+            await asyncio.to_thread(self._validate_after, file, path)
+        except BaseException:
+            path.unlink(missing_ok=True)
+            raise
+
+        return UploadedFile(path, content_hash.hexdigest(), size)
+
+    async def read(self, files: list[UploadFile]) -> AsyncIterator[UploadedFile]:
+        for file in files:
+            self._validate_before(file)
 
-    async def __call__(self, files: list[UploadFile]) -> list[bytes]:
-        return [content async for content in self.read(files)]
+            yield await self._receive(file)
+
+    async def __call__(self, files: list[UploadFile]) -> list[UploadedFile]:
+        """Receives all files, nothing is left on disk if one of them is invalid."""
+        uploads = []
+        try:
+            async for upload in self.read(files):
+                uploads.append(upload)
+        except BaseException:
+            for upload in uploads:
+                upload.path.unlink(missing_ok=True)
+            raise
+        return uploads
@@ -1,4 +1,5 @@
 # source: https://github.com/vllm-project/vllm/blob/main/vllm/entrypoints/openai/api_server.py#L25
+import asyncio
 from contextlib import asynccontextmanager
 
 from fastapi import FastAPI
@@ -11,13 +12,20 @@ from server.api.health import router as health_router
 from server.api.history import router as history_router
 from server.config import EnvMode, config, secrets
 from server.database import session_manager
+from server.rag import run_indexing_workers, shutdown_indexing_executor
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    indexing_worker = None
     if config.env is not EnvMode.test:
         await session_manager.init_db(str(secrets.sqlalchemy_url))
+        if config.run_indexing_worker:
+            indexing_worker = asyncio.create_task(run_indexing_workers())
     yield
+    if indexing_worker is not None:
+        indexing_worker.cancel()
+    shutdown_indexing_executor()
     await session_manager.close()
 
 
@@ -34,6 +42,8 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Cursor of the next page of the file list
+    expose_headers=["X-Next-Cursor"],
 )
 
 
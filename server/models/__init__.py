@@ -1,3 +1,4 @@
+from datetime import datetime
 from uuid import UUID
 
 from pydantic import BaseModel, Field
@@ -7,7 +8,16 @@ from vllm.entrypoints.openai.protocol import (
     ChatCompletionStreamResponse,
 )
 
-from .files import Action, FileMeta, FileModel
+from .completions import AnswerCacheMetrics, CompletionMetrics, StageMetrics
+from .embeddings import EmbeddingMetrics
+from .files import (
+    Action,
+    FileInfo,
+    FileMeta,
+    FileModel,
+    IndexingProgress,
+    IndexingStatus,
+)
 from .history import Message
 
 
@@ -29,12 +39,28 @@ class ChatCompletionRequest(BaseModel):
     snippet: str | None = Field(default=None)
 
 
+class StreamSession(BaseModel):
+    """Completion request waiting for its stream."""
+
+    user_id: UUID
+    request: ChatCompletionRequest
+    created_at: datetime
+
+
 __all__ = [
     "Action",
+    "AnswerCacheMetrics",
+    "CompletionMetrics",
+    "EmbeddingMetrics",
+    "FileInfo",
     "FileMeta",
     "FileModel",
+    "IndexingProgress",
+    "IndexingStatus",
     "Message",
+    "StageMetrics",
     "ChatCompletionResponseStreamChoice",
     "ChatCompletionStreamResponse",
     "ChatCompletionRequest",
+    "StreamSession",
 ]
@@ -0,0 +1,24 @@
+from pydantic import BaseModel, Field
+
+
+class StageMetrics(BaseModel):
+    count: int = Field(description="Recent requests which reached the stage.")
+    p50_ms: float
+    p95_ms: float
+    max_ms: float
+
+
+class CompletionMetrics(BaseModel):
+    stages: dict[str, StageMetrics] = Field(
+        description=(
+            "Durations of completion stages of recent requests. first_token is "
+            "measured from the start of the request."
+        )
+    )
+
+
+class AnswerCacheMetrics(BaseModel):
+    entries: int
+    hits: int = Field(description="Questions answered from the cache.")
+    misses: int
+    hit_rate: float
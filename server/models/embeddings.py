@@ -0,0 +1,11 @@
+from pydantic import BaseModel, Field
+
+
+class EmbeddingMetrics(BaseModel):
+    queue_depth: dict[str, int] = Field(
+        description="Texts waiting for embedding by priority."
+    )
+    batches: int = 0
+    texts: int = Field(default=0, description="Texts embedded so far.")
+    last_batch_size: int = 0
+    mean_batch_size: float = 0.0
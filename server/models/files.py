@@ -1,3 +1,4 @@
+from datetime import datetime
 from enum import Enum
 from uuid import UUID
 
@@ -20,3 +21,36 @@ class Action(Enum):
     translate = "translate"
     explain = "explain"
     ask = "ask"
+
+
+class IndexingStatus(Enum):
+    queued = "queued"
+    running = "running"
+    failed = "failed"
+    done = "done"
+
+
+class FileInfo(FileMeta):
+    size: int | None = Field(default=None, description="Size of the file in bytes.")
+    status: IndexingStatus | None = Field(
+        default=None, description="Status of the indexing job of the file."
+    )
+    created_at: datetime
+
+
+class IndexingProgress(BaseModel):
+    file_id: UUID
+    is_indexed: bool
+    status: IndexingStatus | None = None
+    stage: str | None = None
+    attempts: int = 0
+    pages_total: int | None = None
+    pages_processed: int = 0
+    chunks_written: int = 0
+    stage_timings: dict[str, float] = Field(
+        default_factory=dict, description="Duration of finished stages in seconds."
+    )
+    error: str | None = None
+    created_at: datetime | None = None
+    started_at: datetime | None = None
+    finished_at: datetime | None = None
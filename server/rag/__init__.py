@@ -1,4 +1,17 @@
 from .pdf import parse_sections_from_bytes
-from .workers import generate, index_document
+from .workers import (
+    generate,
+    index_document,
+    run_indexing_job,
+    run_indexing_workers,
+    shutdown_indexing_executor,
+)
 
-__all__ = ["generate", "index_document", "parse_sections_from_bytes"]
+__all__ = [
+    "generate",
+    "index_document",
+    "parse_sections_from_bytes",
+    "run_indexing_job",
+    "run_indexing_workers",
+    "shutdown_indexing_executor",
+]
@@ -1,44 +1,264 @@
 import re
+from typing import NamedTuple
 
 import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
 
+from server.config import config
 from server.utils.llm import get_langchain_embeddings
 
+_sentence_end = re.compile(r"(?<=[.!?]) +")
+
+
+def split_sentences(document: str) -> list[str]:
+    return _sentence_end.split(document)
+
+
+# First and last page of a piece of text
+PageSpan = tuple[int, int]
+
+
+class SentenceSplitter:
+    """
+    Splits pages into sentences as they arrive.
+
+    Pages are joined with a newline, the last piece of the text is kept until
+    the next page because a sentence may continue there. Produces the same
+    sentences as `split_sentences` over the whole document.
+    """
 
-class SemanticChunker:
     def __init__(self):
-        self.embedder = get_langchain_embeddings()
+        self._tail: str | None = None
+        # Page where the kept piece begins and the last fed page
+        self._tail_page = 0
+        self._page = 0
 
-    def __call__(
-        self,
-        document: str,
-        similarity_threshold: float = 0.8,
-    ) -> list[str]:
-        chunks = []
-        sentences = re.split(r"(?<=[.!?]) +", document)
+    def feed_page(self, page: str, page_no: int) -> list[tuple[str, PageSpan]]:
+        """Returns finished sentences with the pages they span."""
+        if self._tail is None:
+            text, first_page = page, page_no
+        else:
+            text, first_page = f"{self._tail}\n{page}", self._tail_page
+        *sentences, self._tail = split_sentences(text)
+        self._tail_page = page_no if sentences else first_page
+        self._page = page_no
+
+        spans = [(page_no, page_no)] * len(sentences)
+        if spans:
+            # Only the first sentence may continue the previous page
+            spans[0] = (first_page, page_no)
+        return list(zip(sentences, spans, strict=True))
+
+    def flush_page(self) -> list[tuple[str, PageSpan]]:
+        tail, self._tail = self._tail, None
+        if tail is None:
+            return [("", (self._page, self._page))]
+        return [(tail, (self._tail_page, self._page))]
+
+    def feed(self, page: str) -> list[str]:
+        return [sentence for sentence, _ in self.feed_page(page, self._page)]
+
+    def flush(self) -> list[str]:
+        return [sentence for sentence, _ in self.flush_page()]
+
+
+class CentroidTracker:
+    """
+    Detects chunk boundaries over consecutive batches of sentence embeddings.
+
+    A sentence joins the current chunk while its cosine similarity with the chunk
+    centroid is at least `similarity_threshold`; the centroid is then averaged
+    with the sentence embedding. Embeddings are normalized once per batch, so
+    each step costs a couple of dot products instead of a full
+    `cosine_similarity` call.
+    """
+
+    def __init__(self, similarity_threshold: float):
+        self.similarity_threshold = similarity_threshold
+        self.centroid: np.ndarray | None = None
+
+    def boundaries(self, embeddings: np.ndarray) -> list[int]:
+        """Returns indices of sentences in the batch which start a new chunk."""
+        embeddings = np.asarray(embeddings, dtype=np.float64)
+        if len(embeddings) == 0:
+            return []
+
+        norms = np.linalg.norm(embeddings, axis=1)
+        norms[norms == 0.0] = 1.0
+        normalized = embeddings / norms[:, None]
+
+        boundaries = []
+        centroid = self.centroid
+
+        for i in range(len(embeddings)):
+            if centroid is None:
+                boundaries.append(i)
+                centroid = embeddings[i].copy()
+                continue
+
+            centroid_norm = np.sqrt(np.dot(centroid, centroid)) or 1.0
+            similarity = np.dot(centroid, normalized[i]) / centroid_norm
+
+            if similarity >= self.similarity_threshold:
+                centroid += embeddings[i]
+                centroid *= 0.5
+            else:
+                boundaries.append(i)
+                centroid = embeddings[i].copy()
+
+        self.centroid = centroid
+        return boundaries
+
+
+def find_boundaries(embeddings: np.ndarray, similarity_threshold: float) -> list[int]:
+    """Returns indices of sentences which start a new chunk."""
+    return CentroidTracker(similarity_threshold).boundaries(embeddings)
+
+
+def join_chunks(sentences: list[str], boundaries: list[int]) -> list[str]:
+    ends = boundaries[1:] + [len(sentences)]
+    return [
+        " ".join(sentences[start:end])
+        for start, end in zip(boundaries, ends, strict=True)
+    ]
 
-        embeddings = np.array(self.embedder.embed_documents(sentences))
 
-        current_chunk = [sentences[0]]
-        current_embedding = embeddings[0].reshape(1, -1)
+def pool_chunks(embeddings: np.ndarray, boundaries: list[int]) -> np.ndarray:
+    """Returns mean sentence embedding of every chunk."""
+    embeddings = np.asarray(embeddings, dtype=np.float64)
+    counts = np.diff(boundaries + [len(embeddings)])
+    return np.add.reduceat(embeddings, boundaries, axis=0) / counts[:, None]
 
-        for i in range(1, len(sentences)):
-            similarity = cosine_similarity(
-                current_embedding, embeddings[i].reshape(1, -1)
-            )[0][0]
 
-            if similarity >= similarity_threshold:
-                current_chunk.append(sentences[i])
-                current_embedding = np.mean(
-                    [embeddings[i].reshape(1, -1), current_embedding], axis=0
-                )
+class Chunk(NamedTuple):
+    text: str
+    # Mean of sentence embeddings
+    vector: np.ndarray
+    # Pages of the first and the last sentence, (0, 0) if pages are not numbered
+    pages: PageSpan = (0, 0)
+
+
+class SemanticChunker:
+    """
+    Streaming semantic chunker.
+
+    Text is fed page by page, sentences are embedded in batches of `batch_size`
+    and chunks are returned as soon as their end is found, so only the current
+    chunk and one batch of sentences are kept in memory. Every chunk keeps the
+    range of pages its sentences come from.
+    """
+
+    def __init__(
+        self, similarity_threshold: float = 0.8, batch_size: int | None = None
+    ):
+        self._embedder = None
+        self.batch_size = batch_size or config.embeddings_batch_size
+        self._reset(similarity_threshold)
+
+    def _reset(self, similarity_threshold: float) -> None:
+        self._splitter = SentenceSplitter()
+        self._tracker = CentroidTracker(similarity_threshold)
+        # Sentences waiting for embedding
+        self._pending: list[tuple[str, PageSpan]] = []
+        # Unfinished chunk
+        self._sentences: list[str] = []
+        self._pages: PageSpan | None = None
+        self._vectors_sum: np.ndarray | None = None
+
+    @property
+    def embedder(self):
+        # Created on first use, so the orchestrator which only passes the
+        # state between pool processes never loads the model
+        if self._embedder is None:
+            self._embedder = get_langchain_embeddings()
+        return self._embedder
+
+    def __getstate__(self) -> dict:
+        # The state is sent between indexing processes, the model is not
+        state = self.__dict__.copy()
+        state["_embedder"] = None
+        return state
+
+    def _emit(self) -> Chunk:
+        chunk = Chunk(
+            text=" ".join(self._sentences),
+            vector=self._vectors_sum / len(self._sentences),
+            pages=self._pages,
+        )
+        self._sentences = []
+        self._pages = None
+        self._vectors_sum = None
+        return chunk
+
+    def _process(self, batch: list[tuple[str, PageSpan]]) -> list[Chunk]:
+        if not batch:
+            return []
+        sentences = [sentence for sentence, _ in batch]
+
+        embeddings = np.array(
+            self.embedder.embed_documents(sentences), dtype=np.float64
+        )
+        boundaries = self._tracker.boundaries(embeddings)
+
+        chunks = []
+        starts = [0, *boundaries]
+        ends = [*boundaries, len(sentences)]
+        for i, (start, end) in enumerate(zip(starts, ends, strict=True)):
+            # Every boundary closes the unfinished chunk
+            if i > 0 and self._sentences:
+                chunks.append(self._emit())
+            if start == end:
+                continue
+
+            vectors_sum = embeddings[start:end].sum(axis=0)
+            if self._vectors_sum is None:
+                self._vectors_sum = vectors_sum
             else:
-                chunks.append(" ".join(current_chunk))
-                current_chunk = [sentences[i]]
-                current_embedding = embeddings[i].reshape(1, -1)
-        # Add last chunk
-        if current_chunk:
-            chunks.append(" ".join(current_chunk))
+                self._vectors_sum += vectors_sum
+            self._sentences.extend(sentences[start:end])
+            first_page = batch[start][1][0] if self._pages is None else self._pages[0]
+            self._pages = (first_page, batch[end - 1][1][1])
+
+        return chunks
+
+    def feed(self, text: str, page_no: int = 0) -> list[Chunk]:
+        """Adds next page of the document, returns finished chunks."""
+        self._pending.extend(self._splitter.feed_page(text, page_no))
 
+        chunks = []
+        while len(self._pending) >= self.batch_size:
+            batch = self._pending[: self.batch_size]
+            del self._pending[: self.batch_size]
+            chunks.extend(self._process(batch))
+        return chunks
+
+    def flush(self) -> list[Chunk]:
+        """Ends the document, returns remaining chunks."""
+        self._pending.extend(self._splitter.flush_page())
+
+        chunks = self._process(self._pending)
+        if self._sentences:
+            chunks.append(self._emit())
+
+        self._reset(self._tracker.similarity_threshold)
+        return chunks
+
+    def split(
+        self,
+        document: str,
+        similarity_threshold: float = 0.8,
+    ) -> tuple[list[str], np.ndarray]:
+        """Returns chunks together with their pooled sentence embeddings."""
+        self._reset(similarity_threshold)
+        chunks = self.feed(document) + self.flush()
+
+        return [chunk.text for chunk in chunks], np.array(
+            [chunk.vector for chunk in chunks]
+        )
+
+    def __call__(
+        self,
+        document: str,
+        similarity_threshold: float = 0.8,
+    ) -> list[str]:
+        chunks, _ = self.split(document, similarity_threshold)
         return chunks
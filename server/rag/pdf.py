@@ -1,4 +1,9 @@
+import re
 import tempfile
+from collections.abc import Iterator
+from concurrent.futures import Executor
+from itertools import repeat
+from pathlib import Path
 
 import fitz
 from bs4 import BeautifulSoup, Tag
@@ -6,6 +11,8 @@ from grobid_client.grobid_client import GrobidClient
 
 from server.config import config
 
+PdfSource = bytes | str | Path
+
 relevant_sections = {
     "abstract": "## ABSTRACT",
     "title": "#",
@@ -66,22 +73,118 @@ def parse_sections_from_bytes(pdf_bytes: bytes) -> str:
     return "\n".join(sections)
 
 
-def smart_fix(text: str) -> str:
-    _t = ""
-    for c in text:
+def _make_cp1251_table() -> dict[int, str]:
+    """Maps latin1 characters to cp1251 characters with the same byte."""
+    table = {}
+    for code in range(0x80, 0x100):
         try:
-            _t += c.encode("latin1").decode("cp1251")
-        except UnicodeEncodeError:
-            _t += c
-    return _t
+            table[code] = bytes([code]).decode("cp1251")
+        except UnicodeDecodeError:
+            # Byte 0x98 is not defined in cp1251, keep the character
+            continue
+    return table
+
+
+_cp1251_table = _make_cp1251_table()
+_latin1_supplement = re.compile(r"[\x80-\xff]")
+_cyrillic = re.compile(r"[\u0400-\u04ff]")
+
+
+def needs_fix(text: str) -> bool:
+    """
+    Detects cp1251 text which was decoded as latin1.
+
+    Text without latin1 supplement characters is not changed by the fix, text
+    with real cyrillic letters is already decoded properly.
+    """
+    return (
+        _latin1_supplement.search(text) is not None and _cyrillic.search(text) is None
+    )
+
+
+def smart_fix(text: str) -> str:
+    if not needs_fix(text):
+        return text
+    return text.translate(_cp1251_table)
+
+
+def open_pdf(file: PdfSource) -> fitz.Document:
+    if isinstance(file, bytes | bytearray | memoryview):
+        return fitz.open(stream=file, filetype="pdf")
+    return fitz.open(file, filetype="pdf")
+
+
+def count_pages(file: PdfSource) -> int:
+    with open_pdf(file) as doc:
+        return doc.page_count
+
+
+def page_ranges(page_count: int, pages_per_range: int) -> list[tuple[int, int]]:
+    """Splits pages into consecutive [start, stop) ranges."""
+    return [
+        (start, min(start + pages_per_range, page_count))
+        for start in range(0, page_count, pages_per_range)
+    ]
+
+
+def extract_pages(file: PdfSource, start: int, stop: int) -> list[tuple[int, str]]:
+    """
+    Extracts text of pages in [start, stop) range.
+
+    Meant to be run in a worker process: the document is opened from the given
+    path or bytes in every call, nothing but the page texts is sent back.
+
+    :param file: Path to a PDF file or PDF file in bytes
+    :return: Pairs of page number (starting from 1) and page text
+    """
+    with open_pdf(file) as doc:
+        return [
+            (number + 1, smart_fix(doc[number].get_text("text")))
+            for number in range(start, stop)
+        ]
+
+
+def iter_pdf_pages(
+    file: PdfSource, executor: Executor | None = None, pages_per_range: int = 16
+) -> Iterator[tuple[int, str]]:
+    """
+    Yields page number and text of every page in order.
+
+    :param file: Path to a PDF file or PDF file in bytes
+    :param executor: Pool extracting page ranges in parallel, sequential if None
+    :param pages_per_range: Number of pages extracted by a single task
+    """
+    ranges = page_ranges(count_pages(file), pages_per_range)
+
+    if executor is None:
+        results = (extract_pages(file, start, stop) for start, stop in ranges)
+    else:
+        results = executor.map(
+            extract_pages,
+            repeat(file),
+            [start for start, _ in ranges],
+            [stop for _, stop in ranges],
+        )
+
+    for pages in results:
+        yield from pages
+
+
+def read_pdf_pages(file: PdfSource) -> list[str]:
+    """
+    Extracts text of every page from a PDF file.
+
+    :param file: Path to a PDF file or PDF file in bytes
+    :return: Text of each page
+    """
+    return [text for _, text in iter_pdf_pages(file)]
 
 
-def read_pdf(file: bytes) -> str:
+def read_pdf(file: PdfSource) -> str:
     """
     Extracts text from a PDF file and returns it as a single string.
 
-    :param file: PDF file in bytes
+    :param file: Path to a PDF file or PDF file in bytes
     :return: Concatenated text from all pages
     """
-    doc = fitz.open(stream=file, filetype="pdf")
-    return "\n".join(smart_fix(page.get_text("text")) for page in doc)
+    return "\n".join(read_pdf_pages(file))
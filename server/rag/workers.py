@@ -1,37 +1,417 @@
-from collections.abc import AsyncGenerator
+import asyncio
+import multiprocessing
+import time
+from collections import deque
+from collections.abc import AsyncGenerator, AsyncIterator
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import aclosing, asynccontextmanager
+from itertools import islice
+from typing import Any
 from uuid import UUID
 
 from loguru import logger
 from sqlalchemy import text
 
-from server.database import save_file_chunks, session_manager, set_indexed
-from server.models import Action, FileMeta
+from server.config import config
+from server.database import (
+    claim_indexing_job,
+    clone_file_chunks,
+    delete_file_chunks,
+    find_file_meta,
+    find_indexed_copy,
+    save_file_chunks,
+    session_manager,
+    set_indexed,
+    update_indexing_job,
+)
+from server.file_storage import LocalFileStorage
+from server.models import Action, FileMeta, IndexingStatus
+from server.utils.dates import utcnow
+from server.utils.llm import get_langchain_embeddings
 
 from .core.generation import Generator
-from .core.indexing import SemanticChunker
-from .pdf import read_pdf
+from .core.indexing import PageSpan, SemanticChunker
+from .pdf import PdfSource, count_pages, extract_pages, page_ranges
 
+storage = LocalFileStorage()
 
-async def index_document(user_id: UUID, file: bytes, meta: FileMeta) -> None:
-    logger.debug(f"Starting indexation process for {meta.filename}")
-    chunker = SemanticChunker()
+_executor: ProcessPoolExecutor | None = None
+_pdf_executor: ProcessPoolExecutor | None = None
 
-    document = read_pdf(file)
 
-    chunks = chunker(document)
+def get_indexing_executor() -> ProcessPoolExecutor:
+    """Process pool which runs all CPU-bound indexing stages."""
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(
+            max_workers=config.indexing_workers,
+            # Forking a process with initialized torch/CUDA state is unsafe
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _executor
 
-    async with session_manager.session() as session:
-        await save_file_chunks(
-            session=session, user_id=user_id, meta=meta, chunks=chunks
+
+def get_pdf_executor() -> ProcessPoolExecutor:
+    """Process pool which extracts PDF page ranges in parallel."""
+    global _pdf_executor
+    if _pdf_executor is None:
+        _pdf_executor = ProcessPoolExecutor(
+            max_workers=config.pdf_extraction_workers,
+            mp_context=multiprocessing.get_context("spawn"),
         )
-        await set_indexed(
+    return _pdf_executor
+
+
+def shutdown_indexing_executor() -> None:
+    global _executor, _pdf_executor
+    for executor in (_executor, _pdf_executor):
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+    _executor = None
+    _pdf_executor = None
+
+
+def _chunk_pages(
+    chunker: SemanticChunker | None, pages: list[tuple[int, str]], final: bool
+) -> tuple[SemanticChunker, list[str], list[PageSpan], list[list[float]]]:
+    """
+    Feeds numbered pages to the streaming chunker and embeds finished chunks.
+
+    Chunker state travels between the orchestrator and pool processes, so the
+    next batch of pages may be processed by any of them.
+    """
+    chunker = chunker or SemanticChunker()
+
+    chunks = []
+    for page_no, page in pages:
+        chunks.extend(chunker.feed(page, page_no))
+    if final:
+        chunks.extend(chunker.flush())
+
+    texts = [chunk.text for chunk in chunks]
+    spans = [chunk.pages for chunk in chunks]
+    if config.pool_chunk_embeddings:
+        vectors = [chunk.vector.tolist() for chunk in chunks]
+    elif texts:
+        vectors = get_langchain_embeddings().embed_documents(texts)
+    else:
+        vectors = []
+
+    return chunker, texts, spans, vectors
+
+
+class JobTracker:
+    """Persists progress of an indexing job and keeps its heartbeat alive."""
+
+    def __init__(self, job_id: UUID, meta: FileMeta):
+        self.job_id = job_id
+        self.meta = meta
+        # Stages interleave while the document streams, time is summed up
+        self.stage_timings: dict[str, float] = {}
+        self._stage: str | None = None
+        self._heartbeat: asyncio.Task | None = None
+
+    async def update(self, **values: Any) -> None:
+        async with session_manager.session() as session:
+            await update_indexing_job(session, self.job_id, **values)
+            await session.commit()
+
+    @asynccontextmanager
+    async def stage(self, name: str) -> AsyncIterator[None]:
+        if self._stage != name:
+            self._stage = name
+            await self.update(stage=name)
+        start = time.perf_counter()
+
+        yield
+
+        elapsed = time.perf_counter() - start
+        self.stage_timings[name] = round(self.stage_timings.get(name, 0.0) + elapsed, 3)
+        await self.update(stage_timings=dict(self.stage_timings))
+        logger.debug(f"{self.meta.filename}: {name} took {elapsed:.2f}s")
+
+    async def _beat(self) -> None:
+        while True:
+            await asyncio.sleep(config.indexing_job_lease_seconds / 3)
+            await self.update()
+
+    async def __aenter__(self) -> "JobTracker":
+        self._heartbeat = asyncio.create_task(self._beat())
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        if self._heartbeat is not None:
+            self._heartbeat.cancel()
+            self._heartbeat = None
+
+
+async def iter_document_pages(
+    file: PdfSource, tracker: JobTracker
+) -> AsyncIterator[list[tuple[int, str]]]:
+    """
+    Yields numbers and texts of consecutive page ranges in page order.
+
+    Ranges are extracted in parallel, but no more than `pdf_extraction_workers`
+    of them are extracted ahead of the consumer to keep memory bounded.
+    """
+    loop = asyncio.get_running_loop()
+    executor = get_pdf_executor()
+
+    pages_total = await loop.run_in_executor(executor, count_pages, file)
+    await tracker.update(pages_total=pages_total)
+
+    ranges = iter(page_ranges(pages_total, config.pdf_pages_per_task))
+    in_flight: deque[asyncio.Future] = deque()
+
+    def submit() -> None:
+        for start, stop in islice(
+            ranges, config.pdf_extraction_workers - len(in_flight)
+        ):
+            in_flight.append(
+                loop.run_in_executor(executor, extract_pages, file, start, stop)
+            )
+
+    try:
+        submit()
+        while in_flight:
+            async with tracker.stage("parsing"):
+                pages = await in_flight.popleft()
+            submit()
+            yield pages
+    finally:
+        for future in in_flight:
+            future.cancel()
+
+
+async def _save_chunks(
+    user_id: UUID,
+    meta: FileMeta,
+    tracker: JobTracker,
+    chunks: list[str],
+    pages: list[PageSpan],
+    vectors: list[list[float]],
+    pages_processed: int,
+    chunks_written: int,
+    final: bool = False,
+) -> None:
+    """
+    Saves a batch of chunks together with job progress.
+
+    The last batch is committed in the same transaction which marks the file
+    as indexed.
+    """
+    async with tracker.stage("saving"):
+        async with session_manager.session() as session:
+            await save_file_chunks(
+                session=session,
+                user_id=user_id,
+                meta=meta,
+                chunks=chunks,
+                vectors=vectors,
+                pages=pages,
+            )
+            await update_indexing_job(
+                session,
+                tracker.job_id,
+                pages_processed=pages_processed,
+                chunks_written=chunks_written,
+            )
+            if final:
+                await set_indexed(
+                    session=session,
+                    user_id=user_id,
+                    file_id=meta.file_id,
+                )
+            await session.commit()
+
+
+async def index_document(
+    user_id: UUID, file: PdfSource, meta: FileMeta, tracker: JobTracker
+) -> None:
+    """
+    Streams the document through extraction, chunking and saving.
+
+    Pages are chunked as soon as their range is extracted and chunks are saved
+    batch by batch, so neither the whole text nor all embeddings are ever kept
+    in memory.
+    """
+    logger.debug(f"Starting indexation process for {meta.filename}")
+    loop = asyncio.get_running_loop()
+    executor = get_indexing_executor()
+
+    async with session_manager.session() as session:
+        # Leftovers of an interrupted attempt
+        await delete_file_chunks(
             session=session,
             user_id=user_id,
+            filename=meta.filename,
             file_id=meta.file_id,
         )
-        logger.debug(f"Ended indexation process for {meta.filename}")
         await session.commit()
+
+    chunker = None
+    pages_processed = 0
+    chunks_written = 0
+
+    pages_stream = iter_document_pages(file, tracker)
+    async with aclosing(pages_stream):
+        async for pages in pages_stream:
+            async with tracker.stage("chunking"):
+                chunker, chunks, spans, vectors = await loop.run_in_executor(
+                    executor, _chunk_pages, chunker, pages, False
+                )
+            pages_processed += len(pages)
+            chunks_written += len(chunks)
+            if chunks:
+                await _save_chunks(
+                    user_id,
+                    meta,
+                    tracker,
+                    chunks,
+                    spans,
+                    vectors,
+                    pages_processed,
+                    chunks_written,
+                )
+
+    async with tracker.stage("chunking"):
+        chunker, chunks, spans, vectors = await loop.run_in_executor(
+            executor, _chunk_pages, chunker, [], True
+        )
+    chunks_written += len(chunks)
+    await _save_chunks(
+        user_id,
+        meta,
+        tracker,
+        chunks,
+        spans,
+        vectors,
+        pages_processed,
+        chunks_written,
+        final=True,
+    )
+
+    async with session_manager.session() as session:
         await session.execute(text("ANALYZE chunks;"))
+        await session.commit()
+
+    logger.info(f"Indexed {meta.filename}: {tracker.stage_timings}")
+
+
+async def clone_document_index(
+    user_id: UUID, meta: FileMeta, source: FileMeta, tracker: JobTracker
+) -> bool:
+    """
+    Copies chunks of an indexed file with the same content.
+
+    :return: False if the source has no chunks anymore (it was deleted or is
+        being re-indexed since it was found), nothing is changed then
+    """
+    async with tracker.stage("cloning"):
+        async with session_manager.session() as session:
+            await delete_file_chunks(
+                session=session,
+                user_id=user_id,
+                filename=meta.filename,
+                file_id=meta.file_id,
+            )
+            chunks_written = await clone_file_chunks(
+                session, source.file_id, user_id, meta
+            )
+            if not chunks_written:
+                await session.rollback()
+                return False
+
+            await update_indexing_job(
+                session, tracker.job_id, chunks_written=chunks_written
+            )
+            await set_indexed(session=session, user_id=user_id, file_id=meta.file_id)
+            await session.commit()
+
+    logger.info(f"Cloned index of {source.filename} for {meta.filename}")
+    return True
+
+
+async def run_indexing_job(job_id: UUID | None = None) -> bool:
+    """
+    Claims an indexing job and runs it.
+
+    :param job_id: Specific job to run, any pending job if omitted
+    :return: False if there was no job to claim
+    """
+    async with session_manager.session() as session:
+        job = await claim_indexing_job(session, job_id)
+        if job is None:
+            return False
+        job_id, user_id, attempts = job.id, job.user_id, job.attempts
+        db_meta = await find_file_meta(session, user_id, job.file_id)
+        db_copy = await find_indexed_copy(
+            session, db_meta.file_id, db_meta.content_hash
+        )
+        await session.commit()
+
+    meta = FileMeta(
+        file_id=db_meta.file_id,
+        filename=db_meta.filename,
+        is_indexed=db_meta.is_indexed,
+    )
+
+    tracker = JobTracker(job_id, meta)
+    try:
+        async with tracker:
+            if db_copy is not None:
+                source = FileMeta(
+                    file_id=db_copy.file_id,
+                    filename=db_copy.filename,
+                    is_indexed=db_copy.is_indexed,
+                )
+                cloned = await clone_document_index(user_id, meta, source, tracker)
+            else:
+                cloned = False
+
+            if not cloned:
+                file_path = await storage.exists(user_id, meta)
+                if file_path is None:
+                    raise FileNotFoundError(
+                        f"File {meta.file_id} is missing in storage"
+                    )
+
+                # Workers open the file themselves, its content never enters
+                # this process
+                await index_document(user_id, file_path, meta, tracker)
+
+            await tracker.update(
+                status=IndexingStatus.done, stage=None, finished_at=utcnow()
+            )
+    except Exception as err:
+        logger.exception(f"Indexing of {meta.filename} failed (attempt {attempts})")
+        failed = attempts >= config.indexing_max_attempts
+        await tracker.update(
+            status=IndexingStatus.failed if failed else IndexingStatus.queued,
+            error=str(err),
+            finished_at=utcnow() if failed else None,
+        )
+
+    return True
+
+
+async def run_indexing_worker() -> None:
+    """Processes indexing jobs until cancelled."""
+    while True:
+        try:
+            processed = await run_indexing_job()
+        except Exception:
+            logger.exception("Failed to claim an indexing job")
+            processed = False
+
+        if not processed:
+            await asyncio.sleep(config.indexing_poll_interval)
+
+
+async def run_indexing_workers() -> None:
+    await asyncio.gather(
+        *(run_indexing_worker() for _ in range(config.indexing_workers))
+    )
 
 
 def generate(
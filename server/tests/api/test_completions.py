@@ -1,8 +1,13 @@
 import json
 import time
+import uuid
 
 import pytest
 
+from server.api import completions
+from server.models import Action
+from server.utils.timings import StageTimer
+
 
 @pytest.mark.asyncio
 async def test_chat_completions(client, valid_pdf):
@@ -23,7 +28,7 @@ async def test_chat_completions(client, valid_pdf):
     while not indexing_done and retries < max_retries:
         status_response = await client.get(f"/api/files/{file_id}/status")
         if status_response.status_code == 200:
-            indexing_done = status_response.json()
+            indexing_done = status_response.json()["is_indexed"]
 
         if not indexing_done:
             retries += 1
@@ -73,3 +78,46 @@ async def test_chat_completions(client, valid_pdf):
 
     assert found_done, "Streaming response did not include [DONE] marker"
     assert response_text.strip(), "Response text is empty"
+
+
+@pytest.mark.asyncio
+async def test_chat_completions_not_indexed(client):
+    request_data = {
+        "file_id": str(uuid.uuid4()),
+        "messages": [{"role": "user", "content": "Что такое декоратор?"}],
+        "snippet": "",
+        "action": "default",
+    }
+
+    response = await client.post("/api/v1/chat/completions", json=request_data)
+
+    assert response.status_code == 500
+    assert "not indexed" in response.json()["detail"]
+
+
+@pytest.mark.asyncio
+async def test_retrieve_context_waits_for_indexing(monkeypatch):
+    async def embed_query(query):
+        return [1.0, 0.0]
+
+    async def retrieve_file_chunks(**kwargs):
+        raise AssertionError("Chunks of a file being indexed must not be read")
+
+    async def not_indexed():
+        return False
+
+    monkeypatch.setattr(completions, "embed_query", embed_query)
+    monkeypatch.setattr(completions, "retrieve_file_chunks", retrieve_file_chunks)
+
+    context = await completions.retrieve_context(
+        query="query",
+        user_id=uuid.uuid4(),
+        file_id=uuid.uuid4(),
+        action=Action.default,
+        snippet=None,
+        timer=StageTimer(),
+        indexed=not_indexed(),
+    )
+
+    assert context.chunks == []
+    assert context.query_vector == [1.0, 0.0]
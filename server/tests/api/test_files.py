@@ -1,3 +1,4 @@
+import hashlib
 import uuid
 from io import BytesIO
 from pathlib import Path
@@ -6,7 +7,10 @@ from urllib.parse import quote
 import fitz
 import pytest
 
+from server.api import files as files_api
 from server.config import config
+from server.file_storage import LocalFileStorage
+from server.models import FileMeta
 
 
 @pytest.mark.asyncio
@@ -28,6 +32,25 @@ async def test_upload_pdf_file(client, valid_pdf):
     assert response.json()[0]["filename"] == "test.pdf"
 
 
+@pytest.mark.asyncio
+async def test_upload_leaves_indexing_to_worker(client, valid_pdf, monkeypatch):
+    """Without the in-process worker uploads only enqueue indexing jobs."""
+    started = []
+
+    async def run_indexing_job(job_id=None):
+        started.append(job_id)
+        return True
+
+    monkeypatch.setattr(config, "run_indexing_worker", False)
+    monkeypatch.setattr(files_api, "run_indexing_job", run_indexing_job)
+
+    files = [("files", ("test.pdf", valid_pdf, "application/pdf"))]
+    response = await client.post("/api/files", files=files)
+
+    assert response.status_code == 200
+    assert started == []
+
+
 @pytest.mark.asyncio
 async def test_upload_image_file(client):
     """Test uploading an invalid non-PDF file (PNG)."""
@@ -84,8 +107,43 @@ async def test_upload_many_pdfs(client, valid_pdf):
 
 
 @pytest.mark.asyncio
-async def test_upload_too_big_pdf(client):
-    pass
+async def test_upload_too_big_pdf(client, valid_pdf, monkeypatch):
+    monkeypatch.setattr(config, "max_file_size", 1)
+    too_big = valid_pdf + b"\0" * (1024 * 1024)
+    files = [
+        ("files", ("valid.pdf", valid_pdf, "application/pdf")),
+        ("files", ("big.pdf", too_big, "application/pdf")),
+    ]
+    response = await client.post("/api/files", files=files)
+
+    assert response.status_code == 413
+    # Received part of the upload is not left in the storage
+    assert not list((config.file_storage_path / "tmp").iterdir())
+
+
+@pytest.mark.asyncio
+async def test_upload_over_storage_limit(client, valid_pdf, monkeypatch):
+    monkeypatch.setattr(config, "max_storage_per_user", 0)
+    files = [("files", ("valid.pdf", valid_pdf, "application/pdf"))]
+    response = await client.post("/api/files", files=files)
+
+    assert response.status_code == 413
+    assert (await client.get("/api/files")).json() == []
+
+
+@pytest.mark.asyncio
+async def test_file_limit_counts_deleted_files(client, valid_pdf, monkeypatch):
+    monkeypatch.setattr(config, "max_files_per_user", 1)
+    files = [("files", ("valid.pdf", valid_pdf, "application/pdf"))]
+    response = await client.post("/api/files", files=files)
+    file_id = response.json()[0]["file_id"]
+
+    response = await client.post("/api/files", files=files)
+    assert response.status_code == 400
+
+    await client.delete(f"/api/files/{file_id}")
+    response = await client.post("/api/files", files=files)
+    assert response.status_code == 200
 
 
 @pytest.mark.asyncio
@@ -153,6 +211,41 @@ async def test_list_multiple_files(client, valid_pdf):
     assert "other.pdf" in response_files
 
 
+@pytest.mark.asyncio
+async def test_list_files_pages(client, valid_pdf):
+    files = [("files", (f"{i}.pdf", valid_pdf, "application/pdf")) for i in range(3)]
+    response = await client.post("/api/files", files=files)
+    assert response.status_code == 200
+
+    # The client is served from another origin
+    response = await client.get(
+        "/api/files",
+        params={"limit": 2},
+        headers={"Origin": "http://localhost:3000"},
+    )
+    assert response.status_code == 200
+    assert "X-Next-Cursor" in response.headers["Access-Control-Expose-Headers"]
+    first = response.json()
+    assert len(first) == 2
+    assert all(f["size"] == len(valid_pdf) for f in first)
+    assert all(f["status"] is not None for f in first)
+
+    cursor = response.headers["X-Next-Cursor"]
+    response = await client.get("/api/files", params={"limit": 2, "cursor": cursor})
+    second = response.json()
+    assert len(second) == 1
+    assert "X-Next-Cursor" not in response.headers
+
+    filenames = {f["filename"] for f in first + second}
+    assert filenames == {"0.pdf", "1.pdf", "2.pdf"}
+
+
+@pytest.mark.asyncio
+async def test_list_files_invalid_cursor(client):
+    response = await client.get("/api/files", params={"cursor": "not a cursor"})
+    assert response.status_code == 400
+
+
 @pytest.mark.asyncio
 async def test_delete_file(client, valid_pdf):
     """Test deleting a file."""
@@ -172,6 +265,54 @@ async def test_delete_file(client, valid_pdf):
     assert response.status_code == 404
 
 
+@pytest.mark.asyncio
+async def test_same_content_is_stored_once(client, valid_pdf):
+    file_ids = []
+    for name in ("first.pdf", "second.pdf"):
+        files = {"files": (name, valid_pdf, "application/pdf")}
+        response = await client.post("/api/files", files=files)
+        assert response.status_code == 200
+        file_ids.append(response.json()[0]["file_id"])
+
+    blobs = list((config.file_storage_path / "blobs").rglob("*.pdf"))
+    assert len(blobs) == 1
+    # The blob and both files are links to the same content
+    assert blobs[0].stat().st_nlink == 3
+
+    response = await client.delete(f"/api/files/{file_ids[0]}")
+    assert response.status_code == 200
+    assert blobs[0].stat().st_nlink == 2
+
+    response = await client.delete(f"/api/files/{file_ids[1]}")
+    assert response.status_code == 200
+    assert not blobs[0].exists()
+
+
+@pytest.mark.asyncio
+async def test_store_content_whose_blob_was_deleted():
+    storage = LocalFileStorage()
+    user_id = uuid.uuid4()
+    content_hash = hashlib.sha256(b"content").hexdigest()
+
+    async def store() -> Path:
+        tmp_path = storage.make_temp_path()
+        tmp_path.write_bytes(b"content")
+        meta = FileMeta(file_id=uuid.uuid4(), filename="a.pdf", is_indexed=False)
+        return await storage.write_file(user_id, meta, tmp_path, content_hash)
+
+    first = await store()
+    # The last file of the content was deleted while the next one was received
+    first.unlink()
+    blob_path = config.file_storage_path / "blobs" / content_hash[:2]
+    (blob_path / f"{content_hash}.pdf").unlink()
+
+    second = await store()
+
+    assert second.read_bytes() == b"content"
+    assert second.stat().st_nlink == 2
+    assert not list((config.file_storage_path / "tmp").iterdir())
+
+
 @pytest.mark.asyncio
 async def test_delete_nonexistent_file(client):
     """Test deleting a nonexistent file returns False."""
@@ -231,6 +372,35 @@ async def test_download_file_using_link(client, valid_pdf):
     assert len(response.content) > 0  # Проверим, что файл не пустой
 
 
+@pytest.mark.asyncio
+async def test_download_file_range(client, valid_pdf):
+    files = [("files", ("valid.pdf", valid_pdf, "application/pdf"))]
+    response = await client.post("/api/files", files=files)
+    file_id = response.json()[0]["file_id"]
+    signed_url = (await client.get(f"/api/files/{file_id}/signed-url")).json()
+
+    response = await client.get("/api" + signed_url, headers={"Range": "bytes=0-9"})
+    assert response.status_code == 206
+    assert response.headers["Content-Range"] == f"bytes 0-9/{len(valid_pdf)}"
+    assert response.content == valid_pdf[:10]
+
+
+@pytest.mark.asyncio
+async def test_download_file_not_modified(client, valid_pdf):
+    files = [("files", ("valid.pdf", valid_pdf, "application/pdf"))]
+    response = await client.post("/api/files", files=files)
+    file_id = response.json()[0]["file_id"]
+    signed_url = (await client.get(f"/api/files/{file_id}/signed-url")).json()
+
+    response = await client.get("/api" + signed_url)
+    etag = response.headers["ETag"]
+    assert etag == f'"{hashlib.sha256(valid_pdf).hexdigest()}"'
+
+    response = await client.get("/api" + signed_url, headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+
+
 # @pytest.mark.asyncio
 # async def test_download_file_link_expired(client, valid_pdf):
 #     """Test downloading file with expired signed URL."""
@@ -18,7 +18,10 @@ async def test_history_with_shortcut(
     # Шаг 2: дожидаемся индексации
     for _ in range(30):
         status_response = await client.get(f"/api/files/{file_id}/status")
-        if status_response.status_code == 200 and status_response.json() is True:
+        if (
+            status_response.status_code == 200
+            and status_response.json()["is_indexed"] is True
+        ):
             break
         time.sleep(1)
     else:
@@ -0,0 +1,67 @@
+import time
+from uuid import uuid4
+
+import pytest
+
+from server.database.answer_cache import AnswerCache, CachedAnswer
+from server.database.chunk_cache import RetrievedChunk
+from server.models import Action
+
+KEY = (uuid4(), uuid4())
+ANSWER = CachedAnswer("answer", [RetrievedChunk(uuid4(), "context")])
+
+
+def test_similar_question_hits():
+    cache = AnswerCache(max_entries=10, ttl=60, threshold=0.95)
+    cache.put(KEY, Action.default, None, [1.0, 0.0, 0.0], ANSWER)
+
+    assert cache.get(KEY, Action.default, "", [0.99, 0.05, 0.0]) == ANSWER
+    assert cache.get(KEY, Action.default, None, [0.0, 1.0, 0.0]) is None
+    assert cache.metrics().hit_rate == pytest.approx(0.5)
+
+
+def test_answers_are_not_shared():
+    cache = AnswerCache(max_entries=10, ttl=60, threshold=0.95)
+    cache.put(KEY, Action.explain, "snippet", [1.0, 0.0], ANSWER)
+
+    assert cache.get(KEY, Action.default, "snippet", [1.0, 0.0]) is None
+    assert cache.get(KEY, Action.explain, "other", [1.0, 0.0]) is None
+    assert cache.get((KEY[0], uuid4()), Action.explain, "snippet", [1.0, 0.0]) is None
+    assert cache.get(KEY, Action.explain, "snippet", [1.0, 0.0]) == ANSWER
+
+
+def test_answers_expire():
+    cache = AnswerCache(max_entries=10, ttl=0.01, threshold=0.95)
+    cache.put(KEY, Action.default, None, [1.0, 0.0], ANSWER)
+    time.sleep(0.05)
+
+    assert cache.get(KEY, Action.default, None, [1.0, 0.0]) is None
+    assert len(cache) == 0
+
+
+def test_least_recently_used_are_evicted():
+    cache = AnswerCache(max_entries=2, ttl=60, threshold=0.95)
+    first = CachedAnswer("first", [])
+    cache.put(KEY, Action.default, None, [1.0, 0.0], first)
+    cache.put(KEY, Action.default, None, [0.0, 1.0], ANSWER)
+    # The first answer is used after the second one
+    assert cache.get(KEY, Action.default, None, [1.0, 0.0]) == first
+
+    cache.put(KEY, Action.default, None, [-1.0, 0.0], ANSWER)
+
+    assert len(cache) == 2
+    assert cache.get(KEY, Action.default, None, [1.0, 0.0]) == first
+    assert cache.get(KEY, Action.default, None, [0.0, 1.0]) is None
+
+
+def test_invalidate_file():
+    cache = AnswerCache(max_entries=10, ttl=60, threshold=0.95)
+    other = (KEY[0], uuid4())
+    cache.put(KEY, Action.default, None, [1.0, 0.0], ANSWER)
+    cache.put(KEY, Action.explain, "snippet", [1.0, 0.0], ANSWER)
+    cache.put(other, Action.default, None, [1.0, 0.0], ANSWER)
+
+    cache.invalidate(KEY)
+
+    assert len(cache) == 1
+    assert cache.get(other, Action.default, None, [1.0, 0.0]) == ANSWER
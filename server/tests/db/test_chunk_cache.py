@@ -0,0 +1,109 @@
+from uuid import uuid4
+
+import numpy as np
+import pytest
+
+from server.config import DistanceMetric, config
+from server.database import (
+    delete_file_meta,
+    find_file_chunks,
+    retrieve_file_chunks,
+    save_file_chunks,
+)
+from server.database.chunk_cache import ChunkCache, FileChunks, chunk_cache
+
+
+def random_chunks(count: int, dim: int = 8, seed: int = 0, **kwargs) -> FileChunks:
+    rng = np.random.default_rng(seed)
+    return FileChunks(
+        ids=[uuid4() for _ in range(count)],
+        texts=[str(i) for i in range(count)],
+        vectors=rng.normal(size=(count, dim)),
+        **kwargs,
+    )
+
+
+@pytest.mark.parametrize("metric", list(DistanceMetric))
+def test_search_is_exact(metric):
+    chunks = random_chunks(100, metric=metric)
+    vectors = np.random.default_rng(0).normal(size=(100, 8))
+    query = np.random.default_rng(1).normal(size=8)
+
+    if metric == DistanceMetric.cosine:
+        expected = 1 - vectors @ query / np.linalg.norm(vectors, axis=1)
+    elif metric == DistanceMetric.l2:
+        expected = np.linalg.norm(vectors - query, axis=1)
+    else:
+        expected = -vectors @ query
+
+    found = chunks.search(query.tolist(), limit=5)
+    assert [chunk.chunk_text for chunk in found] == [
+        str(i) for i in np.argsort(expected)[:5]
+    ]
+    assert len(chunks.search(query.tolist(), limit=500)) == 100
+    assert FileChunks([], [], []).search(query.tolist(), limit=5) == []
+
+
+def test_cache_evicts_least_recently_used():
+    size = random_chunks(10).nbytes
+    cache = ChunkCache(max_bytes=2 * size)
+    keys = [(uuid4(), uuid4()) for _ in range(3)]
+
+    cache.put(keys[0], random_chunks(10))
+    cache.put(keys[1], random_chunks(10))
+    assert cache.get(keys[0]) is not None
+
+    cache.put(keys[2], random_chunks(10))
+    assert keys[1] not in cache
+    assert keys[0] in cache and keys[2] in cache
+    assert cache.nbytes == 2 * size
+
+    cache.invalidate(keys[0])
+    assert keys[0] not in cache
+    assert cache.nbytes == size
+
+    # Files over the whole budget are not cached
+    cache.put(keys[0], random_chunks(30))
+    assert keys[0] not in cache
+
+
+@pytest.mark.asyncio
+async def test_retrieve_file_chunks_from_cache(test_chunks_session):
+    session, user_id, file_meta = test_chunks_session
+    key = (user_id, file_meta.file_id)
+    chunk_cache.clear()
+
+    chunks = ["find me please", "just noise", "also find me"]
+    await save_file_chunks(session, user_id, file_meta, chunks)
+    await session.commit()
+
+    found = await retrieve_file_chunks(session, "find", user_id, file_meta.file_id)
+    assert key in chunk_cache
+
+    expected = await find_file_chunks(session, "find", user_id, file_meta.file_id)
+    assert [chunk.id for chunk in found] == [chunk.id for chunk in expected]
+
+    await delete_file_meta(session, user_id, file_meta.file_id)
+    assert key not in chunk_cache
+
+
+@pytest.mark.asyncio
+async def test_big_files_are_not_cached(test_chunks_session, monkeypatch):
+    session, user_id, file_meta = test_chunks_session
+    monkeypatch.setattr(config, "exact_search_max_chunks", 1)
+    chunk_cache.clear()
+
+    await save_file_chunks(session, user_id, file_meta, ["first", "second"])
+    await session.commit()
+
+    found = await retrieve_file_chunks(session, "first", user_id, file_meta.file_id)
+    assert len(found) == 2
+    assert (user_id, file_meta.file_id) not in chunk_cache
+
+
+@pytest.mark.asyncio
+async def test_retrieve_from_file_without_chunks(test_chunks_session):
+    session, user_id, file_meta = test_chunks_session
+    chunk_cache.clear()
+
+    assert await retrieve_file_chunks(session, "find", user_id, file_meta.file_id) == []
@@ -1,9 +1,14 @@
 import pytest
 
+from server.config import config
 from server.database.crud import (
     DBChunk,
+    FileMeta,
+    add_file_meta,
+    clone_file_chunks,
     delete_file_chunks,
     find_file_chunks,
+    find_indexed_copy,
     save_file_chunks,
     select,
 )
@@ -59,3 +64,99 @@ async def test_delete_file_chunks(test_chunks_session):
     results = result.scalars().all()
 
     assert len(results) == 0
+
+
+@pytest.mark.asyncio
+async def test_save_file_chunks_keeps_vectors(test_chunks_session):
+    session, user_id, file_meta = test_chunks_session
+
+    chunks = ["первый чанк", "second chunk"]
+    vectors = [[0.5] * 1024, [-1.25] * 1024]
+    await save_file_chunks(
+        session, user_id, file_meta, chunks, vectors, pages=[(1, 2), (2, 2)]
+    )
+    await session.commit()
+
+    stmt = select(DBChunk).filter_by(user_id=user_id).order_by(DBChunk.chunk_text)
+    result = await session.execute(stmt)
+    results = result.scalars().all()
+
+    assert [r.chunk_text for r in results] == ["second chunk", "первый чанк"]
+    assert list(results[0].embedding) == vectors[1]
+    assert list(results[1].embedding) == vectors[0]
+    assert [(r.page_start, r.page_end) for r in results] == [(2, 2), (1, 2)]
+    assert all(r.created_at is not None for r in results)
+
+
+@pytest.mark.asyncio
+async def test_find_file_chunks_with_vector_index(test_chunks_session, monkeypatch):
+    session, user_id, file_meta = test_chunks_session
+    monkeypatch.setattr(config, "exact_search_max_chunks", 0)
+
+    other_meta = await add_file_meta(session, user_id, "other.pdf")
+    await save_file_chunks(
+        session,
+        user_id,
+        FileMeta(
+            file_id=other_meta.file_id,
+            filename=other_meta.filename,
+            is_indexed=other_meta.is_indexed,
+        ),
+        ["find me please"] * 10,
+    )
+    chunks = ["find me please", "just noise", "also find me"]
+    await save_file_chunks(session, user_id, file_meta, chunks)
+    await session.commit()
+
+    results = await find_file_chunks(
+        session, "find me please", user_id, file_meta.file_id
+    )
+    assert len(results) == 3
+    assert all(r.file_id == file_meta.file_id for r in results)
+    assert results[0].chunk_text == "find me please"
+
+
+@pytest.mark.asyncio
+async def test_clone_file_chunks(test_chunks_session):
+    session, user_id, file_meta = test_chunks_session
+
+    source_meta = await add_file_meta(session, user_id, "source.pdf", "hash")
+    source_meta.is_indexed = True
+    copy_meta = await add_file_meta(session, user_id, "copy.pdf", "hash")
+    vectors = [[0.5] * 1024, [-1.25] * 1024]
+    await save_file_chunks(
+        session,
+        user_id,
+        FileMeta(
+            file_id=source_meta.file_id,
+            filename=source_meta.filename,
+            is_indexed=True,
+        ),
+        ["first", "second"],
+        vectors,
+        pages=[(1, 1), (1, 3)],
+    )
+    await session.commit()
+
+    found = await find_indexed_copy(session, copy_meta.file_id, "hash")
+    assert found.file_id == source_meta.file_id
+    assert await find_indexed_copy(session, source_meta.file_id, "hash") is None
+    assert await find_indexed_copy(session, copy_meta.file_id, None) is None
+
+    copy = FileMeta(
+        file_id=copy_meta.file_id, filename=copy_meta.filename, is_indexed=False
+    )
+    assert await clone_file_chunks(session, source_meta.file_id, user_id, copy) == 2
+    await session.commit()
+
+    stmt = (
+        select(DBChunk)
+        .filter_by(file_id=copy_meta.file_id)
+        .order_by(DBChunk.chunk_text)
+    )
+    result = await session.execute(stmt)
+    results = result.scalars().all()
+    assert [r.chunk_text for r in results] == ["first", "second"]
+    assert [list(r.embedding) for r in results] == vectors
+    assert [(r.page_start, r.page_end) for r in results] == [(1, 1), (1, 3)]
+    assert all(r.filename == "copy.pdf" for r in results)
@@ -0,0 +1,54 @@
+import pytest
+
+from server.database import (
+    add_file_meta,
+    add_indexing_job,
+    delete_file_meta,
+    get_file_usage,
+    list_file_meta,
+)
+from server.models import IndexingStatus
+
+
+@pytest.mark.asyncio
+async def test_list_file_meta_pages(test_chunks_session):
+    session, user_id, file_meta = test_chunks_session
+
+    for i in range(4):
+        await add_file_meta(session, user_id, f"{i}.pdf", size=i)
+    await add_indexing_job(session, user_id, file_meta.file_id)
+    await session.commit()
+
+    rows = await list_file_meta(session, user_id)
+    assert len(rows) == 5
+    statuses = {meta.file_id: status for meta, status in rows}
+    assert statuses[file_meta.file_id] == IndexingStatus.queued
+    assert sum(status is None for status in statuses.values()) == 4
+
+    first = await list_file_meta(session, user_id, limit=3)
+    last, _ = first[-1]
+    second = await list_file_meta(
+        session, user_id, limit=3, after=(last.created_at, last.file_id)
+    )
+    assert len(first) == 3
+    assert len(second) == 2
+    assert [meta.file_id for meta, _ in first + second] == [
+        meta.file_id for meta, _ in rows
+    ]
+
+
+@pytest.mark.asyncio
+async def test_file_usage(test_chunks_session):
+    session, user_id, _ = test_chunks_session
+    files_count, files_bytes = await get_file_usage(session, user_id)
+
+    meta = await add_file_meta(session, user_id, "big.pdf", size=100)
+    await session.commit()
+    assert await get_file_usage(session, user_id) == (
+        files_count + 1,
+        files_bytes + 100,
+    )
+
+    await delete_file_meta(session, user_id, meta.file_id)
+    await session.commit()
+    assert await get_file_usage(session, user_id) == (files_count, files_bytes)
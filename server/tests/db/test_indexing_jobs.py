@@ -0,0 +1,92 @@
+from datetime import timedelta
+
+import pytest
+
+from server.config import config
+from server.database import (
+    add_indexing_job,
+    claim_indexing_job,
+    find_indexing_job,
+    update_indexing_job,
+)
+from server.models import IndexingStatus
+
+
+@pytest.mark.asyncio
+async def test_claim_indexing_job(test_chunks_session):
+    session, user_id, file_meta = test_chunks_session
+
+    job = await add_indexing_job(session, user_id, file_meta.file_id)
+    await session.commit()
+    assert job.status == IndexingStatus.queued
+
+    claimed = await claim_indexing_job(session)
+    await session.commit()
+
+    assert claimed.id == job.id
+    assert claimed.status == IndexingStatus.running
+    assert claimed.attempts == 1
+
+    # Running job with fresh heartbeat is not claimed twice
+    assert await claim_indexing_job(session) is None
+
+
+@pytest.mark.asyncio
+async def test_claim_interrupted_indexing_job(test_chunks_session):
+    session, user_id, file_meta = test_chunks_session
+
+    job = await add_indexing_job(session, user_id, file_meta.file_id)
+    claimed = await claim_indexing_job(session, job.id)
+    await session.commit()
+
+    # Emulate a worker which died long ago
+    claimed.heartbeat_at -= timedelta(days=1)
+    await session.commit()
+
+    resumed = await claim_indexing_job(session, job.id)
+    await session.commit()
+
+    assert resumed.id == job.id
+    assert resumed.attempts == 2
+
+
+@pytest.mark.asyncio
+async def test_interrupted_indexing_job_fails_after_max_attempts(
+    test_chunks_session, monkeypatch
+):
+    session, user_id, file_meta = test_chunks_session
+    monkeypatch.setattr(config, "indexing_max_attempts", 1)
+
+    job = await add_indexing_job(session, user_id, file_meta.file_id)
+    claimed = await claim_indexing_job(session, job.id)
+    await session.commit()
+
+    # The document killed its worker on the only attempt
+    claimed.heartbeat_at -= timedelta(days=1)
+    await session.commit()
+
+    assert await claim_indexing_job(session, job.id) is None
+    await session.commit()
+    session.expire_all()
+
+    db_job = await find_indexing_job(session, user_id, file_meta.file_id)
+    assert db_job.status == IndexingStatus.failed
+    assert db_job.finished_at is not None
+
+
+@pytest.mark.asyncio
+async def test_update_indexing_job(test_chunks_session):
+    session, user_id, file_meta = test_chunks_session
+
+    job = await add_indexing_job(session, user_id, file_meta.file_id)
+    await session.commit()
+
+    assert await update_indexing_job(
+        session, job.id, status=IndexingStatus.done, chunks_written=3
+    )
+    await session.commit()
+    session.expire_all()
+
+    db_job = await find_indexing_job(session, user_id, file_meta.file_id)
+    assert db_job.status == IndexingStatus.done
+    assert db_job.chunks_written == 3
@@ -0,0 +1,146 @@
+import numpy as np
+import pytest
+import sqlalchemy as db
+
+from server.config import DistanceMetric, VectorIndexType, config, secrets
+from server.database import (
+    add_file_meta,
+    get_user_by_email,
+    save_file_chunks,
+    session_manager,
+)
+from server.database.models import EMBEDDING_OPCLASSES
+from server.database.vector_index import (
+    chunk_search,
+    describe_index,
+    expected_index,
+    rebuild_index,
+    set_search_params,
+    uses_exact_search,
+)
+from server.models import FileMeta
+
+
+async def add_chunks(session) -> tuple:
+    user = await get_user_by_email(
+        session, email=secrets.default_admin_email.get_secret_value()
+    )
+    db_meta = await add_file_meta(session, user.id, "test.pdf")
+    meta = FileMeta(
+        file_id=db_meta.file_id,
+        filename=db_meta.filename,
+        is_indexed=db_meta.is_indexed,
+    )
+    await save_file_chunks(session, user.id, meta, ["first", "second"])
+    await session.commit()
+    return user.id, meta.file_id
+
+
+async def explain_search(session, user_id, file_id, exact=False) -> str:
+    query_vector = np.random.default_rng(0).normal(size=1024).tolist()
+    stmt = chunk_search(query_vector, user_id, file_id, limit=5, exact=exact)
+    compiled = stmt.compile(
+        dialect=session.bind.dialect, compile_kwargs={"literal_binds": True}
+    )
+
+    # Tiny table is cheaper to scan, but the planner must be able to use the index
+    await session.execute(db.text("SET LOCAL enable_seqscan = off"))
+    result = await session.execute(db.text(f"EXPLAIN {compiled}"))
+    return "\n".join(result.scalars().all())
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("metric", list(DistanceMetric))
+async def test_search_uses_vector_index(postgres_url, monkeypatch, metric):
+    # Index is first built for another metric and has to be rebuilt
+    other = next(m for m in DistanceMetric if m != metric)
+    monkeypatch.setattr(config, "embeddings_distance", other)
+    await session_manager.init_db(postgres_url)
+    await session_manager.close()
+
+    monkeypatch.setattr(config, "embeddings_distance", metric)
+    await session_manager.init_db(postgres_url)
+    try:
+        async with session_manager.session() as session:
+            index = await describe_index(await session.connection())
+            assert index.opclass == EMBEDDING_OPCLASSES[metric]
+
+            user_id, file_id = await add_chunks(session)
+            plan = await explain_search(session, user_id, file_id)
+            assert "chunks_embedding_idx" in plan
+    finally:
+        await session_manager.close()
+
+
+@pytest.mark.asyncio
+async def test_rebuild_index(postgres_url, monkeypatch):
+    monkeypatch.setattr(config, "vector_index_type", VectorIndexType.ivfflat)
+    await session_manager.init_db(postgres_url)
+    await session_manager.close()
+
+    # Changed index type is not applied on startup
+    monkeypatch.setattr(config, "vector_index_type", VectorIndexType.hnsw)
+    monkeypatch.setattr(config, "hnsw_m", 8)
+    await session_manager.init_db(postgres_url)
+    try:
+        async with session_manager.session() as session:
+            user_id, file_id = await add_chunks(session)
+            index = await describe_index(await session.connection())
+            assert index.method == "ivfflat"
+            await session.commit()
+
+        await rebuild_index(session_manager.engine, concurrently=True)
+
+        async with session_manager.session() as session:
+            index = await describe_index(await session.connection())
+            assert index == expected_index()
+            assert index.options["m"] == "8"
+
+            plan = await explain_search(session, user_id, file_id)
+            assert "chunks_embedding_idx" in plan
+    finally:
+        await session_manager.close()
+
+
+@pytest.mark.asyncio
+async def test_set_search_params(db_session, monkeypatch):
+    session, _ = db_session
+    monkeypatch.setattr(config, "hnsw_ef_search", 100)
+    monkeypatch.setattr(config, "ivfflat_probes", 7)
+
+    await set_search_params(session)
+
+    assert await session.scalar(db.text("SHOW hnsw.ef_search")) == "100"
+    assert await session.scalar(db.text("SHOW ivfflat.probes")) == "7"
+
+    # Parameters are local to the transaction
+    await session.rollback()
+    assert await session.scalar(db.text("SHOW hnsw.ef_search")) != "100"
+
+
+@pytest.mark.asyncio
+async def test_set_iterative_scan(db_session, monkeypatch):
+    session, _ = db_session
+    monkeypatch.setattr(config, "vector_iterative_scan", "strict_order")
+
+    await set_search_params(session)
+
+    assert await session.scalar(db.text("SHOW hnsw.iterative_scan")) == "strict_order"
+    assert (
+        await session.scalar(db.text("SHOW ivfflat.iterative_scan")) == "relaxed_order"
+    )
+
+
+@pytest.mark.asyncio
+async def test_exact_search_of_small_files(db_session, monkeypatch):
+    session, _ = db_session
+    user_id, file_id = await add_chunks(session)
+
+    monkeypatch.setattr(config, "exact_search_max_chunks", 2)
+    assert await uses_exact_search(session, user_id, file_id)
+    plan = await explain_search(session, user_id, file_id, exact=True)
+    assert "chunks_user_file_idx" in plan
+    assert "chunks_embedding_idx" not in plan
+
+    monkeypatch.setattr(config, "exact_search_max_chunks", 1)
+    assert not await uses_exact_search(session, user_id, file_id)
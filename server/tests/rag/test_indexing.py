@@ -0,0 +1,124 @@
+import pickle
+
+import numpy as np
+import pytest
+from sklearn.metrics.pairwise import cosine_similarity
+
+from server.rag.core import indexing
+from server.rag.core.indexing import (
+    SemanticChunker,
+    SentenceSplitter,
+    find_boundaries,
+    join_chunks,
+    pool_chunks,
+    split_sentences,
+)
+
+
+def reference_boundaries(embeddings: np.ndarray, threshold: float) -> list[int]:
+    boundaries = [0]
+    current = embeddings[0].reshape(1, -1)
+    for i in range(1, len(embeddings)):
+        similarity = cosine_similarity(current, embeddings[i].reshape(1, -1))[0][0]
+        if similarity >= threshold:
+            current = np.mean([embeddings[i].reshape(1, -1), current], axis=0)
+        else:
+            boundaries.append(i)
+            current = embeddings[i].reshape(1, -1)
+    return boundaries
+
+
+@pytest.mark.parametrize("threshold", [0.3, 0.5, 0.8])
+def test_find_boundaries_matches_reference(threshold):
+    rng = np.random.default_rng(42)
+    topics = rng.normal(size=(10, 32))
+    embeddings = topics[np.sort(rng.integers(0, 10, size=300))]
+    embeddings += 0.5 * rng.normal(size=embeddings.shape)
+
+    assert find_boundaries(embeddings, threshold) == reference_boundaries(
+        embeddings, threshold
+    )
+
+
+def test_join_chunks():
+    sentences = split_sentences("One. Two! Three? Four.")
+
+    assert join_chunks(sentences, [0, 2]) == ["One. Two!", "Three? Four."]
+    assert join_chunks(sentences, find_boundaries(np.ones((4, 3)), 0.8)) == [
+        "One. Two! Three? Four."
+    ]
+
+
+def test_pool_chunks():
+    embeddings = np.array([[1.0, 0.0], [3.0, 2.0], [0.0, 4.0]])
+
+    pooled = pool_chunks(embeddings, [0, 2])
+
+    assert np.allclose(pooled, [[2.0, 1.0], [0.0, 4.0]])
+
+
+def test_sentence_splitter_matches_whole_document():
+    pages = ["First page. It ends mid", "sentence. Second page!  ", "Third? Done."]
+    splitter = SentenceSplitter()
+
+    sentences = [s for page in pages for s in splitter.feed(page)]
+    sentences += splitter.flush()
+
+    assert sentences == split_sentences("\n".join(pages))
+
+
+def test_sentence_splitter_keeps_pages():
+    splitter = SentenceSplitter()
+
+    sentences = splitter.feed_page("First page. It ends mid", 1)
+    sentences += splitter.feed_page("page two", 2)
+    sentences += splitter.feed_page("sentence. Last one.", 3)
+    sentences += splitter.flush_page()
+
+    assert sentences == [
+        ("First page.", (1, 1)),
+        ("It ends mid\npage two\nsentence.", (1, 3)),
+        ("Last one.", (3, 3)),
+    ]
+
+
+class FakeEmbeddings:
+    """Sentences about cats point one way, all others the other."""
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return [[1.0, 0.0] if "Cat" in text else [0.0, 1.0] for text in texts]
+
+
+def test_chunker_state_does_not_load_model(monkeypatch):
+    created = []
+
+    def get_embeddings():
+        created.append(True)
+        return FakeEmbeddings()
+
+    monkeypatch.setattr(indexing, "get_langchain_embeddings", get_embeddings)
+    chunker = SemanticChunker(batch_size=2)
+
+    chunker = pickle.loads(pickle.dumps(chunker))
+    assert created == []
+
+    chunker.feed("One. Two. Three.")
+    chunker = pickle.loads(pickle.dumps(chunker))
+    assert created == [True]
+
+    assert [chunk.text for chunk in chunker.flush()] == ["One. Two. Three."]
+    assert len(created) == 2
+
+
+def test_chunker_keeps_page_ranges(monkeypatch):
+    monkeypatch.setattr(indexing, "get_langchain_embeddings", FakeEmbeddings)
+    chunker = SemanticChunker(batch_size=2)
+    pages = [(1, "Cat. Cat."), (2, "Cat. Elephant."), (3, "Elephant. Elephant.")]
+
+    chunks = [chunk for page_no, page in pages for chunk in chunker.feed(page, page_no)]
+    chunks += chunker.flush()
+
+    assert [(chunk.text, chunk.pages) for chunk in chunks] == [
+        ("Cat. Cat.\nCat.", (1, 2)),
+        ("Elephant.\nElephant. Elephant.", (2, 3)),
+    ]
@@ -0,0 +1,47 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import fitz
+import pytest
+
+from server.rag.pdf import iter_pdf_pages, page_ranges, read_pdf, smart_fix
+
+
+@pytest.fixture
+def multipage_pdf() -> bytes:
+    doc = fitz.open()
+    for number in range(1, 6):
+        page = doc.new_page()
+        page.insert_text((72, 72), f"Page number {number}.")
+    return doc.tobytes()
+
+
+def test_page_ranges():
+    assert page_ranges(5, 2) == [(0, 2), (2, 4), (4, 5)]
+    assert page_ranges(0, 2) == []
+
+
+def test_iter_pdf_pages_keeps_order(multipage_pdf):
+    sequential = list(iter_pdf_pages(multipage_pdf, pages_per_range=2))
+
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        parallel = list(iter_pdf_pages(multipage_pdf, executor, pages_per_range=2))
+
+    assert parallel == sequential
+    assert [number for number, _ in parallel] == [1, 2, 3, 4, 5]
+    assert "Page number 3." in parallel[2][1]
+
+
+def test_read_pdf_from_path(multipage_pdf, tmp_path):
+    path = tmp_path / "doc.pdf"
+    path.write_bytes(multipage_pdf)
+
+    assert read_pdf(path) == read_pdf(multipage_pdf)
+
+
+def test_smart_fix():
+    text = "Привет, мир! Ёлка №1."
+    broken = text.encode("cp1251").decode("latin1")
+
+    assert smart_fix(broken) == text
+    assert smart_fix(text) == text
+    assert smart_fix("Plain ASCII text.") == "Plain ASCII text."
@@ -0,0 +1,77 @@
+import numpy as np
+import pytest
+
+from server.utils.embedding_cache import EmbeddingCache
+
+
+def make_cache(tmp_path, **kwargs) -> EmbeddingCache:
+    options = {"namespace": "model", "shards": 4, "max_bytes": 1024 * 1024}
+    options.update(kwargs)
+    return EmbeddingCache(tmp_path, **options)
+
+
+@pytest.mark.parametrize("dtype", ["float16", "float32"])
+def test_roundtrip(tmp_path, dtype):
+    cache = make_cache(tmp_path, dtype=dtype)
+    vectors = np.random.default_rng(0).normal(size=(20, 8)).tolist()
+    texts = [f"text {i}" for i in range(20)]
+
+    cache.mset(list(zip(texts, vectors, strict=True)))
+    found = cache.mget([*texts, "missing"])
+
+    assert found[-1] is None
+    tolerance = 1e-2 if dtype == "float16" else 1e-6
+    np.testing.assert_allclose(found[:-1], vectors, rtol=tolerance, atol=tolerance)
+    assert cache.size == 20 * 8 * np.dtype(dtype).itemsize
+    assert cache.hits == 20 and cache.misses == 1
+
+    # Another process reads the same files
+    assert make_cache(tmp_path, dtype=dtype).mget(texts[:1])[0] == found[0]
+    # Vectors of another dtype are not mixed up
+    other = "float32" if dtype == "float16" else "float16"
+    assert make_cache(tmp_path, dtype=other).mget(texts[:1]) == [None]
+
+
+def test_overwrite_and_delete(tmp_path):
+    cache = make_cache(tmp_path, dtype="float32")
+    cache.mset([("a", [1.0, 2.0]), ("b", [3.0, 4.0])])
+    cache.mset([("a", [5.0, 6.0])])
+    assert cache.mget(["a"]) == [[5.0, 6.0]]
+    assert cache.size == 16
+
+    cache.mdelete(["a", "missing"])
+    assert cache.mget(["a", "b"]) == [None, [3.0, 4.0]]
+    assert cache.size == 8
+    assert len(list(cache.yield_keys())) == 1
+
+
+def test_least_recently_read_are_evicted(tmp_path):
+    # One shard of 10 float32 vectors of 2 dimensions
+    cache = make_cache(
+        tmp_path, shards=1, max_bytes=80, dtype="float32", touch_interval=0
+    )
+    cache.mset([(f"old {i}", [float(i), 0.0]) for i in range(10)])
+    assert cache.mget(["old 0"]) == [[0.0, 0.0]]
+
+    cache.mset([("new", [1.0, 1.0])])
+
+    assert cache.size == 72
+    assert cache.mget(["old 0", "new"]) == [[0.0, 0.0], [1.0, 1.0]]
+    others = cache.mget([f"old {i}" for i in range(1, 10)])
+    assert sum(vector is None for vector in others) == 2
+
+
+def test_reads_refresh_access_time_once_per_interval(tmp_path):
+    cache = make_cache(tmp_path, shards=1, dtype="float32")
+    cache.mset([("a", [1.0, 2.0])])
+    conn = cache._connection(0)
+    conn.execute("UPDATE embeddings SET accessed = 0")
+
+    cache.mget(["a"])
+    (accessed,) = conn.execute("SELECT accessed FROM embeddings").fetchone()
+    assert accessed > 0
+
+    # A fresh entry is read without a write
+    changes = conn.total_changes
+    cache.mget(["a"])
+    assert conn.total_changes == changes
@@ -0,0 +1,116 @@
+import asyncio
+import threading
+
+import pytest
+
+from server.embedding_server import handle
+from server.utils.embeddings import (
+    EmbeddingClient,
+    EmbeddingService,
+    Priority,
+    RemoteEmbeddings,
+)
+
+
+def blocking_model(batches: list, release: threading.Event):
+    def embed(texts):
+        batches.append(texts)
+        release.wait(timeout=5)
+        return [[float(len(text))] for text in texts]
+
+    return embed
+
+
+@pytest.mark.asyncio
+async def test_concurrent_requests_are_batched():
+    batches, release = [], threading.Event()
+    service = EmbeddingService(
+        blocking_model(batches, release), max_batch_size=3, max_wait=0
+    )
+
+    first = asyncio.create_task(service.embed(["a"], Priority.query))
+    await asyncio.sleep(0.1)
+    # Queued while the first batch is embedded
+    others = [
+        asyncio.create_task(service.embed(["b" * i], Priority.query))
+        for i in range(1, 5)
+    ]
+    await asyncio.sleep(0.1)
+    metrics = await service.metrics()
+    assert metrics.queue_depth == {"query": 4, "bulk": 0}
+    release.set()
+
+    assert await first == [[1.0]]
+    assert await asyncio.gather(*others) == [[[1.0]], [[2.0]], [[3.0]], [[4.0]]]
+    assert batches == [["a"], ["b", "bb", "bbb"], ["bbbb"]]
+
+    metrics = await service.metrics()
+    assert metrics.batches == 3
+    assert metrics.texts == 5
+    assert metrics.last_batch_size == 1
+
+
+@pytest.mark.asyncio
+async def test_queries_go_before_bulk():
+    batches, release = [], threading.Event()
+    service = EmbeddingService(
+        blocking_model(batches, release), max_batch_size=2, max_wait=0
+    )
+
+    blocker = asyncio.create_task(service.embed(["first"]))
+    await asyncio.sleep(0.1)
+    bulk = asyncio.create_task(service.embed(["d1", "d2", "d3"], Priority.bulk))
+    await asyncio.sleep(0)
+    query = asyncio.create_task(service.embed(["q"], Priority.query))
+    await asyncio.sleep(0.1)
+    release.set()
+
+    await asyncio.gather(blocker, bulk, query)
+    assert batches == [["first"], ["q", "d1"], ["d2", "d3"]]
+
+
+@pytest.mark.asyncio
+async def test_batch_waits_for_more_texts():
+    batches = []
+    release = threading.Event()
+    release.set()
+    service = EmbeddingService(
+        blocking_model(batches, release), max_batch_size=4, max_wait=0.2
+    )
+
+    async def late():
+        await asyncio.sleep(0.05)
+        return await service.embed(["late"])
+
+    await asyncio.gather(service.embed(["early"]), late())
+    assert batches == [["early", "late"]]
+
+
+@pytest.mark.asyncio
+async def test_errors_reach_every_caller():
+    def failing_model(texts):
+        raise RuntimeError("model is gone")
+
+    service = EmbeddingService(failing_model, max_wait=0)
+
+    with pytest.raises(RuntimeError, match="model is gone"):
+        await service.embed(["query"], Priority.query)
+
+
+@pytest.mark.asyncio
+async def test_sidecar(tmp_path):
+    service = EmbeddingService(lambda texts: [[1.5, -2.0] for _ in texts])
+    path = str(tmp_path / "embeddings.sock")
+    server = await asyncio.start_unix_server(
+        lambda reader, writer: handle(service, reader, writer), path=path
+    )
+    async with server:
+        client = EmbeddingClient(path)
+        assert await client.embed(["a", "b"], Priority.query) == [[1.5, -2.0]] * 2
+
+        remote = RemoteEmbeddings(path)
+        vectors = await asyncio.to_thread(remote.embed_documents, ["a", "b", "c"])
+        assert vectors == [[1.5, -2.0]] * 3
+
+        metrics = await client.metrics()
+        assert metrics.texts == 5
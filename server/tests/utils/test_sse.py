@@ -0,0 +1,97 @@
+import asyncio
+import json
+
+import pytest
+
+from server.models import (
+    ChatCompletionResponseStreamChoice,
+    ChatCompletionStreamResponse,
+)
+from server.utils.sse import chunk_frame, coalesce, replay
+
+
+async def stream(tokens, delay=0.0, produced=None):
+    for token in tokens:
+        if produced is not None:
+            produced.append(token)
+        yield token
+        await asyncio.sleep(delay)
+
+
+def test_chunk_frame_matches_response_model():
+    content = 'Привет, "мир"\n\t\\'
+    chunk = ChatCompletionStreamResponse(
+        model="null",
+        choices=[
+            ChatCompletionResponseStreamChoice(
+                delta={"content": content}, finish_reason=None, index=0
+            )
+        ],
+    )
+    data = chunk.model_dump_json(exclude_unset=True, exclude_none=True)
+
+    assert chunk_frame(content) == f"event: chunk\ndata: {data}\n\n"
+    assert json.loads(chunk_frame(content).split("data: ")[1]) == json.loads(data)
+
+
+@pytest.mark.asyncio
+async def test_tokens_are_joined():
+    tokens = [f"t{i} " for i in range(10)]
+
+    frames = [f async for f in coalesce(stream(tokens), max_wait=1, max_size=12)]
+
+    # The first token is not delayed
+    assert frames[0] == "t0 "
+    assert "".join(frames) == "".join(tokens)
+    assert all(len(frame) <= 12 + 3 for frame in frames)
+    assert len(frames) < len(tokens)
+
+
+@pytest.mark.asyncio
+async def test_tokens_are_flushed_after_max_wait():
+    tokens = ["a", "b", "c"]
+
+    frames = [
+        f async for f in coalesce(stream(tokens, delay=0.1), max_wait=0.01, max_size=64)
+    ]
+
+    assert frames == tokens
+
+
+@pytest.mark.asyncio
+async def test_errors_are_raised_after_tokens():
+    async def failing():
+        yield "a"
+        yield "b"
+        raise ValueError("LLM failed")
+
+    frames = []
+    with pytest.raises(ValueError, match="LLM failed"):
+        async for frame in coalesce(failing(), max_wait=1, max_size=64):
+            frames.append(frame)
+
+    assert "".join(frames) == "ab"
+
+
+@pytest.mark.asyncio
+async def test_slow_client_pauses_reading():
+    produced = []
+    tokens = coalesce(
+        stream([str(i) for i in range(100)], produced=produced),
+        max_wait=0,
+        max_size=1,
+        max_pending=5,
+    )
+
+    assert await anext(tokens) == "0"
+    # The client does not read, the model is read only up to the queue size
+    await asyncio.sleep(0.1)
+    assert len(produced) <= 1 + 5 + 1
+
+    await tokens.aclose()
+
+
+@pytest.mark.asyncio
+async def test_replay():
+    assert [p async for p in replay("abcdefg", 3)] == ["abc", "def", "g"]
+    assert [p async for p in replay("", 3)] == []
@@ -0,0 +1,143 @@
+import asyncio
+import time
+
+import pytest
+
+from server.utils.stream_sessions import (
+    MemoryStreamSessionStore,
+    RedisStreamSessionStore,
+)
+
+
+async def read_command(reader: asyncio.StreamReader) -> list[bytes]:
+    """Reads a command sent by a client, an array of bulk strings."""
+    count = int((await reader.readuntil(b"\r\n"))[1:-2])
+    args = []
+    for _ in range(count):
+        length = int((await reader.readuntil(b"\r\n"))[1:-2])
+        args.append((await reader.readexactly(length + 2))[:-2])
+    return args
+
+
+class FakeRedis:
+    """Stand-in for Redis with the commands used by the store."""
+
+    def __init__(self):
+        self.data: dict[bytes, tuple[float, bytes]] = {}
+        self.writers: list[asyncio.StreamWriter] = []
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.writers.append(writer)
+        null = b"$-1\r\n"
+        try:
+            while True:
+                try:
+                    command = await read_command(reader)
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    return
+                if command[0].upper() == b"HELLO":
+                    # RESP3 has a null of its own
+                    null = b"_\r\n"
+                    writer.write(b"%1\r\n$5\r\nproto\r\n:3\r\n")
+                else:
+                    writer.write(self.execute(command, null))
+                await writer.drain()
+        finally:
+            writer.close()
+
+    def execute(self, command: list[bytes], null: bytes) -> bytes:
+        name = command[0].upper()
+        if name == b"CLIENT":
+            return b"+OK\r\n"
+        if name == b"SET":
+            key, value, _, ttl = command[1:]
+            self.data[key] = (time.monotonic() + int(ttl) / 1000, value)
+            return b"+OK\r\n"
+        if name == b"GETDEL":
+            expires, value = self.data.pop(command[1], (0, None))
+            if value is None or expires <= time.monotonic():
+                return null
+            return b"$%d\r\n%s\r\n" % (len(value), value)
+        return b"-ERR unknown command\r\n"
+
+    def disconnect(self) -> None:
+        for writer in self.writers:
+            writer.close()
+        self.writers.clear()
+
+
+@pytest.fixture
+async def fake_redis():
+    fake = FakeRedis()
+    server = await asyncio.start_server(fake.handle, "127.0.0.1", 0)
+    fake.url = f"redis://127.0.0.1:{server.sockets[0].getsockname()[1]}/0"
+    async with server:
+        yield fake
+        fake.disconnect()
+
+
+@pytest.mark.asyncio
+async def test_memory_store_pops_once():
+    store = MemoryStreamSessionStore()
+
+    await store.put("a", b"value", ttl=10)
+
+    assert await store.pop("a") == b"value"
+    assert await store.pop("a") is None
+
+
+@pytest.mark.asyncio
+async def test_memory_store_reaps_expired():
+    store = MemoryStreamSessionStore(reap_interval=0.05)
+
+    await store.put("expired", b"value", ttl=0.01)
+    await store.put("valid", b"value", ttl=10)
+    await asyncio.sleep(0.2)
+
+    assert len(store) == 1
+    assert await store.pop("valid") == b"value"
+
+
+@pytest.mark.asyncio
+async def test_redis_store_is_shared(fake_redis):
+    # Stores of two workers
+    first = RedisStreamSessionStore(fake_redis.url)
+    second = RedisStreamSessionStore(fake_redis.url)
+
+    await first.put("a", b"\x00binary\r\nvalue", ttl=10)
+
+    assert await second.pop("a") == b"\x00binary\r\nvalue"
+    assert await first.pop("a") is None
+
+
+@pytest.mark.asyncio
+async def test_redis_store_expires(fake_redis):
+    store = RedisStreamSessionStore(fake_redis.url)
+
+    await store.put("a", b"value", ttl=0.01)
+    await asyncio.sleep(0.05)
+
+    assert await store.pop("a") is None
+
+
+@pytest.mark.asyncio
+async def test_redis_store_runs_commands_concurrently(fake_redis):
+    store = RedisStreamSessionStore(fake_redis.url, max_connections=8)
+
+    keys = [str(i) for i in range(32)]
+    await asyncio.gather(*(store.put(key, key.encode(), ttl=10) for key in keys))
+    values = await asyncio.gather(*(store.pop(key) for key in keys))
+
+    assert values == [key.encode() for key in keys]
+    assert 1 < len(fake_redis.writers) <= 8
+
+
+@pytest.mark.asyncio
+async def test_redis_store_reconnects(fake_redis):
+    store = RedisStreamSessionStore(fake_redis.url)
+    await store.put("a", b"value", ttl=10)
+
+    # Redis restarted or dropped idle connections
+    fake_redis.disconnect()
+
+    assert await store.pop("a") == b"value"
@@ -0,0 +1,43 @@
+import asyncio
+
+import pytest
+
+from server.utils.timings import StageStats, StageTimer
+
+
+@pytest.mark.asyncio
+async def test_timer_measures_stages():
+    timer = StageTimer()
+
+    assert await timer.measure("sleep", asyncio.sleep(0.05, result="done")) == "done"
+    timer.mark("first_token")
+    timer.mark("first_token")  # Only the first mark counts
+
+    assert 0.05 <= timer.stages["sleep"] < 1
+    assert timer.stages["first_token"] >= timer.stages["sleep"]
+
+
+@pytest.mark.asyncio
+async def test_failed_stages_are_not_recorded():
+    async def fail():
+        raise ValueError
+
+    timer = StageTimer()
+    with pytest.raises(ValueError):
+        await timer.measure("fail", fail())
+
+    assert timer.stages == {}
+
+
+def test_stats_percentiles():
+    stats = StageStats(window=100)
+    for i in range(1, 201):
+        timer = StageTimer()
+        timer.stages["stage"] = i / 1000
+        stats.record(timer)
+
+    metrics = stats.metrics().stages["stage"]
+    # Only the last 100 requests are kept
+    assert metrics.count == 100
+    assert metrics.p50_ms == pytest.approx(150.5)
+    assert metrics.max_ms == pytest.approx(200)
@@ -0,0 +1,6 @@
+from datetime import UTC, datetime
+
+
+def utcnow() -> datetime:
+    """Current UTC time without tzinfo, as stored in TIMESTAMP columns."""
+    return datetime.now(UTC).replace(tzinfo=None)
@@ -0,0 +1,242 @@
+"""Compact on-disk cache of text embeddings in sharded SQLite files."""
+
+import hashlib
+import sqlite3
+import threading
+import time
+from collections.abc import Iterator, Sequence
+from pathlib import Path
+
+import numpy as np
+from langchain_core.stores import BaseStore
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS embeddings (
+    key BLOB PRIMARY KEY,
+    value BLOB NOT NULL,
+    accessed REAL NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS embeddings_accessed_idx ON embeddings (accessed);
+CREATE TABLE IF NOT EXISTS stats (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    size INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO stats VALUES (0, 0);
+"""
+
+# Keys per statement, below the SQLite limit of bound parameters
+_MAX_PARAMS = 500
+
+
+def _batches(items: list, size: int = _MAX_PARAMS) -> Iterator[list]:
+    for start in range(0, len(items), size):
+        yield items[start : start + size]
+
+
+class EmbeddingCache(BaseStore[str, list[float]]):
+    """
+    Embeddings of texts keyed by a hash of the text.
+
+    Keys are spread over `shards` SQLite files, so processes which index
+    documents in parallel rarely wait for each other's writes. Vectors are
+    stored as float16 or float32 blobs. When a shard outgrows its part of
+    `max_bytes`, the least recently read embeddings are evicted. Read time is
+    refreshed at most once per `touch_interval` seconds, so most reads do not
+    take the write lock of their shard.
+    """
+
+    def __init__(
+        self,
+        path: str | Path,
+        namespace: str,
+        shards: int,
+        max_bytes: int,
+        dtype: str = "float16",
+        touch_interval: float = 24 * 3600,
+    ):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        # Vectors of another dtype are not readable, they get other keys
+        self.namespace = f"{namespace}:{dtype}"
+        self.shards = shards
+        self.max_shard_bytes = max_bytes // shards
+        self.dtype = np.dtype(dtype).newbyteorder("<")
+        self.touch_interval = touch_interval
+
+        self.hits = 0
+        self.misses = 0
+
+        self._connections: dict[int, sqlite3.Connection] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def _key(self, text: str) -> bytes:
+        return hashlib.blake2b(
+            f"{self.namespace}\0{text}".encode(), digest_size=16
+        ).digest()
+
+    def _shard(self, key: bytes) -> int:
+        return int.from_bytes(key[:4], "little") % self.shards
+
+    def _connection(self, shard: int) -> sqlite3.Connection:
+        conn = self._connections.get(shard)
+        if conn is None:
+            conn = sqlite3.connect(
+                self.path / f"shard-{shard:03d}.sqlite",
+                timeout=30,
+                isolation_level=None,
+                check_same_thread=False,
+            )
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("PRAGMA synchronous = NORMAL")
+            conn.executescript(_SCHEMA)
+            self._connections[shard] = conn
+        return conn
+
+    def _group(self, keys: Sequence[bytes]) -> dict[int, list[bytes]]:
+        groups: dict[int, list[bytes]] = {}
+        for key in keys:
+            groups.setdefault(self._shard(key), []).append(key)
+        return groups
+
+    def _encode(self, vector: Sequence[float]) -> bytes:
+        return np.asarray(vector, dtype=self.dtype).tobytes()
+
+    def _decode(self, value: bytes) -> list[float]:
+        return np.frombuffer(value, dtype=self.dtype).astype(np.float32).tolist()
+
+    def mget(self, keys: Sequence[str]) -> list[list[float] | None]:
+        """Reads embeddings with one query per shard and batch of keys."""
+        hashed = [self._key(text) for text in keys]
+        found: dict[bytes, bytes] = {}
+        now = time.time()
+
+        with self._lock:
+            for shard, shard_keys in self._group(hashed).items():
+                conn = self._connection(shard)
+                for batch in _batches(list(dict.fromkeys(shard_keys))):
+                    placeholders = ",".join("?" * len(batch))
+                    rows = conn.execute(
+                        "SELECT key, value, accessed FROM embeddings "
+                        f"WHERE key IN ({placeholders})",
+                        batch,
+                    ).fetchall()
+                    found.update((key, value) for key, value, _ in rows)
+
+                    stale = [
+                        key
+                        for key, _, accessed in rows
+                        if now - accessed >= self.touch_interval
+                    ]
+                    if stale:
+                        conn.execute(
+                            "UPDATE embeddings SET accessed = ? "
+                            f"WHERE key IN ({','.join('?' * len(stale))})",
+                            [now, *stale],
+                        )
+
+        values = [found.get(key) for key in hashed]
+        hits = sum(value is not None for value in values)
+        self.hits += hits
+        self.misses += len(values) - hits
+        return [None if value is None else self._decode(value) for value in values]
+
+    def mset(self, key_value_pairs: Sequence[tuple[str, list[float]]]) -> None:
+        items = {
+            self._key(text): self._encode(vector) for text, vector in key_value_pairs
+        }
+        now = time.time()
+
+        with self._lock:
+            for shard, shard_keys in self._group(list(items)).items():
+                conn = self._connection(shard)
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    added = 0
+                    for batch in _batches(shard_keys):
+                        placeholders = ",".join("?" * len(batch))
+                        # Values are overwritten, their size is replaced too
+                        (replaced,) = conn.execute(
+                            "SELECT coalesce(sum(length(value)), 0) FROM embeddings "
+                            f"WHERE key IN ({placeholders})",
+                            batch,
+                        ).fetchone()
+                        conn.executemany(
+                            "INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?)",
+                            [(key, items[key], now) for key in batch],
+                        )
+                        added += sum(len(items[key]) for key in batch) - replaced
+
+                    conn.execute("UPDATE stats SET size = size + ?", (added,))
+                    self._evict(conn)
+                    conn.execute("COMMIT")
+                except BaseException:
+                    conn.execute("ROLLBACK")
+                    raise
+
+    def _evict(self, conn: sqlite3.Connection) -> None:
+        """Deletes least recently read embeddings down to 90% of the shard size."""
+        (size,) = conn.execute("SELECT size FROM stats").fetchone()
+        if size <= self.max_shard_bytes:
+            return
+
+        target = int(self.max_shard_bytes * 0.9)
+        freed = 0
+        evicted = []
+        for key, length in conn.execute(
+            "SELECT key, length(value) FROM embeddings ORDER BY accessed"
+        ):
+            if size - freed <= target:
+                break
+            evicted.append((key,))
+            freed += length
+
+        conn.executemany("DELETE FROM embeddings WHERE key = ?", evicted)
+        conn.execute("UPDATE stats SET size = size - ?", (freed,))
+
+    def mdelete(self, keys: Sequence[str]) -> None:
+        with self._lock:
+            for shard, shard_keys in self._group([self._key(k) for k in keys]).items():
+                conn = self._connection(shard)
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    freed = 0
+                    for batch in _batches(shard_keys):
+                        placeholders = ",".join("?" * len(batch))
+                        (length,) = conn.execute(
+                            "SELECT coalesce(sum(length(value)), 0) FROM embeddings "
+                            f"WHERE key IN ({placeholders})",
+                            batch,
+                        ).fetchone()
+                        conn.execute(
+                            f"DELETE FROM embeddings WHERE key IN ({placeholders})",
+                            batch,
+                        )
+                        freed += length
+                    conn.execute("UPDATE stats SET size = size - ?", (freed,))
+                    conn.execute("COMMIT")
+                except BaseException:
+                    conn.execute("ROLLBACK")
+                    raise
+
+    def yield_keys(self, prefix: str | None = None) -> Iterator[str]:
+        """Yields hex digests of cached texts, the texts themselves are not stored."""
+        with self._lock:
+            shards = [self._connection(shard) for shard in range(self.shards)]
+        for conn in shards:
+            for (key,) in conn.execute("SELECT key FROM embeddings"):
+                if prefix is None or key.hex().startswith(prefix):
+                    yield key.hex()
+
+    @property
+    def size(self) -> int:
+        """Bytes of stored vectors in all shards."""
+        with self._lock:
+            return sum(
+                self._connection(shard).execute("SELECT size FROM stats").fetchone()[0]
+                for shard in range(self.shards)
+            )
@@ -0,0 +1,279 @@
+"""
+Embedding service.
+
+Embedding requests are coalesced into model batches and search queries go
+before bulk indexing. The service runs in the calling process, or as a sidecar
+shared by the API and indexing processes over a Unix socket
+(python -m server.embedding_server).
+"""
+
+import asyncio
+import itertools
+import json
+import socket
+import struct
+from collections import Counter
+from collections.abc import Callable, Sequence
+from concurrent.futures import ThreadPoolExecutor
+from enum import IntEnum
+from functools import cache
+
+import numpy as np
+from langchain_core.embeddings.embeddings import Embeddings as LangchainEmbeddings
+from langchain_huggingface import HuggingFaceEmbeddings
+
+from server.config import config
+from server.models import EmbeddingMetrics
+
+
+class Priority(IntEnum):
+    query = 0
+    bulk = 1
+
+
+@cache
+def get_embedding_model() -> HuggingFaceEmbeddings:
+    """Embedding model loaded in this process."""
+    return HuggingFaceEmbeddings(
+        model_name=config.embeddings_model_name,
+        model_kwargs={"trust_remote_code": True},
+        encode_kwargs={"batch_size": config.embeddings_batch_size},
+    )
+
+
+def _embed_texts(texts: list[str]) -> list[list[float]]:
+    # No query instruction is configured, so queries are embedded like documents
+    return get_embedding_model().embed_documents(texts)
+
+
+class EmbeddingService:
+    """
+    Coalesces embedding requests into batches of the model.
+
+    A batch is closed when it has `max_batch_size` texts or `max_wait` seconds
+    after its first text. Queued queries are taken before queued bulk texts.
+    The model runs on a dedicated thread, so the event loop is never blocked.
+    """
+
+    def __init__(
+        self,
+        embed_fn: Callable[[list[str]], list[list[float]]] | None = None,
+        max_batch_size: int | None = None,
+        max_wait: float | None = None,
+    ):
+        self.embed_fn = embed_fn or _embed_texts
+        self.max_batch_size = max_batch_size or config.embeddings_batch_size
+        self.max_wait = (
+            config.embedding_max_wait_ms / 1000 if max_wait is None else max_wait
+        )
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="embedding"
+        )
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._queue: asyncio.PriorityQueue | None = None
+        self._worker: asyncio.Task | None = None
+        # Ties are broken by arrival, futures are never compared
+        self._order = itertools.count()
+
+        self._pending: Counter[Priority] = Counter()
+        self._batches = 0
+        self._texts = 0
+        self._last_batch_size = 0
+
+    def _ensure_worker(self) -> asyncio.PriorityQueue:
+        loop = asyncio.get_running_loop()
+        # Every event loop (e.g. of a test) gets its own queue and worker
+        if self._loop is not loop or self._worker is None or self._worker.done():
+            self._loop = loop
+            self._queue = asyncio.PriorityQueue()
+            self._pending.clear()
+            self._worker = loop.create_task(self._run(self._queue))
+        return self._queue
+
+    async def embed(
+        self, texts: Sequence[str], priority: Priority = Priority.bulk
+    ) -> list[list[float]]:
+        queue = self._ensure_worker()
+        loop = asyncio.get_running_loop()
+
+        futures = []
+        for text in texts:
+            future = loop.create_future()
+            queue.put_nowait((priority, next(self._order), text, future))
+            futures.append(future)
+        self._pending[priority] += len(texts)
+
+        return list(await asyncio.gather(*futures))
+
+    async def metrics(self) -> EmbeddingMetrics:
+        return EmbeddingMetrics(
+            queue_depth={p.name: self._pending[p] for p in Priority},
+            batches=self._batches,
+            texts=self._texts,
+            last_batch_size=self._last_batch_size,
+            mean_batch_size=self._texts / self._batches if self._batches else 0.0,
+        )
+
+    def _take(self, item: tuple) -> tuple[str, asyncio.Future]:
+        priority, _, text, future = item
+        self._pending[priority] -= 1
+        return text, future
+
+    async def _collect(self, queue: asyncio.PriorityQueue) -> list:
+        loop = asyncio.get_running_loop()
+        batch = [self._take(await queue.get())]
+        deadline = loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            if queue.empty():
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(queue.get(), timeout)
+                except TimeoutError:
+                    break
+            else:
+                item = queue.get_nowait()
+            batch.append(self._take(item))
+        return batch
+
+    async def _run(self, queue: asyncio.PriorityQueue) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect(queue)
+            # Callers which gave up do not need an embedding
+            batch = [(text, future) for text, future in batch if not future.done()]
+            if not batch:
+                continue
+
+            try:
+                vectors = await loop.run_in_executor(
+                    self._executor, self.embed_fn, [text for text, _ in batch]
+                )
+            except Exception as err:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(err)
+                continue
+
+            self._batches += 1
+            self._texts += len(batch)
+            self._last_batch_size = len(batch)
+            for (_, future), vector in zip(batch, vectors, strict=True):
+                if not future.done():
+                    future.set_result(vector)
+
+
+# Sidecar protocol: length-prefixed frames. A request is a JSON frame, the
+# response is a JSON frame followed by a frame of float32 vectors for "embed".
+_LENGTH = struct.Struct("!I")
+
+
+def pack_frame(payload: bytes) -> bytes:
+    return _LENGTH.pack(len(payload)) + payload
+
+
+async def read_frame(reader: asyncio.StreamReader) -> bytes:
+    (length,) = _LENGTH.unpack(await reader.readexactly(_LENGTH.size))
+    return await reader.readexactly(length)
+
+
+def encode_vectors(vectors: list[list[float]]) -> tuple[dict, bytes]:
+    matrix = np.asarray(vectors, dtype="<f4").reshape(len(vectors), -1)
+    return {"shape": matrix.shape}, matrix.tobytes()
+
+
+def decode_vectors(header: dict, payload: bytes) -> list[list[float]]:
+    if "error" in header:
+        raise RuntimeError(f"Embedding server error: {header['error']}")
+    return np.frombuffer(payload, dtype="<f4").reshape(header["shape"]).tolist()
+
+
+class EmbeddingClient:
+    """Client of the embedding sidecar with the interface of EmbeddingService."""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    async def _request(self, request: dict, with_vectors: bool) -> tuple[dict, bytes]:
+        reader, writer = await asyncio.open_unix_connection(self.path)
+        try:
+            writer.write(pack_frame(json.dumps(request).encode()))
+            await writer.drain()
+            header = json.loads(await read_frame(reader))
+            if with_vectors and "error" not in header:
+                return header, await read_frame(reader)
+            return header, b""
+        finally:
+            writer.close()
+
+    async def embed(
+        self, texts: Sequence[str], priority: Priority = Priority.bulk
+    ) -> list[list[float]]:
+        header, payload = await self._request(
+            {"op": "embed", "texts": list(texts), "priority": priority.name},
+            with_vectors=True,
+        )
+        return decode_vectors(header, payload)
+
+    async def metrics(self) -> EmbeddingMetrics:
+        header, _ = await self._request({"op": "metrics"}, with_vectors=False)
+        return EmbeddingMetrics(**header)
+
+
+def _recv_exactly(sock: socket.socket, size: int) -> bytes:
+    data = bytearray()
+    while len(data) < size:
+        part = sock.recv(size - len(data))
+        if not part:
+            raise ConnectionError("Embedding server closed the connection")
+        data.extend(part)
+    return bytes(data)
+
+
+def _recv_frame(sock: socket.socket) -> bytes:
+    (length,) = _LENGTH.unpack(_recv_exactly(sock, _LENGTH.size))
+    return _recv_exactly(sock, length)
+
+
+class RemoteEmbeddings(LangchainEmbeddings):
+    """
+    Langchain embeddings served by the sidecar.
+
+    Synchronous, for indexing processes which have no event loop. Documents
+    are sent with bulk priority.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def _embed(self, texts: list[str], priority: Priority) -> list[list[float]]:
+        if not texts:
+            return []
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(self.path)
+            request = {"op": "embed", "texts": texts, "priority": priority.name}
+            sock.sendall(pack_frame(json.dumps(request).encode()))
+            header = json.loads(_recv_frame(sock))
+            payload = _recv_frame(sock) if "error" not in header else b""
+        return decode_vectors(header, payload)
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return self._embed(texts, Priority.bulk)
+
+    def embed_query(self, text: str) -> list[float]:
+        return self._embed([text], Priority.query)[0]
+
+
+@cache
+def get_embedding_service() -> EmbeddingService | EmbeddingClient:
+    """Sidecar client if the sidecar is configured, in-process service otherwise."""
+    if config.embedding_server_socket:
+        return EmbeddingClient(config.embedding_server_socket)
+    return EmbeddingService()
+
+
+async def embed_query(text: str) -> list[float]:
+    """Embeds the search query without blocking the event loop."""
+    (vector,) = await get_embedding_service().embed([text], Priority.query)
+    return vector
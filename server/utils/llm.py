@@ -1,17 +1,18 @@
 from functools import cache
 
 from langchain.embeddings import CacheBackedEmbeddings
-from langchain.storage import LocalFileStore
 from langchain_community.cache import SQLiteCache
 from langchain_core.embeddings.embeddings import Embeddings as LangchainEmbeddings
 from langchain_core.language_models.llms import LLM
 from langchain_core.rate_limiters import InMemoryRateLimiter
-from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_openai import ChatOpenAI
 from loguru import logger
 
 from server.config import config, secrets
 
+from .embedding_cache import EmbeddingCache
+from .embeddings import RemoteEmbeddings, get_embedding_model
+
 
 @cache
 def get_langchain_llm(model_name: str | None = None) -> LLM:
@@ -35,15 +36,22 @@ def get_langchain_llm(model_name: str | None = None) -> LLM:
 
 @cache
 def get_langchain_embeddings() -> LangchainEmbeddings:
-    # Configure the embeddings model and cache
-    underlying_embeddings = HuggingFaceEmbeddings(
-        model_name=config.embeddings_model_name,
-        model_kwargs={"trust_remote_code": True},
-        encode_kwargs={"batch_size": 10},
-    )
+    # Configure the embeddings model and cache, the model is shared through
+    # the embedding sidecar if it is configured
+    if config.embedding_server_socket:
+        underlying_embeddings = RemoteEmbeddings(config.embedding_server_socket)
+    else:
+        underlying_embeddings = get_embedding_model()
 
-    store = LocalFileStore(config.embeddings_cache_path)
+    return CacheBackedEmbeddings(underlying_embeddings, get_embedding_cache())
 
-    return CacheBackedEmbeddings.from_bytes_store(
-        underlying_embeddings, store, namespace=config.embeddings_model_name
+
+@cache
+def get_embedding_cache() -> EmbeddingCache:
+    return EmbeddingCache(
+        config.embeddings_cache_path,
+        namespace=config.embeddings_model_name,
+        shards=config.embeddings_cache_shards,
+        max_bytes=config.embeddings_cache_size_mb * 1024 * 1024,
+        dtype=config.embeddings_cache_dtype,
     )
@@ -0,0 +1,115 @@
+"""Server-sent events of streamed completions."""
+
+import asyncio
+import json
+from collections.abc import AsyncGenerator, AsyncIterator
+from contextlib import aclosing
+
+# ChatCompletionStreamResponse of one content delta, as dumped with
+# exclude_unset and exclude_none, split around the content
+_CHUNK_PREFIX = (
+    'event: chunk\ndata: {"model":"null","choices":[{"index":0,"delta":{"content":'
+)
+_CHUNK_SUFFIX = "}}]}\n\n"
+
+
+def chunk_frame(content: str) -> str:
+    """SSE frame of a content delta without building the response model."""
+    return _CHUNK_PREFIX + json.dumps(content, ensure_ascii=False) + _CHUNK_SUFFIX
+
+
+_END = object()
+
+
+class _TokenReader:
+    """Reads tokens ahead into a bounded queue."""
+
+    def __init__(self, tokens: AsyncGenerator[str, None], max_pending: int):
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_pending)
+        self.done = False
+        self.error: Exception | None = None
+        self._producer = asyncio.create_task(self._produce(tokens))
+
+    async def _produce(self, tokens: AsyncGenerator[str, None]) -> None:
+        try:
+            async with aclosing(tokens):
+                async for token in tokens:
+                    await self.queue.put(token)
+        except Exception as err:
+            await self.queue.put(err)
+        else:
+            await self.queue.put(_END)
+
+    def _take(self, item) -> str | None:
+        if item is _END or isinstance(item, Exception):
+            self.done = True
+            self.error = item if item is not _END else None
+            return None
+        return item
+
+    async def collect(self, max_wait: float, max_size: int) -> str | None:
+        """Waits for a token and joins the tokens following it, None at the end."""
+        if self.done:
+            return None
+        token = self._take(await self.queue.get())
+        if token is None:
+            return None
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + max_wait
+        parts = [token]
+        size = len(token)
+        while size < max_size:
+            if self.queue.empty():
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self.queue.get(), timeout)
+                except TimeoutError:
+                    break
+            else:
+                item = self.queue.get_nowait()
+            token = self._take(item)
+            if token is None:
+                break
+            parts.append(token)
+            size += len(token)
+        return "".join(parts)
+
+    def close(self) -> None:
+        self._producer.cancel()
+
+
+async def coalesce(
+    tokens: AsyncGenerator[str, None],
+    max_wait: float,
+    max_size: int,
+    max_pending: int = 256,
+) -> AsyncIterator[str]:
+    """
+    Joins tokens, so an event is sent per group of tokens instead of per token.
+
+    The first token is passed on at once. Later tokens are joined until
+    `max_size` characters or `max_wait` seconds after the first of them.
+    Tokens are read ahead into a queue of `max_pending`, so a slow client
+    pauses reading of the model instead of buffering its output.
+    """
+    reader = _TokenReader(tokens, max_pending)
+    try:
+        # Nothing is waited for before the first token
+        text = await reader.collect(0, 0)
+        while text is not None:
+            yield text
+            text = await reader.collect(max_wait, max_size)
+        if reader.error is not None:
+            raise reader.error
+    finally:
+        reader.close()
+
+
+async def replay(text: str, size: int) -> AsyncIterator[str]:
+    """Text in pieces of `size` characters, as if it was coalesced tokens."""
+    size = max(size, 1)
+    for start in range(0, len(text), size):
+        yield text[start : start + size]
@@ -0,0 +1,127 @@
+"""
+Stream sessions: completion requests parked by /prepare_stream until the
+client opens the stream.
+
+Sessions are kept in the process, or in Redis when `stream_session_store` is
+set, so any worker can serve the stream of a session prepared by another one.
+"""
+
+import asyncio
+import time
+from abc import ABC, abstractmethod
+from functools import cache
+
+from redis import exceptions as redis_errors
+from redis.asyncio import BlockingConnectionPool, Redis
+from redis.asyncio.retry import Retry
+from redis.backoff import ExponentialBackoff
+
+from server.config import config
+
+
+class StreamSessionStore(ABC):
+    """One-time values which expire after `ttl` seconds."""
+
+    @abstractmethod
+    async def put(self, key: str, value: bytes, ttl: float) -> None: ...
+
+    @abstractmethod
+    async def pop(self, key: str) -> bytes | None:
+        """Returns the value and removes it, so a session is streamed once."""
+
+
+class MemoryStreamSessionStore(StreamSessionStore):
+    """Store of a single process, expired values are swept in the background."""
+
+    def __init__(self, reap_interval: float = 60):
+        self.reap_interval = reap_interval
+        self._values: dict[str, tuple[float, bytes]] = {}
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._reaper: asyncio.Task | None = None
+
+    def _ensure_reaper(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._reaper is None or self._reaper.done():
+            self._loop = loop
+            self._reaper = loop.create_task(self._reap())
+
+    async def _reap(self) -> None:
+        while True:
+            await asyncio.sleep(self.reap_interval)
+            self.reap()
+
+    def reap(self) -> None:
+        now = time.monotonic()
+        expired = [key for key, (expires, _) in self._values.items() if expires <= now]
+        for key in expired:
+            del self._values[key]
+
+    async def put(self, key: str, value: bytes, ttl: float) -> None:
+        self._ensure_reaper()
+        self._values[key] = (time.monotonic() + ttl, value)
+
+    async def pop(self, key: str) -> bytes | None:
+        item = self._values.pop(key, None)
+        if item is None or item[0] <= time.monotonic():
+            return None
+        return item[1]
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+
+class RedisStreamSessionStore(StreamSessionStore):
+    """
+    Store in Redis, e.g. redis://:password@localhost:6379/0.
+
+    Commands go over a pool of up to `max_connections` connections per event
+    loop and wait for a free one when all are busy. Broken connections are
+    replaced and the command is retried. Values are removed with GETDEL
+    (Redis 6.2+), so two workers never stream the same session.
+    """
+
+    prefix = "stream_session:"
+
+    def __init__(self, url: str, max_connections: int = 64, timeout: float = 5.0):
+        self.url = url
+        self.max_connections = max_connections
+        self.timeout = timeout
+
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._client: Redis | None = None
+
+    @property
+    def client(self) -> Redis:
+        # Connections of a pool belong to the loop which opened them
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._client is None:
+            self._loop = loop
+            pool = BlockingConnectionPool.from_url(
+                self.url,
+                max_connections=self.max_connections,
+                # Waiting for a free connection
+                timeout=self.timeout,
+                socket_timeout=self.timeout,
+                socket_connect_timeout=self.timeout,
+                retry=Retry(ExponentialBackoff(cap=1.0, base=0.05), retries=2),
+                retry_on_error=[
+                    redis_errors.ConnectionError,
+                    redis_errors.TimeoutError,
+                ],
+            )
+            self._client = Redis(connection_pool=pool)
+        return self._client
+
+    async def put(self, key: str, value: bytes, ttl: float) -> None:
+        await self.client.set(self.prefix + key, value, px=max(1, int(ttl * 1000)))
+
+    async def pop(self, key: str) -> bytes | None:
+        return await self.client.getdel(self.prefix + key)
+
+
+@cache
+def get_stream_session_store() -> StreamSessionStore:
+    """Redis store if it is configured, store of this process otherwise."""
+    if config.stream_session_store:
+        return RedisStreamSessionStore(config.stream_session_store)
+    return MemoryStreamSessionStore()
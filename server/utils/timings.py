@@ -0,0 +1,59 @@
+"""Durations of the stages of a request and their recent percentiles."""
+
+import time
+from collections import deque
+from collections.abc import Awaitable
+from typing import TypeVar
+
+import numpy as np
+
+from server.models import CompletionMetrics, StageMetrics
+
+T = TypeVar("T")
+
+
+class StageTimer:
+    """Durations of the stages of one request, in seconds."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.stages: dict[str, float] = {}
+
+    async def measure(self, stage: str, awaitable: Awaitable[T]) -> T:
+        """Awaits a stage, stages which fail or are cancelled are not recorded."""
+        start = time.perf_counter()
+        result = await awaitable
+        self.stages[stage] = time.perf_counter() - start
+        return result
+
+    def mark(self, stage: str) -> None:
+        """Records the time from the start of the request."""
+        self.stages.setdefault(stage, time.perf_counter() - self.start)
+
+
+class StageStats:
+    """Stage durations of the last `window` requests."""
+
+    def __init__(self, window: int = 1000):
+        self.window = window
+        self._samples: dict[str, deque[float]] = {}
+
+    def record(self, timer: StageTimer) -> None:
+        for stage, seconds in timer.stages.items():
+            samples = self._samples.setdefault(stage, deque(maxlen=self.window))
+            samples.append(seconds)
+
+    def metrics(self) -> CompletionMetrics:
+        stages = {}
+        for stage, samples in self._samples.items():
+            ms = np.fromiter(samples, dtype=float, count=len(samples)) * 1000
+            stages[stage] = StageMetrics(
+                count=len(ms),
+                p50_ms=float(np.percentile(ms, 50)),
+                p95_ms=float(np.percentile(ms, 95)),
+                max_ms=float(ms.max()),
+            )
+        return CompletionMetrics(stages=stages)
+
+
+completion_stats = StageStats()
@@ -0,0 +1,20 @@
+# Standalone indexing worker for deployments where the API process should not
+# index documents itself (run_indexing_worker: false)
+import asyncio
+
+from server.config import secrets
+from server.database import session_manager
+from server.rag import run_indexing_workers, shutdown_indexing_executor
+
+
+async def main():
+    await session_manager.init_db(str(secrets.sqlalchemy_url))
+    try:
+        await run_indexing_workers()
+    finally:
+        shutdown_indexing_executor()
+        await session_manager.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())